@@ -0,0 +1,46 @@
+"""One call per symbol against a local stub answering after a fixed latency: a serial loop, fan_out on threads and
+afan_out on the event loop.
+
+    python benchmarks/bench_fanout.py [symbols] [latency ms]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from loguru import logger
+
+from exchanges.apis.tests.stub_server import start_stub_server
+from exchanges.apis.tests.test_aio import stub_client
+
+
+async def run_async(client, calls):
+    try:
+        return await client.afan_out(calls)
+    finally:
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    logger.remove()
+    server, base_url = start_stub_server(delay=latency / 1000)
+    client = stub_client("binance", base_url)
+    calls = {
+        f"SYM{i}USDT": dict(api_version=3, endpoint="trades", params={"symbol": f"SYM{i}USDT"}) for i in range(count)
+    }
+
+    start = time.perf_counter()
+    for kwargs in calls.values():
+        client.brequest(**kwargs)
+    serial = time.perf_counter() - start
+    threaded = client.fan_out(calls)
+    asynchronous = asyncio.run(run_async(client, calls))
+    server.shutdown()
+
+    print(f"serial loop:  {serial:6.2f}s")
+    print(f"fan_out:      {threaded.wall_time:6.2f}s ({serial / threaded.wall_time:.1f}x) {threaded}")
+    print(f"afan_out:     {asynchronous.wall_time:6.2f}s ({serial / asynchronous.wall_time:.1f}x) {asynchronous}")
@@ -0,0 +1,86 @@
+"""Decoding time of each JSON backend on large exchange payloads: recorded response bodies passed as arguments, or
+synthetic ones shaped like Binance exchangeInfo, a deep Binance order book and a page of Bitfinex trades.
+
+    python benchmarks/bench_json.py [payload.json ...]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from exchanges.apis.decoders import DECODERS, json_decoder
+
+
+def synthetic_payloads():
+    rng = random.Random(1)
+    symbol_filters = [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.01000000", "maxPrice": "1000000.00000000", "tickSize": "0.01"},
+        {"filterType": "LOT_SIZE", "minQty": "0.00001000", "maxQty": "9000.00000000", "stepSize": "0.00001000"},
+    ]
+    exchange_info = {
+        "timezone": "UTC",
+        "serverTime": 1600000000000,
+        "symbols": [
+            {
+                "symbol": f"C{i}USDT",
+                "status": "TRADING",
+                "baseAsset": f"C{i}",
+                "quoteAsset": "USDT",
+                "orderTypes": ["LIMIT", "LIMIT_MAKER", "MARKET", "STOP_LOSS_LIMIT", "TAKE_PROFIT_LIMIT"],
+                "filters": symbol_filters,
+            }
+            for i in range(2000)
+        ],
+    }
+    depth = {
+        "lastUpdateId": 1027024,
+        "bids": [[f"{30000 - i / 100:.8f}", f"{rng.random():.8f}"] for i in range(5000)],
+        "asks": [[f"{30000 + i / 100:.8f}", f"{rng.random():.8f}"] for i in range(5000)],
+    }
+    trades = [
+        [
+            i,
+            "tBTCUSD",
+            1600000000000 + i,
+            i * 2,
+            rng.uniform(-1, 1),
+            rng.uniform(29000, 31000),
+            "EXCHANGE LIMIT",
+            30000,
+            1,
+            -rng.random() / 100,
+            "USD",
+            None,
+        ]
+        for i in range(2500)
+    ]
+    return {
+        name: json.dumps(payload).encode()
+        for name, payload in [("exchangeInfo", exchange_info), ("depth 5000", depth), ("trades 2500", trades)]
+    }
+
+
+def timed(loads, content, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        loads(content)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        payloads = {os.path.basename(path): open(path, "rb").read() for path in sys.argv[1:]}
+    else:
+        payloads = synthetic_payloads()
+
+    decoders = [(name, json_decoder(name)) for name in DECODERS] + [("json decimals", json_decoder("json", True))]
+    for payload, content in payloads.items():
+        print(f"{payload} ({len(content) / 1024:.0f} KiB)")
+        baseline = None
+        for name, loads in decoders:
+            seconds = timed(loads, content, 20)
+            baseline = baseline or seconds
+            print(f"  {name:>14}: {seconds * 1000:8.2f} ms, {baseline / seconds:.1f}x")
@@ -0,0 +1,59 @@
+"""Cost per request of the debug logging in request(): a call doing nothing, the previous eager formatting, and
+RequestLog, with DEBUG off and on, sampling one request in 100, and turned off. Lines are sent to a sink that drops
+them.
+
+    python benchmarks/bench_logging.py [calls]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from loguru import logger
+
+from exchanges.apis.logs import RequestLog
+
+URL = "https://api.binance.com/api/v3/order"
+PARAMS = {"symbol": "BTCUSDT", "side": "BUY", "type": "LIMIT", "quantity": "0.5", "price": "30000.00"}
+HEADERS = {"Content-Type": "application/json", "Accept": "application/json", "X-MBX-APIKEY": "key"}
+
+
+def nothing(method, url, params, data, headers):
+    pass
+
+
+def eager(method, url, params, data, headers):
+    logger.debug("Requesting %s %s with %s" % (method, url, params or data))
+    if headers:
+        logger.debug("Request Headers: %s" % headers)
+
+
+def off(method, url, params, data, headers, request_log=RequestLog(enabled=False)):
+    # As checked by BaseExchangeApi before calling it
+    if request_log.enabled:
+        request_log.request(method, url, params, data, headers)
+
+
+def timed(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn("POST", URL, PARAMS, None, HEADERS)
+    return (time.perf_counter() - start) / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logger.remove()
+    for level in ["INFO", "DEBUG"]:
+        handler = logger.add(lambda message: None, level=level)
+        print(f"Handler at {level}")
+        for name, fn in [
+            ("no logging", nothing),
+            ("eager", eager),
+            ("RequestLog", RequestLog().request),
+            ("RequestLog 1/100", RequestLog(sample_every=100).request),
+            ("RequestLog off", off),
+        ]:
+            print(f"  {name:>18}: {timed(fn, count) * 1e9:8.0f} ns/request")
+        logger.remove(handler)
@@ -0,0 +1,45 @@
+"""Requests/sec against a local stub without metrics, and with each sink, to check what instrumentation costs.
+
+    python benchmarks/bench_metrics.py [requests]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from loguru import logger
+
+from exchanges.apis.base import BaseExchangeApi
+from exchanges.apis.metrics import InMemoryMetrics, PrometheusMetrics, StatsdMetrics
+from exchanges.apis.tests.stub_server import start_stub_server
+
+
+def run(client, url, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.request(url)
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logger.remove()
+    server, base_url = start_stub_server()
+    url = base_url + "/ping"
+
+    client = BaseExchangeApi()
+    run(client, url, 100)  # warm up the connection
+    baseline = None
+    for name, metrics in [
+        ("none", None),
+        ("InMemoryMetrics", InMemoryMetrics()),
+        ("PrometheusMetrics", PrometheusMetrics()),
+        ("StatsdMetrics", StatsdMetrics()),
+        ("none", None),
+    ]:
+        client.metrics = metrics
+        rate = run(client, url, count)
+        baseline = baseline or rate
+        print(f"{name:>18}: {rate:8.0f} req/s ({rate / baseline:.2f}x)")
+    server.shutdown()
@@ -0,0 +1,44 @@
+"""Nonces per second from one thread, and duplicates from several: the arrow based nonce, NonceGenerator and
+FileNonceGenerator.
+
+    python benchmarks/bench_nonce.py [nonces] [threads]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import arrow
+
+from exchanges.apis.nonce import FileNonceGenerator, NonceGenerator
+
+
+def arrow_nonce():
+    return str(int(round(arrow.utcnow().float_timestamp * 10000000)))
+
+
+def measure(name, fn, count, threads):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    elapsed = time.perf_counter() - start
+    # Then from several threads at once, where only a monotonic generator stays unique
+    with ThreadPoolExecutor(threads) as executor:
+        nonces = list(executor.map(lambda _: fn(), range(count)))
+    print(
+        f"{name:>20}: {count / elapsed:>12,.0f} nonces/s, {count - len(set(nonces))} duplicates from {threads} threads"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    measure("arrow", arrow_nonce, count, threads)
+    measure("NonceGenerator", NonceGenerator().next, count, threads)
+    with tempfile.TemporaryDirectory() as tmp:
+        generator = FileNonceGenerator(os.path.join(tmp, "bench.nonce"))
+        measure("FileNonceGenerator", generator.next, count, threads)
+        generator.close()
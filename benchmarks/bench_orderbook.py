@@ -0,0 +1,50 @@
+"""Updates per second applied to a local order book, from a synthetic Binance diff feed around a moving mid price.
+
+    python benchmarks/bench_orderbook.py [updates] [levels per update] [levels per side of the snapshot]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from exchanges.apis.orderbook import BinanceOrderBook
+
+
+def snapshot(mid, levels=1000):
+    return {
+        "lastUpdateId": 0,
+        "bids": [[f"{mid - i / 100:.2f}", "1.00000000"] for i in range(1, levels + 1)],
+        "asks": [[f"{mid + i / 100:.2f}", "1.00000000"] for i in range(1, levels + 1)],
+    }
+
+
+def feed(mid, count, levels):
+    rng = random.Random(1)
+    for update_id in range(1, count + 1):
+        mid += rng.choice([-0.01, 0, 0.01])
+
+        def changes(sign):
+            # Mostly near the top of the book, a fifth of them removing the level
+            return [
+                [f"{mid + sign * rng.randint(1, 200) / 100:.2f}", "0" if rng.random() < 0.2 else f"{rng.random():.8f}"]
+                for _ in range(levels)
+            ]
+
+        yield {"U": update_id, "u": update_id, "b": changes(-1), "a": changes(1)}
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    levels = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    depth = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    book = BinanceOrderBook.from_snapshot("BTCUSDT", snapshot(30000, depth))
+    updates = list(feed(30000, count, levels))
+
+    start = time.perf_counter()
+    for update in updates:
+        book.apply_update(update)
+    elapsed = time.perf_counter() - start
+    print(f"{count} updates of {2 * levels} levels in {elapsed:.2f}s: {count / elapsed:,.0f} updates/s")
+    print(f"{len(book.bids)} bids, {len(book.asks)} asks")
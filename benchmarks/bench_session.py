@@ -0,0 +1,50 @@
+"""Requests/sec against a local stub, comparing a session rebuilt on every request (the old behavior)
+with the session built once per client.
+
+    python benchmarks/bench_session.py [requests]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from loguru import logger
+
+from exchanges.apis.base import BaseExchangeApi
+from exchanges.apis.tests.stub_server import start_stub_server
+
+
+class RebuiltSessionApi(BaseExchangeApi):
+    """Mimics the previous implementation: new Retry, HTTPAdapter and hook on every session access"""
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self.build_session()
+        adapter = self.build_adapter()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.hooks["response"] = [self.log_retry_response]
+        return self._session
+
+
+def run(client, url, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.request(url)
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logger.remove()
+    server, base_url = start_stub_server()
+    url = base_url + "/ping"
+
+    before = run(RebuiltSessionApi(), url, count)
+    after = run(BaseExchangeApi(), url, count)
+    server.shutdown()
+
+    print(f"session rebuilt per request: {before:8.0f} req/s")
+    print(f"session built once:          {after:8.0f} req/s ({after / before:.2f}x)")
@@ -0,0 +1,64 @@
+"""Symbol conversion throughput: the previous per-call implementation (uncompiled re.match on every call),
+the memoized per-call methods, and the batch make_symbols / unmake_symbols.
+
+    python benchmarks/bench_symbols.py [symbols]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from exchanges import exchange_factory
+
+
+def legacy_bitfinex_make_symbol(symbol):
+    assert re.match("[A-Z0-9]{3,}/[A-Z0-9]{3,}", symbol)
+    pieces = symbol.split("/")
+    if len(pieces[0]) > 3 or len(pieces[1]) > 3:
+        return "t{}:{}".format(pieces[0], pieces[1])
+    return "t{}{}".format(pieces[0], pieces[1])
+
+
+def legacy_bitfinex_unmake_symbol(bitfinex_symbol):
+    assert re.match("t[A-Z0-9]{3,}[:]?[A-Z0-9]{3,}", bitfinex_symbol)
+    if ":" in bitfinex_symbol:
+        pieces = bitfinex_symbol.lstrip("t").split(":")
+        return "{}/{}".format(pieces[0], pieces[1])
+    return "{}/{}".format(bitfinex_symbol[1:-3], bitfinex_symbol[-3:])
+
+
+def legacy_sfox_make_symbol(symbol):
+    assert re.match("[A-Z0-9]{3,}/[A-Z0-9]{3,}", symbol)
+    pieces = symbol.split("/")
+    return f"{pieces[0]}{pieces[1]}".lower()
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:40s} {count / elapsed:12,.0f} symbols/s")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    # A portfolio's worth of distinct pairs, converted over and over
+    bases = ["BTC", "ETH", "XAUT", "SOL", "DOT", "TESTBTC", "ADA", "LINK"]
+    pairs = [f"{base}/{quote}" for base in bases for quote in ["USD", "EUR", "USDT", "BTC"]]
+    pairs = (pairs * (count // len(pairs) + 1))[:count]
+
+    bitfinex = exchange_factory("bitfinex")()
+    symbols = bitfinex.make_symbols(pairs)
+    timed("bitfinex make_symbol (previous)", lambda: [legacy_bitfinex_make_symbol(p) for p in pairs], count)
+    timed("bitfinex make_symbol", lambda: [bitfinex.make_symbol(p) for p in pairs], count)
+    timed("bitfinex make_symbols", lambda: bitfinex.make_symbols(pairs), count)
+    timed("bitfinex unmake_symbol (previous)", lambda: [legacy_bitfinex_unmake_symbol(s) for s in symbols], count)
+    timed("bitfinex unmake_symbol", lambda: [bitfinex.unmake_symbol(s) for s in symbols], count)
+    timed("bitfinex unmake_symbols", lambda: bitfinex.unmake_symbols(symbols), count)
+
+    sfox = exchange_factory("sfox")()
+    timed("sfox make_symbol (previous)", lambda: [legacy_sfox_make_symbol(p) for p in pairs], count)
+    timed("sfox make_symbol", lambda: [sfox.make_symbol(p) for p in pairs], count)
+    timed("sfox make_symbols", lambda: sfox.make_symbols(pairs), count)
@@ -0,0 +1,52 @@
+"""Tardis replay throughput, merging several symbols from synthetic cached slices (nothing is downloaded).
+
+    python benchmarks/bench_tardis_replay.py [symbols] [days] [records per symbol and day]
+"""
+from datetime import date, datetime, timedelta
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from exchanges import exchange_factory
+
+
+def write_slice(path, symbol, day, count):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    start = datetime.combine(day, datetime.min.time())
+    offsets = sorted(random.uniform(0, 86400) for _ in range(count))
+    with gzip.open(path, "wt") as f:
+        for offset in offsets:
+            timestamp = (start + timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%S.%f") + "0Z"
+            trade = {"market": symbol, "price": round(random.uniform(9000, 10000), 1), "size": 0.01}
+            f.write(f"{timestamp} {json.dumps({'channel': 'trades', 'data': [trade]})}\n")
+
+
+if __name__ == "__main__":
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    per_slice = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["EXCHANGES_CACHE_DIR"] = cache_dir
+        client = exchange_factory("tardis")("key")
+        names = [f"SYM{i}-PERP" for i in range(symbols)]
+        start = date(2020, 6, 1)
+        for name in names:
+            for day in client.replay_days(start, start + timedelta(days=days)):
+                write_slice(client.replay_slice_path("ftx", "trades", name, day), name, day, per_slice)
+
+        began = time.perf_counter()
+        count = 0
+        previous = ""
+        for timestamp, _, _ in client.replay("ftx", "trades", names, start, start + timedelta(days=days)):
+            assert timestamp >= previous
+            previous = timestamp
+            count += 1
+        elapsed = time.perf_counter() - began
+        print(f"{count:,} records from {symbols} symbols x {days} days in {elapsed:.2f}s: {count / elapsed:,.0f} rec/s")
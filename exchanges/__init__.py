@@ -4,6 +4,7 @@ from .apis.kucoin import KuCoinApi
 from .apis.sfox import SFOXApi
 from .apis.shrimpy import ShrimpyApi
 from .apis.tardis import TardisApi
+from .multi import MultiExchangeClient  # noqa: F401
 
 
 def exchange_factory(exchange):
@@ -0,0 +1,239 @@
+from datetime import timedelta
+import asyncio
+import time
+
+from urllib3.util.retry import Retry
+import requests
+
+from .base import BaseExchangeApi, ExchangeApiException
+from .fanout import afan_out
+from .middleware import RequestCall
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:  # pragma: no cover
+    aiohttp = yarl = None
+
+
+class AsyncResponse:
+    """The parts of requests.Response that the parsing/error handling code uses, filled from an aiohttp response"""
+
+    def __init__(self, request, status_code, reason, headers, content, elapsed):
+        self.request = request
+        self.url = request.url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+        # Retries done by asend() before this response
+        self.retries = 0
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+class AsyncBaseExchangeApi(BaseExchangeApi):
+    """Adds asyncio counterparts (`arequest`, and `abrequest` on each exchange) backed by a pooled aiohttp session.
+
+    Requests are built and signed with the same code as the blocking path (including `auth_provider`), and
+    retried with the same rules as the urllib3 Retry used by `session`:
+        - connection errors are retried for any method
+        - read errors and HTTP_STATUSES_TO_RETRY only for idempotent methods, honoring Retry-After on 503
+        - RETRIES times each, sleeping RETRY_BACKOFF_FACTOR * 2 ** (n - 1) between attempts (none before the first)
+    Once retries are exhausted the last response goes through the regular error handling and raises
+    ExchangeApiException.
+    """
+
+    _async_session = _async_loop = None
+
+    # Longest sleep between retries, same as urllib3
+    RETRY_BACKOFF_MAX = 120
+
+    @property
+    def async_session(self):
+        # aiohttp sessions are bound to the event loop they were created in
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._async_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.POOL_CONNECTIONS * self.POOL_MAXSIZE, limit_per_host=self.POOL_MAXSIZE
+            )
+            connect, read = self.TIMEOUT
+            self._async_session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+            )
+            self._async_loop = loop
+        return self._async_session
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = self._async_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def afan_out(self, calls, concurrency=None):
+        """fan_out() on the event loop: abrequest() for each {key: kwargs} of calls, at most `concurrency` (default
+        POOL_MAXSIZE) at a time"""
+        return await afan_out(self.abrequest, calls, concurrency or self.POOL_MAXSIZE)
+
+    async def arequest(
+        self, url, method="GET", params=None, data=None, headers=None, ignore_json=False, sign=None, auth=None, raw=None
+    ):
+        # Bodies are read whole here, so raw="bytes" only
+        assert raw in [None, "bytes"]
+        # Before sending, as the error handling refers to aiohttp's exceptions
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for async requests: pip install exchanges[async]")
+        data, json_data = self.prepare_body(url, method, params, data, headers, ignore_json)
+        send_request = self.asend_request
+        if self.response_cache is not None and auth is None and self.cacheable(method, headers, sign, False):
+            send_request = self.asend_cached_request
+        if not self.middlewares:
+            return await send_request(None, url, method, params, data, json_data, headers, sign, auth, raw)
+
+        call = RequestCall(self, method, url, params, data or json_data, headers)
+        try:
+            return call.after_parse(
+                await send_request(call, url, method, params, data, json_data, headers, sign, auth, raw)
+            )
+        except ExchangeApiException as exc:
+            raise call.on_error(exc)
+
+    async def asend_request(self, call, url, method, params, data, json_data, headers, sign, auth, raw):
+        """send_request() counterpart of arequest()"""
+        metrics = self.metrics
+        tags = self.metric_tags(method, url) if metrics is not None else None
+        attempt = 0
+        while True:
+            waited = 0
+            if self.backoff is not None:
+                delay = self.backoff.delay(method, url)
+                if delay:
+                    await asyncio.sleep(delay)
+                    waited += delay
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve(method, url, params)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    waited += wait
+            if waited and metrics is not None:
+                metrics.observe("rate_limit_wait_seconds", waited, tags)
+            request_headers, request_params = headers, params
+            if call is not None:
+                call.attempt = attempt
+                request_headers, request_params = call.before_sign(headers, params)
+            if sign is not None:
+                request_headers, request_params = sign(
+                    dict(request_headers or {}), dict(request_params) if request_params else request_params
+                )
+
+            prepared = requests.Request(
+                method,
+                url,
+                params=request_params,
+                headers=request_headers,
+                data=data,
+                json=json_data,
+                auth=auth or self.auth_provider,
+            ).prepare()
+
+            start = time.perf_counter()
+            try:
+                response = await self.asend(prepared)
+            except asyncio.TimeoutError:  # pragma: no cover
+                self.record_error(tags, time.perf_counter() - start)
+                raise ExchangeApiException(method, url, None, "Connection Timeout")
+            except aiohttp.ClientConnectionError:
+                self.record_error(tags, time.perf_counter() - start)
+                raise ExchangeApiException(method, url, None, "Connection Error")
+            if metrics is not None:
+                self.record_response(tags, response, time.perf_counter() - start)
+            if call is not None:
+                call.after_send(response)
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(response)
+            if self.backoff is not None and self.backoff.should_retry(response, self.retry_after(response), attempt):
+                attempt += 1
+                if metrics is not None:
+                    metrics.increment("retries_total", 1, {**tags, "reason": "rate_limit"})
+                continue
+
+            if response.status_code >= 400:
+                self.request_log.error(prepared.headers, response.headers)
+                raise self.http_error(method, url, response)
+            if raw == "bytes":
+                return response.content
+            try:
+                return self.decode(response.content, tags)
+            except ValueError as exc:
+                raise ExchangeApiException(method, url, response.status_code, f"Could not decode JSON response: {exc}")
+
+    async def asend_cached_request(self, call, url, method, params, data, json_data, headers, sign, auth, raw):
+        """send_cached_request() counterpart of arequest()"""
+        content = await self.response_cache.aget(
+            url,
+            params,
+            lambda: self.asend_request(call, url, method, params, data, json_data, headers, sign, auth, "bytes"),
+        )
+        if raw == "bytes":
+            return content
+        return self.decode(content, self.metric_tags(method, url) if self.metrics is not None else None)
+
+    async def asend(self, prepared):
+        """Send a prepared request, retrying like the blocking adapter does. Returns an AsyncResponse"""
+        # requests accepts bytes header values (ie. signatures), aiohttp wants str
+        headers = {
+            k: v.decode("latin-1") if isinstance(v, bytes) else v
+            for k, v in prepared.headers.items()
+            if k.lower() != "content-length"
+        }
+        body = prepared.body.encode("utf-8") if isinstance(prepared.body, str) else prepared.body
+        # The url is already encoded (and possibly signed), don't let aiohttp requote it
+        url = yarl.URL(prepared.url, encoded=True)
+        idempotent = prepared.method in Retry.DEFAULT_ALLOWED_METHODS
+        attempts = {"connect": 0, "read": 0, "status": 0}
+
+        while True:
+            retry_after = None
+            start = time.monotonic()
+            try:
+                async with self.async_session.request(prepared.method, url, data=body, headers=headers) as raw:
+                    content = await raw.read()
+                response = AsyncResponse(
+                    prepared,
+                    raw.status,
+                    raw.reason,
+                    raw.headers,
+                    content,
+                    timedelta(seconds=time.monotonic() - start),
+                )
+                response.retries = sum(attempts.values())
+                self.log_retry_response(response)
+                if response.status_code not in self.HTTP_STATUSES_TO_RETRY or not idempotent:
+                    return response
+                kind, error = "status", None
+                if response.status_code == 503 and response.headers.get("Retry-After", "").isdigit():
+                    retry_after = int(response.headers["Retry-After"])
+            except aiohttp.ClientConnectorError as exc:
+                kind, error, response = "connect", exc, None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                if not idempotent:
+                    raise
+                kind, error, response = "read", exc, None
+
+            attempts[kind] += 1
+            if attempts[kind] > self.RETRIES:
+                if error is not None:
+                    raise error
+                return response
+
+            errors = sum(attempts.values())
+            backoff = 0 if errors <= 1 else min(self.RETRY_BACKOFF_MAX, self.RETRY_BACKOFF_FACTOR * 2 ** (errors - 1))
+            await asyncio.sleep(backoff if retry_after is None else retry_after)
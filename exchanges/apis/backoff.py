@@ -0,0 +1,81 @@
+from urllib.parse import urlsplit
+import threading
+import time
+
+from loguru import logger
+
+from .base import RATE_LIMIT_STATUSES, RateLimitException
+
+
+class AdaptiveBackoff:
+    """Shared cooldowns for hosts that answered 429 (too many requests) or 418 (IP banned).
+
+    Set as `client.backoff` (share one instance between clients using the same hosts). When a host rate limits
+    us, every caller waits for the host's cooldown before sending, instead of each one retrying on its own. The
+    cooldown is the exchange's Retry-After / ban time when given, and never less than an adaptive delay of
+    base_delay * multiplier ** strikes, where strikes go up on each rate limit and down on each success.
+
+    max_retries: how many times a rate limited request is retried (after waiting) before raising
+    max_wait: cooldowns longer than this raise RateLimitException right away, so the caller can route work
+        elsewhere instead of blocking (ie. a Binance IP ban)
+    """
+
+    def __init__(self, max_retries=3, max_wait=60, base_delay=1, multiplier=2, max_delay=300):
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.until = {}  # host -> monotonic time the cooldown ends
+        self.strikes = {}  # host -> consecutive rate limits
+
+    @staticmethod
+    def host(url):
+        return urlsplit(url).netloc
+
+    def delay(self, method, url):
+        """Seconds to wait before sending to this host. Raises RateLimitException if longer than max_wait"""
+        with self.lock:
+            remaining = self.until.get(self.host(url), 0) - time.monotonic()
+        if remaining <= 0:
+            return 0
+        if remaining > self.max_wait:
+            raise RateLimitException(
+                method, url, None, f"{self.host(url)} is cooling down for {remaining:.1f}s", retry_after=remaining
+            )
+        return remaining
+
+    def wait(self, method, url):
+        delay = self.delay(method, url)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def should_retry(self, response, retry_after, attempt):
+        """Record the outcome of a response. True if it was rate limited and should be retried after a wait"""
+        host = self.host(response.request.url)
+        with self.lock:
+            if response.status_code not in RATE_LIMIT_STATUSES:
+                if host in self.strikes:
+                    self.strikes[host] -= 1
+                    if self.strikes[host] <= 0:
+                        del self.strikes[host]
+                return False
+
+            strikes = self.strikes.get(host, 0)
+            cooldown = min(self.max_delay, self.base_delay * self.multiplier**strikes)
+            cooldown = max(cooldown, retry_after or 0)
+            self.strikes[host] = strikes + 1
+            self.until[host] = max(self.until.get(host, 0), time.monotonic() + cooldown)
+
+        logger.warning(
+            f"{host} returned {response.status_code}, cooling down for {cooldown:.1f}s (attempt {attempt + 1})"
+        )
+        return attempt < self.max_retries
+
+    def cooldowns(self):
+        """{host: seconds left} for the hosts currently cooling down"""
+        now = time.monotonic()
+        with self.lock:
+            return {host: until - now for host, until in self.until.items() if until > now}
@@ -1,6 +1,10 @@
+from urllib.parse import urlsplit
 import hashlib
 import hmac
 import json
+import re
+import threading
+import time
 
 from loguru import logger
 from requests.adapters import HTTPAdapter
@@ -8,11 +12,57 @@ from urllib3.util.retry import Retry
 import arrow
 import requests
 
+from .decoders import json_decoder
+from .fanout import fan_out
+from .logs import request_log
+from .metrics import status_class
+from .middleware import RequestCall
+from .nonce import shared_nonce_generator
+
+# Memoized symbol conversions kept per exchange
+SYMBOL_CACHE_SIZE = 65536
+
+# Too Many Requests, and Binance's "I'm a teapot" for IP bans
+RATE_LIMIT_STATUSES = [418, 429]
+
+# request(raw=...): decode the body (None), return it as bytes, or as a file-like object
+RAW_MODES = [None, "bytes", "stream"]
+
+# Url path segments that are ids rather than routes: numbers, and hex or uuid strings of 16 characters or more
+ID_SEGMENT = re.compile(r"(?<=/)(?:\d+|(?=[0-9a-fA-F-]*\d)[0-9a-fA-F-]{16,})(?=/|$)")
+
+
+def milliseconds(value):
+    """Epoch milliseconds of anything arrow.get() takes, ie. an arrow, datetime or ISO string"""
+    return int(arrow.get(value).float_timestamp * 1000)
+
 
 class BaseExchangeApi:
 
     # Internal state
     _session = key = secret = auth_provider = None
+    # Set to a RateLimiter (see ratelimit.py) to throttle requests client-side. Share one between clients that
+    # share the exchange's limit, ie. BinanceApi.rate_limiter = BinanceRateLimiter()
+    rate_limiter = None
+    # Set to an AdaptiveBackoff (see backoff.py) to wait out and retry 429/418 responses, slowing down every caller
+    # that shares it while a host is cooling down
+    backoff = None
+    # Set to a MetricsSink (see metrics.py) to record latency, retries, rate limit waits, bytes and decode time
+    metrics = None
+    # Middlewares (see middleware.py) hooked around signing, sending, parsing and errors of every request
+    middlewares = ()
+    # Set to a ResponseCache (see cache.py) to cache unauthenticated GETs, ie. tickers polled by several strategies
+    response_cache = None
+    # Where nonces come from, shared by every client in the process. Set to a FileNonceGenerator (see nonce.py) when
+    # several processes use the same key
+    nonce_generator = shared_nonce_generator
+    _session_lock = threading.Lock()
+    # True if iter_trade_history yields oldest first across every symbol, so a sync can resume after the last
+    # trade it stored (see history.py)
+    TRADE_HISTORY_ORDERED = False
+    # (regex, replacement) applied to url paths for the endpoint of metrics and the profiler, replacing symbols with
+    # placeholders so every symbol shares one series. Ids are replaced for every exchange
+    METRIC_ENDPOINT_PATTERNS = []
 
     # Settings
     # https://requests.readthedocs.io/en/master/user/advanced/#timeouts
@@ -22,6 +72,23 @@ class BaseExchangeApi:
     DEFAULT_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
     # Don't auto retry 429, that means we're going too fast
     HTTP_STATUSES_TO_RETRY = [408, 420, 500, 501, 502, 503, 504, 520, 521, 522, 523, 524, 525]
+    # Connection pool settings for the session adapter, see requests.adapters.HTTPAdapter
+    # POOL_CONNECTIONS is the number of hosts to keep pools for, POOL_MAXSIZE the connections kept per host
+    # and POOL_BLOCK whether to wait for a free connection instead of opening (and discarding) extra ones
+    POOL_CONNECTIONS = 10
+    POOL_MAXSIZE = 10
+    POOL_BLOCK = False
+    # Debug logging of requests, replace with a RequestLog (see logs.py) to sample or redact differently
+    request_log = request_log
+    # Response decoding: "json", "ujson" or "orjson" (faster on large payloads, ie. exchangeInfo or deep order books),
+    # and JSON_DECIMALS to parse numbers with a fraction to Decimal (json only). Can be set per client. JSON_DECIMALS
+    # only changes values sent as JSON numbers (Bitfinex, KuCoin's numbers): string prices, like all of Binance's,
+    # stay str
+    JSON_DECODER = "json"
+    JSON_DECIMALS = False
+    # Set to a ConnectionPoolRegistry (ie. exchanges.apis.pool.shared_pool_registry) to share connection pools
+    # per host with other clients instead of owning them. Auth, retries and hooks stay per client
+    POOL_REGISTRY = None
 
     def __init__(self, key=None, secret=None):
         self.key = key
@@ -37,7 +104,23 @@ class BaseExchangeApi:
         # Ex BTC/USDT
         raise NotImplementedError
 
-    def get_trade_history(self):
+    def make_symbol(self, symbol):  # pragma: no cover
+        # Return the exchange's symbol for a pair, ie. ETH/USDT -> ETHUSDT
+        raise NotImplementedError
+
+    def unmake_symbol(self, symbol):  # pragma: no cover
+        # Return the pair for an exchange's symbol, ie. ETHUSDT -> ETH/USDT
+        raise NotImplementedError
+
+    def make_symbols(self, symbols):
+        """make_symbol() for a list of pairs, in order. Exchanges override this with faster versions"""
+        return [self.make_symbol(symbol) for symbol in symbols]
+
+    def unmake_symbols(self, symbols):
+        """unmake_symbol() for a list of exchange symbols, in order"""
+        return [self.unmake_symbol(symbol) for symbol in symbols]
+
+    def get_trade_history(self, since=None, until=None):
         """Normalized view of executed trade history across exchanges - excludes deposits/withdrawals
         Format: [{"exchange_txn_id": str,
                     "client_order_id": str,  # if present
@@ -48,29 +131,76 @@ class BaseExchangeApi:
                     "amount": Decimal,
                     "price": Decimal,  # price per unit of trade_curr
                     "fees": Decimal,  # Always in stake_curr
+                    "fee_curr": str,  # only if the fees were paid in another currency, and couldn't be converted
                 }, ...]
         """
+        return list(self.iter_trade_history(since=since, until=until))
+
+    def get_balances(self):  # pragma: no cover
+        """Normalized account balances, leaving out empty ones
+        Format: {currency: {"total": Decimal,
+                            "available": Decimal,  # not held by open orders
+                            }, ...}
+        """
+        raise NotImplementedError
+
+    def iter_trade_history(self, since=None, until=None):  # pragma: no cover
+        """Generator of get_trade_history() records executed between since and until (anything arrow.get() takes),
+        fetched page by page as it is consumed, so memory use doesn't depend on the size of the history"""
         raise NotImplementedError
 
+    def get_ticker(self, symbol):
+        """Ticker of a pair, ie. BTC/USDT (see marketdata.py for the records)"""
+        return self.get_tickers([symbol])[symbol]
+
+    def get_tickers(self, symbols=None):  # pragma: no cover
+        """{pair: Ticker} of the given pairs, or of every pair of the exchange, in as few requests as it allows"""
+        raise NotImplementedError
+
+    def get_order_book(self, symbol, depth=100):  # pragma: no cover
+        """OrderBookSnapshot of a pair, with up to depth levels a side"""
+        raise NotImplementedError
+
+    def get_candles(self, symbol, interval="1m", start=None, end=None):  # pragma: no cover
+        """[Candle, ...] of a pair, oldest first, starting between start and end (anything arrow.get() takes), fetched
+        page by page. Without start, the latest page the exchange returns. interval: one of marketdata.INTERVALS,
+        when the exchange has it"""
+        raise NotImplementedError
+
+    def fan_out(self, calls, max_workers=None):
+        """Run many brequest() calls at once, ie. one per symbol for endpoints that need one:
+
+            client.fan_out({s: dict(api_version=3, endpoint="myTrades", authenticate=True, params={"symbol": s})
+                            for s in symbols})
+
+        calls: {key: brequest kwargs}. max_workers defaults to POOL_MAXSIZE, so every call gets a pooled connection.
+        Calls still go through the rate limiter and backoff. Returns a FanOutResult, where a failed call is an entry
+        in `errors` instead of failing the batch"""
+        return fan_out(self.brequest, calls, max_workers or self.POOL_MAXSIZE)
+
     @property
     def session(self):
         # Sessions are used to enable HTTP Keep-Alive when available
-        # Reuse the client for multiple requests by storing it as an internal state variable
-        if not self._session:
-            self._session = requests.Session()
-
-        def log_retry_response(response, *args, **kwargs):
-            elapsed = response.elapsed.total_seconds()
-            if response.status_code in self.HTTP_STATUSES_TO_RETRY:
-                logger.warning(
-                    f"Retrying {response.request.url} ({response.status_code}: "
-                    + f"{response.reason} after {elapsed:.2f}s): {response.text}"
-                )
-            else:
-                logger.debug(f"Request to {response.request.url} took {elapsed:.2f}s")
+        # Reuse the client for multiple requests by storing it as an internal state variable.
+        # The session, its retry adapter and hooks are only built once per client, so the connection pool
+        # (and any open connections in it) survive between requests
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self.build_session()
+        return self._session
 
-        self._session.hooks["response"] = [log_retry_response]
+    def build_session(self):
+        session = requests.Session()
+        session.hooks["response"] = [self.log_retry_response]
+
+        # Handle for all requests that start with http or https
+        adapter = self.build_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
+    def build_adapter(self):
         retry = Retry(
             total=self.RETRIES + 1,
             read=self.RETRIES,
@@ -79,28 +209,261 @@ class BaseExchangeApi:
             backoff_factor=self.RETRY_BACKOFF_FACTOR,
             status_forcelist=self.HTTP_STATUSES_TO_RETRY,
         )
+        if self.POOL_REGISTRY is not None:
+            return self.POOL_REGISTRY.adapter(max_retries=retry)
+        return HTTPAdapter(
+            pool_connections=self.POOL_CONNECTIONS,
+            pool_maxsize=self.POOL_MAXSIZE,
+            pool_block=self.POOL_BLOCK,
+            max_retries=retry,
+        )
 
-        # Handle for all requests that start with http or https
-        adapter = HTTPAdapter(max_retries=retry)
-        self._session.mount("http://", adapter)
-        self._session.mount("https://", adapter)
+    def log_retry_response(self, response, *args, **kwargs):
+        if response.status_code in self.HTTP_STATUSES_TO_RETRY:
+            logger.warning(
+                f"Retrying {self.request_log.redact_url(response.request.url)} ({response.status_code}: "
+                + f"{response.reason} after {response.elapsed.total_seconds():.2f}s): {response.text}"
+            )
+        elif self.request_log.enabled:
+            self.request_log.response(response)
 
-        return self._session
+    def close(self):
+        # Release pooled connections. The next request will build a fresh session
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
-    def request(self, url, method="GET", params=None, data=None, headers=None, ignore_json=False):
-        assert method in ["GET", "POST", "DELETE"]
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(
+        self,
+        url,
+        method="GET",
+        params=None,
+        data=None,
+        headers=None,
+        ignore_json=False,
+        sign=None,
+        auth=None,
+        stream=False,
+        raw=None,
+    ):
+        """sign: optional callable(headers, params) -> (headers, params) adding authentication. It runs after any
+        rate limiting wait, so timestamps and nonces are fresh when the request is sent
+        auth: requests auth for this call, in place of self.auth_provider (which is shared by concurrent calls)
+        stream: return the requests.Response without reading the body, once the status has been checked. The
+        caller reads it incrementally (ie. iter_lines) and must close it
+        raw: skip decoding, to forward the body as is. "bytes" returns the body, "stream" a file-like object reading it
+        as it's downloaded (decompressed), which the caller must close. Errors are still raised as usual"""
+        assert raw in RAW_MODES
+        data, json_data = self.prepare_body(url, method, params, data, headers, ignore_json)
+        stream = stream or raw == "stream"
+        send_request = self.send_request
+        if self.response_cache is not None and auth is None and self.cacheable(method, headers, sign, stream):
+            send_request = self.send_cached_request
+        if not self.middlewares:
+            return send_request(None, url, method, params, data, json_data, headers, sign, auth, stream, raw)
+
+        call = RequestCall(self, method, url, params, data or json_data, headers)
+        try:
+            return call.after_parse(
+                send_request(call, url, method, params, data, json_data, headers, sign, auth, stream, raw)
+            )
+        except ExchangeApiException as exc:
+            raise call.on_error(exc)
+
+    def send_request(self, call, url, method, params, data, json_data, headers, sign, auth, stream, raw):
+        """request() once the body is prepared: rate limiting, signing, sending (and retrying), checking and
+        decoding. call is the RequestCall when there are middlewares"""
+        metrics = self.metrics
+        tags = self.metric_tags(method, url) if metrics is not None else None
+        attempt = 0
+        while True:
+            waited = 0
+            if self.backoff is not None:
+                waited += self.backoff.wait(method, url) or 0
+            if self.rate_limiter is not None:
+                waited += self.rate_limiter.acquire(method, url, params) or 0
+            if waited and metrics is not None:
+                metrics.observe("rate_limit_wait_seconds", waited, tags)
+            request_headers, request_params = headers, params
+            if call is not None:
+                call.attempt = attempt
+                request_headers, request_params = call.before_sign(headers, params)
+            if sign is not None:
+                # Sign copies, so a rate limited request can be signed again with a fresh timestamp/nonce
+                request_headers, request_params = sign(
+                    dict(request_headers or {}), dict(request_params) if request_params else request_params
+                )
+
+            start = time.perf_counter()
+            try:
+
+                response = self.session.request(
+                    method,
+                    url,
+                    params=request_params,
+                    headers=request_headers,
+                    data=data,
+                    json=json_data,
+                    timeout=self.TIMEOUT,
+                    auth=auth or self.auth_provider,
+                    stream=stream,
+                )
+                if metrics is not None:
+                    self.record_response(tags, response, time.perf_counter() - start, stream)
+                if call is not None:
+                    call.after_send(response)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.update(response)
+                if self.backoff is not None and self.backoff.should_retry(
+                    response, self.retry_after(response), attempt
+                ):
+                    response.close()
+                    attempt += 1
+                    if metrics is not None:
+                        metrics.increment("retries_total", 1, {**tags, "reason": "rate_limit"})
+                    continue
+
+                response.raise_for_status()
+                if raw == "stream":
+                    response.raw.decode_content = True
+                    return response.raw
+                if stream:
+                    return response
+                if raw == "bytes":
+                    return response.content
+                return self.decode(response.content, tags)
+            except requests.exceptions.Timeout:  # pragma: no cover
+                self.record_error(tags, time.perf_counter() - start)
+                raise ExchangeApiException(method, url, None, "Connection Timeout")
+            except requests.exceptions.ConnectionError:  # pragma: no cover
+                self.record_error(tags, time.perf_counter() - start)
+                raise ExchangeApiException(method, url, None, "Connection Error")
+            except requests.exceptions.HTTPError:
+                self.request_log.error(response.request.headers, response.headers)
+                raise self.http_error(method, url, response)
+            except ValueError as exc:
+                raise ExchangeApiException(
+                    method,
+                    url,
+                    response.status_code,
+                    f"Could not decode JSON response: {exc}",
+                )
+
+    def cacheable(self, method, headers, sign, stream):
+        """Whether a request can go through the response_cache: unauthenticated GETs read whole"""
+        return (
+            method == "GET"
+            and sign is None
+            and not stream
+            and self.auth_provider is None
+            and not (headers and "Authorization" in headers)
+        )
+
+    def send_cached_request(self, call, url, method, params, data, json_data, headers, sign, auth, stream, raw):
+        """send_request() through the response_cache. Bodies are cached, so each caller gets its own result"""
+        content = self.response_cache.get(
+            url,
+            params,
+            lambda: self.send_request(call, url, method, params, data, json_data, headers, sign, auth, stream, "bytes"),
+        )
+        if raw == "bytes":
+            return content
+        return self.decode(content, self.metric_tags(method, url) if self.metrics is not None else None)
+
+    @classmethod
+    def exchange_name(cls):
+        # BinanceFuturesApi -> binancefutures
+        name = cls.__name__
+        return (name[:-3] if name.endswith("Api") else name).lower()
+
+    def metric_endpoint(self, url):
+        """Route of a url without its symbols and ids, ie. /v2/book/{symbol}/{precision}"""
+        path = ID_SEGMENT.sub("{id}", urlsplit(url).path)
+        for pattern, replacement in self.METRIC_ENDPOINT_PATTERNS:
+            path = pattern.sub(replacement, path)
+        return path
+
+    def metric_tags(self, method, url):
+        return {"exchange": self.exchange_name(), "endpoint": self.metric_endpoint(url), "method": method}
+
+    def record_response(self, tags, response, seconds, streamed=False):
+        """Send a response's measurements to `metrics`, see MetricsSink"""
+        tags = {**tags, "status": status_class(response.status_code)}
+        self.metrics.observe("request_seconds", seconds, tags)
+        body = response.request.body
+        if body:
+            self.metrics.increment("sent_bytes_total", len(body), tags)
+        received = int(response.headers.get("Content-Length") or 0) if streamed else len(response.content)
+        if received:
+            self.metrics.increment("received_bytes_total", received, tags)
+        retries = self.retries(response)
+        if retries:
+            self.metrics.increment("retries_total", retries, {**tags, "reason": "status"})
+
+    def record_error(self, tags, seconds):
+        if self.metrics is not None:
+            self.metrics.observe("request_seconds", seconds, {**tags, "status": status_class(None)})
+
+    @staticmethod
+    def retries(response):
+        """Retries done before this response, by urllib3 or AsyncBaseExchangeApi.asend()"""
+        if isinstance(response, requests.Response):
+            retry = getattr(response.raw, "retries", None)
+            return len(retry.history) if retry is not None else 0
+        return response.retries
+
+    def decode(self, content, tags=None):
+        if tags is None:
+            return self.parse_content(content)
+        start = time.perf_counter()
+        result = self.parse_content(content)
+        self.metrics.observe("decode_seconds", time.perf_counter() - start, tags)
+        return result
+
+    def http_error(self, method, url, response):
+        error_text = self.parse_error_text(response)
+        if response.status_code in RATE_LIMIT_STATUSES:
+            return RateLimitException(
+                method, url, response.status_code, error_text, retry_after=self.retry_after(response)
+            )
+        return ExchangeApiException(method, url, response.status_code, error_text)
+
+    def retry_after(self, response):
+        """Seconds the exchange asked us to wait before the next request, if it said so"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP date
+            try:
+                return max(0, (arrow.get(value, "ddd, DD MMM YYYY HH:mm:ss ZZZ") - arrow.utcnow()).total_seconds())
+            except (arrow.parser.ParserError, ValueError):
+                return None
+
+    def prepare_body(self, url, method, params, data, headers, ignore_json):
+        """Validate the request and split data into (data, json_data) for requests. Shared by the sync and async
+        request paths so both send identical bodies"""
+        assert method in ["GET", "POST", "PUT", "DELETE"]
         if method == "GET" and not params:
             assert not params, "GET must be used with params"
         if data:
-            assert method == "POST", "POST must be used with data"
+            assert method in ["POST", "PUT"], "POST or PUT must be used with data"
 
-        logger.debug("Requesting %s %s with %s" % (method, url, params or data))
-        if headers:
-            logger.debug("Request Headers: %s" % headers)
+        if self.request_log.enabled:
+            self.request_log.request(method, url, params, data, headers)
 
         # If a string is passed in for data, assume it is already json as a string,
         # otherwise, assume it's a complex type and we pass it as json so it gets converted
-        # Note: ujson strips spaces and breaks bitfinex
+        # Note: always json.dumps, whatever the decoder, ujson strips spaces and breaks bitfinex signatures
         if data and not isinstance(data, str):
             json_data = None
             data = json.dumps(data)
@@ -112,52 +475,25 @@ class BaseExchangeApi:
         if ignore_json:
             json_data = None
 
-        try:
+        return data, json_data
 
-            response = self.session.request(
-                method,
-                url,
-                params=params,
-                headers=headers,
-                data=data,
-                json=json_data,
-                timeout=self.TIMEOUT,
-                auth=self.auth_provider,
-            )
+    def loads(self, content):
+        # Raises ValueError if the body is not valid JSON
+        return json_decoder(self.JSON_DECODER, self.JSON_DECIMALS)(content)
 
-            response.raise_for_status()
-            if "custom_response_parsing" in self.__dict__:
-                parsed = json.loads(
-                    response.content.decode("utf-8").split(self.response_json_split_char, 1)[self.response_json_index]
-                )
-            else:
-                parsed = json.loads(response.content)
-            return parsed
-        except requests.exceptions.Timeout:  # pragma: no cover
-            raise ExchangeApiException(method, url, None, "Connection Timeout")
-        except requests.exceptions.ConnectionError:  # pragma: no cover
-            raise ExchangeApiException(method, url, None, "Connection Error")
-        except requests.exceptions.HTTPError:
-            logger.debug(f"Request headers: {response.request.headers}")
-            logger.debug(f"Response headers: {response.headers}")
-            error_text = self.parse_error_text(response)
-            raise ExchangeApiException(method, url, response.status_code, error_text)
-        except ValueError as exc:
-            raise ExchangeApiException(
-                method,
-                url,
-                response.status_code,
-                f"Could not decode JSON response: {exc}",
-            )
+    def parse_content(self, content):
+        if "custom_response_parsing" in self.__dict__:
+            return self.loads(content.decode("utf-8").split(self.response_json_split_char, 1)[self.response_json_index])
+        return self.loads(content)
 
     def parse_error_text(self, response):  # pragma: no cover
         # Exchange-specific error handling
         return response.text
 
-    def nonce(self, increment=0):
+    def nonce(self, increment=None):
         # Slightly larger than the default so we can continue using the same one for all APIs
-        # Increment prevents nonce too small errors from being raised
-        return str(int(round(arrow.utcnow().float_timestamp * 10000000)) + increment)
+        # increment is deprecated and ignored: nonce_generator never returns the same nonce twice
+        return str(self.nonce_generator.next())
 
     def sign(self, secret, message):
         """Signs the payload with SHA384 algorithm
@@ -183,3 +519,11 @@ class ExchangeApiException(Exception):
 
     def __str__(self):
         return f"{self.method} {self.url} returned status code {self.status_code} with message: {self.message}"
+
+
+class RateLimitException(ExchangeApiException):
+    """429/418 from the exchange, or a host cooling down for too long. retry_after is in seconds, if known"""
+
+    def __init__(self, method, url, status_code, message, retry_after=None):
+        super().__init__(method, url, status_code, message)
+        self.retry_after = retry_after
@@ -1,22 +1,94 @@
+from decimal import Decimal as D
 import hashlib
 import hmac
+import json
+import re
+import time
 import urllib
 
-from cachetools import TTLCache, cached
 from loguru import logger
 import arrow
-import requests
 
-from .base import BaseExchangeApi, ExchangeApiException
+from .aio import AsyncBaseExchangeApi
+from .base import ExchangeApiException, milliseconds
+from .marketdata import (
+    INTERVALS,
+    Candle,
+    OrderBookSnapshot,
+    Ticker,
+    candle_range,
+    decimal,
+    interval_name,
+    levels,
+    rounded_depth,
+)
+from .metadata import metadata_cache
 
+# ie. {"code":-1003,"msg":"Way too much request weight used; IP banned until 1659146999999. ..."}
+BANNED_UNTIL = re.compile(r"banned until (\d+)")
 
-class BinanceApi(BaseExchangeApi):
+
+class SymbolIndex:
+    """Constant time lookups over the symbols of a Binance exchangeInfo response"""
+
+    def __init__(self, symbols):
+        self.symbols = {}  # symbol -> exchangeInfo entry
+        self.pairs = {}  # (base, quote) -> symbol
+        self.symbol_filters = {}  # symbol -> {filterType: filter}
+        for info in symbols:
+            self.symbols[info["symbol"]] = info
+            self.pairs[(info["baseAsset"], info["quoteAsset"])] = info["symbol"]
+            self.symbol_filters[info["symbol"]] = {f["filterType"]: f for f in info.get("filters", [])}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def pair(self, symbol):
+        """ETHUSDT -> (ETH, USDT), or None if unknown"""
+        info = self.symbols.get(symbol)
+        return (info["baseAsset"], info["quoteAsset"]) if info else None
+
+    def symbol(self, base, quote):
+        """(ETH, USDT) -> ETHUSDT, or None if unknown"""
+        return self.pairs.get((base, quote))
+
+    def filters(self, symbol):
+        return self.symbol_filters.get(symbol, {})
+
+    def tick_size(self, symbol):
+        price_filter = self.filters(symbol).get("PRICE_FILTER")
+        return D(price_filter["tickSize"]) if price_filter else None
+
+    def lot_size(self, symbol):
+        lot_size = self.filters(symbol).get("LOT_SIZE")
+        return D(lot_size["stepSize"]) if lot_size else None
+
+
+class BinanceApi(AsyncBaseExchangeApi):
     api_prefix = "api"
+    BASE_URL = "https://api.binance.com"
+    # Spot and margin trade the same symbols
+    SYMBOLS_FAMILY = "api"
+    EXCHANGE_INFO_URL = "https://api.binance.com/api/v3/exchangeInfo"
+    # (api version, endpoint) of the account trade list, paged with fromId
+    TRADES_ENDPOINT = (3, "myTrades")
+    TRADES_PAGE_SIZE = 1000
+    # (api version, endpoint) managing the listen key of the user data websocket stream
+    USER_DATA_STREAM_ENDPOINT = (3, "userDataStream")
+    # Public market data, which margin clients get from the spot API
+    MARKET_DATA_PATH = "/api/v3"
+    DEPTH_LIMITS = [5, 10, 20, 50, 100, 500, 1000, 5000]
+    CANDLE_INTERVALS = {interval: interval for interval in INTERVALS}
+    CANDLES_PAGE_SIZE = 1000
 
-    @cached(cache=TTLCache(maxsize=32, ttl=300))
     def pull_symbols(self):
         logger.info("Calling live binance API for symbols list")
-        return requests.get("https://api.binance.com/api/v3/exchangeInfo").json().get("symbols")
+        return self.request(self.EXCHANGE_INFO_URL).get("symbols")
+
+    @property
+    def symbol_index(self):
+        # One index per API family, shared by every client and refreshed in the background
+        return metadata_cache(f"binance_{self.SYMBOLS_FAMILY}_symbols", transform=SymbolIndex).get(self.pull_symbols)
 
     def get_symbol(self, stake_currency, trade_currency):
         return self.make_symbol(trade_currency + "/" + stake_currency)
@@ -24,19 +96,174 @@ class BinanceApi(BaseExchangeApi):
     def get_pair(self, symbol):
         return self.unmake_symbol(symbol)
 
-    @cached(cache={})
     def unmake_symbol(self, symbol):
-        self.symbols = self.pull_symbols()
-
-        our_symbol = [x for x in self.symbols if x["symbol"] == symbol]
-        assert our_symbol, f"Trading pair {symbol} not found on Binance."
+        pair = self.symbol_index.pair(symbol)
+        assert pair, f"Trading pair {symbol} not found on Binance."
 
-        return f'{our_symbol[0]["baseAsset"]}/{our_symbol[0]["quoteAsset"]}'
+        return f"{pair[0]}/{pair[1]}"
 
     def make_symbol(self, symbol):
         pieces = symbol.split("/")
         return "{}{}".format(pieces[0], pieces[1])
 
+    def unmake_symbols(self, symbols):
+        index = self.symbol_index
+        pairs = []
+        for symbol in symbols:
+            pair = index.pair(symbol)
+            assert pair, f"Trading pair {symbol} not found on Binance."
+            pairs.append(f"{pair[0]}/{pair[1]}")
+        return pairs
+
+    def make_symbols(self, symbols):
+        return [symbol.replace("/", "", 1) for symbol in symbols]
+
+    def get_balances(self):
+        balances = {}
+        for balance in self.brequest(3, "account", authenticate=True)["balances"]:
+            free, locked = D(balance["free"]), D(balance["locked"])
+            if free or locked:
+                balances[balance["asset"]] = {"total": free + locked, "available": free}
+        return balances
+
+    def iter_trade_history(self, since=None, until=None, symbols=None):
+        """symbols: pairs to fetch, ie. ["BTC/USDT"]. Binance only lists trades one symbol at a time, so by default
+        every symbol of the exchange is queried, which takes a while. Pass the traded pairs when they're known"""
+        since = milliseconds(since) if since else None
+        until = milliseconds(until) if until else None
+        if symbols:
+            pairs = [tuple(symbol.split("/")) for symbol in symbols]
+        else:
+            pairs = self.traded_pairs(since, until)
+        for pair in pairs:
+            yield from self.iter_symbol_trades(pair, since, until)
+
+    def traded_pairs(self, since, until):
+        """Pairs to list the trades of when no symbols are given: every symbol of the exchange"""
+        index = self.symbol_index
+        return [index.pair(symbol) for symbol in index.symbols]
+
+    def iter_symbol_trades(self, pair, since, until):
+        # Paged by id from the first trade, skipping those before since: a symbol never traded costs one request, and
+        # searching for since with startTime windows (at most 24 hours each) would cost one per day
+        symbol = pair[0] + pair[1]
+        from_id = 0
+        while True:
+            params = {"symbol": symbol, "fromId": from_id, "limit": self.TRADES_PAGE_SIZE}
+            trades = self.brequest(*self.TRADES_ENDPOINT, authenticate=True, params=params)
+            for trade in trades:
+                if until is not None and trade["time"] >= until:
+                    return
+                if since is None or trade["time"] >= since:
+                    yield self.normalize_trade(trade, pair)
+            if len(trades) < self.TRADES_PAGE_SIZE:
+                return
+            from_id = trades[-1]["id"] + 1
+
+    def normalize_trade(self, trade, pair):
+        trade_curr, stake_curr = pair
+        price = D(trade["price"])
+        fees = D(trade["commission"])
+        if trade["commissionAsset"] == trade_curr:
+            fees *= price
+        record = {
+            "exchange_txn_id": str(trade["id"]),
+            "time": arrow.get(trade["time"] / 1000),
+            # futures trades say "buyer"
+            "action": "buy" if trade.get("isBuyer", trade.get("buyer")) else "sell",
+            "stake_curr": stake_curr,
+            "trade_curr": trade_curr,
+            "amount": D(trade["qty"]),
+            "price": price,
+            "fees": fees,
+        }
+        if trade["commissionAsset"] not in pair:
+            # ie. paid in BNB, which can't be converted without a price
+            record["fee_curr"] = trade["commissionAsset"]
+        return record
+
+    def market_data(self, endpoint, params=None):
+        return self.request(f"{self.BASE_URL}{self.MARKET_DATA_PATH}/{endpoint}", params=params)
+
+    def ticker_pairs(self, symbols):
+        """{symbol: pair} of the pairs asked for, or of every symbol of the exchange. Futures delivery contracts, ie.
+        ETHUSDT_230331, are left out as their pair is the perpetual's"""
+        if symbols:
+            return dict(zip(self.make_symbols(symbols), symbols))
+        index = self.symbol_index
+        pairs = {}
+        for symbol in index.symbols:
+            base, quote = index.pair(symbol)
+            if symbol == base + quote:
+                pairs[symbol] = f"{base}/{quote}"
+        return pairs
+
+    def get_tickers(self, symbols=None):
+        # 24 hour statistics, with the best bid and ask. Any number of symbols in one request
+        pairs = self.ticker_pairs(symbols)
+        params = {"symbols": json.dumps(list(pairs), separators=(",", ":"))} if symbols else None
+        return {
+            pairs[ticker["symbol"]]: self.normalize_ticker(pairs[ticker["symbol"]], ticker, ticker)
+            for ticker in self.market_data("ticker/24hr", params)
+            if ticker["symbol"] in pairs
+        }
+
+    def normalize_ticker(self, pair, ticker, book_ticker):
+        return Ticker(
+            pair,
+            decimal(book_ticker.get("bidPrice")),
+            decimal(book_ticker.get("askPrice")),
+            decimal(ticker["lastPrice"]),
+            decimal(ticker["volume"]),
+            ticker.get("closeTime"),
+        )
+
+    def get_order_book(self, symbol, depth=100):
+        params = {"symbol": self.make_symbol(symbol), "limit": rounded_depth(depth, self.DEPTH_LIMITS)}
+        book = self.market_data("depth", params)
+        # Futures books have the transaction time
+        return OrderBookSnapshot(
+            symbol, levels(book["bids"], depth), levels(book["asks"], depth), book["lastUpdateId"], book.get("T")
+        )
+
+    def get_candles(self, symbol, interval="1m", start=None, end=None):
+        params = {
+            "symbol": self.make_symbol(symbol),
+            "interval": interval_name(interval, self.CANDLE_INTERVALS),
+            "limit": self.CANDLES_PAGE_SIZE,
+        }
+        start = milliseconds(start) if start else None
+        end = milliseconds(end) if end else None
+        if end is not None:
+            params["endTime"] = end - 1
+        candles = []
+        page_start = start
+        while True:
+            if page_start is not None:
+                params["startTime"] = page_start
+            # [[open time, open, high, low, close, volume, close time, ...], ...]
+            page = self.market_data("klines", params)
+            candles.extend(Candle(k[0], D(k[1]), D(k[2]), D(k[3]), D(k[4]), D(k[5])) for k in page)
+            if start is None or len(page) < self.CANDLES_PAGE_SIZE:
+                return candle_range(candles, start, end)
+            page_start = page[-1][0] + 1
+
+    def user_data_stream(self, method="POST", listen_key=None):
+        """Create (POST), keep alive (PUT) or close (DELETE) the listen key of the user data stream. These only need
+        the API key, not a signature"""
+        params = {"listenKey": listen_key} if listen_key else None
+        request = self.prepare_brequest(*self.USER_DATA_STREAM_ENDPOINT, False, method, params, None)
+        request["headers"]["X-MBX-APIKEY"] = self.key
+        return self.request(**request)
+
+    def retry_after(self, response):
+        # IP bans are a 418 with the end of the ban in the message, which can be later than Retry-After
+        retry_after = super().retry_after(response)
+        match = BANNED_UNTIL.search(response.text) if response.status_code == 418 else None
+        if match:
+            retry_after = max(retry_after or 0, int(match.group(1)) / 1000 - time.time())
+        return retry_after
+
     def prepare_signed_request(self, headers, params):
         if not params:
             params = {}
@@ -59,14 +286,31 @@ class BinanceApi(BaseExchangeApi):
         method="GET",
         params=None,
         data=None,
+        raw=None,
     ):
+        return self.request(**self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw)
+
+    async def abrequest(
+        self,
+        api_version,
+        endpoint=None,
+        authenticate=False,
+        method="GET",
+        params=None,
+        data=None,
+        raw=None,
+    ):
+        return await self.arequest(
+            **self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw
+        )
+
+    def prepare_brequest(self, api_version, endpoint, authenticate, method, params, data):
         # different from bitfinex support, we support specifying any api version, because binance always
         # seems to have some lengthy transitions.
         assert not endpoint.startswith(
             (f"/{self.api_prefix}", f"{self.api_prefix}")
         ), "endpoint should not be a full path, but the url after sapi/v1/"
 
-        base_url = "https://api.binance.com"
         api_path = f"/{self.api_prefix}/v{api_version}/{endpoint}"
 
         headers = self.DEFAULT_HEADERS.copy()
@@ -74,21 +318,87 @@ class BinanceApi(BaseExchangeApi):
         # Required because data for the signature must match the data that is passed in the body as json, even if empty
         data = data or {}
 
-        if authenticate:
-            # NOTE cannot change headers or params after this
-            headers, params = self.prepare_signed_request(headers, params)
-
-        url = base_url + api_path
-        return self.request(url, method, params, data, headers)
+        url = self.BASE_URL + api_path
+        # Signing happens in request(), right before sending. NOTE cannot change headers or params after that
+        sign = self.prepare_signed_request if authenticate else None
+        return dict(url=url, method=method, params=params, data=data, headers=headers, sign=sign)
 
 
 class BinanceMarginApi(BinanceApi):
+    TRADES_ENDPOINT = (1, "margin/myTrades")
+    USER_DATA_STREAM_ENDPOINT = (1, "userDataStream")
+
+    def get_balances(self):
+        balances = {}
+        for asset in self.brequest(1, "margin/account", authenticate=True)["userAssets"]:
+            free, locked = D(asset["free"]), D(asset["locked"])
+            if free or locked:
+                balances[asset["asset"]] = {"total": free + locked, "available": free}
+        return balances
+
     def __init__(self, *args, **kwargs):
         self.api_prefix = "sapi"
         super().__init__(*args, **kwargs)
 
 
 class BinanceFuturesApi(BinanceApi):
+    BASE_URL = "https://fapi.binance.com"
+    SYMBOLS_FAMILY = "fapi"
+    EXCHANGE_INFO_URL = "https://fapi.binance.com/fapi/v1/exchangeInfo"
+    TRADES_ENDPOINT = (1, "userTrades")
+    USER_DATA_STREAM_ENDPOINT = (1, "listenKey")
+    INCOME_PAGE_SIZE = 1000
+    # How far back Binance keeps the income history
+    INCOME_HISTORY = 90 * 24 * 60 * 60 * 1000
+    MARKET_DATA_PATH = "/fapi/v1"
+    DEPTH_LIMITS = [5, 10, 20, 50, 100, 500, 1000]
+
+    def get_balances(self):
+        balances = {}
+        for asset in self.brequest(2, "balance", authenticate=True):
+            total = D(asset["balance"])
+            if total:
+                balances[asset["asset"]] = {"total": total, "available": D(asset["availableBalance"])}
+        return balances
+
+    def traded_pairs(self, since, until):
+        """Every futures trade pays a commission, so the symbols traded between since and until are the ones of the
+        commission income history, instead of every one of the exchange. Binance only keeps INCOME_HISTORY of it, so
+        trades older than that can't be found this way: pass symbols to list them"""
+        if since is None or since < milliseconds(arrow.utcnow()) - self.INCOME_HISTORY:
+            raise ValueError(
+                f"Binance keeps {self.INCOME_HISTORY // (24 * 60 * 60 * 1000)} days of futures income history, pass "
+                "symbols to list the trades since an earlier date"
+            )
+        index = self.symbol_index
+        symbols = set()
+        params = {"incomeType": "COMMISSION", "startTime": since, "limit": self.INCOME_PAGE_SIZE}
+        if until is not None:
+            params["endTime"] = until - 1
+        while True:
+            page = self.brequest(1, "income", authenticate=True, params=params)
+            symbols.update(income["symbol"] for income in page if income["symbol"])
+            if len(page) < self.INCOME_PAGE_SIZE:
+                break
+            params["startTime"] = page[-1]["time"] + 1
+        return [index.pair(symbol) for symbol in sorted(symbols) if index.pair(symbol)]
+
+    def get_tickers(self, symbols=None):
+        # 24 hour statistics have no bid and ask, which come from the book tickers. Both take one symbol or all
+        pairs = self.ticker_pairs(symbols)
+        params = {"symbol": next(iter(pairs))} if symbols and len(pairs) == 1 else None
+        tickers, book_tickers = self.market_data("ticker/24hr", params), self.market_data("ticker/bookTicker", params)
+        if params:
+            tickers, book_tickers = [tickers], [book_tickers]
+        book_tickers = {book_ticker["symbol"]: book_ticker for book_ticker in book_tickers}
+        return {
+            pairs[ticker["symbol"]]: self.normalize_ticker(
+                pairs[ticker["symbol"]], ticker, book_tickers.get(ticker["symbol"], {})
+            )
+            for ticker in tickers
+            if ticker["symbol"] in pairs
+        }
+
     def __init__(self, *args, **kwargs):
         self.api_prefix = "fapi"
         super().__init__(*args, **kwargs)
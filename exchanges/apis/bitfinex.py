@@ -1,15 +1,91 @@
+from decimal import Decimal as D
+from functools import lru_cache, partial
 import base64
 import json
 import re
 
-import ujson
+from loguru import logger
+import arrow
 
-from .base import BaseExchangeApi, ExchangeApiException
+from .aio import AsyncBaseExchangeApi
+from .base import SYMBOL_CACHE_SIZE, ExchangeApiException, milliseconds
+from .marketdata import Candle, OrderBookSnapshot, Ticker, candle_range, decimal, interval_name, rounded_depth
+from .metadata import metadata_cache
 
+SYMBOL_FORMAT = re.compile("t[A-Z0-9]{3,}[:]?[A-Z0-9]{3,}")
+PAIR_FORMAT = re.compile("[A-Z0-9]{3,}/[A-Z0-9]{3,}")
 
-class BitfinexApi(BaseExchangeApi):
+
+@lru_cache(maxsize=SYMBOL_CACHE_SIZE)
+def _unmake_symbol(bitfinex_symbol):
+    assert SYMBOL_FORMAT.match(bitfinex_symbol), (
+        "Format of bitfinex_symbol should be t$trade_currency$stake_currency or t$trade_currency:$stake_currency"
+        " (for pairs with >3 chars on one side): {}".format(bitfinex_symbol)
+    )
+    if ":" in bitfinex_symbol:
+        # tXAUT:USD -> XAUT/USD
+        pieces = bitfinex_symbol.lstrip("t").split(":")
+        return "{}/{}".format(pieces[0], pieces[1])
+    else:
+        # tETHUSD -> ETH/USD
+        return "{}/{}".format(bitfinex_symbol[1:-3], bitfinex_symbol[-3:])
+
+
+@lru_cache(maxsize=SYMBOL_CACHE_SIZE)
+def _make_symbol(symbol):
+    assert PAIR_FORMAT.match(symbol), "Format of symbol should be $trade_currency/$stake_currency: {}".format(symbol)
+    pieces = symbol.split("/")
+    if len(pieces[0]) > 3 or len(pieces[1]) > 3:  # these will have a : between symbols
+        # TESTBTC/TESTUSDT -> tTESTBTC:TESTUSDT
+        return "t{}:{}".format(pieces[0], pieces[1])
+    else:
+        # ETH/USD -> tETHUSD
+        return "t{}{}".format(pieces[0], pieces[1])
+
+
+class BitfinexApi(AsyncBaseExchangeApi):
+    BASE_URL = "https://api.bitfinex.com"
+    PUBLIC_BASE_URL = "https://api-pub.bitfinex.com"
     # Don't retry 500, as Bitfinex will return that for errors that we should not retry
     HTTP_STATUSES_TO_RETRY = [408, 420, 501, 502, 503, 504, 520, 521, 522, 523, 524, 525]
+    # Going over a rate limit blocks the IP for 60 seconds, and there's no Retry-After header to say so
+    RATE_LIMIT_BLOCK = 60
+    TRADES_PAGE_SIZE = 2500
+    TRADE_HISTORY_ORDERED = True
+    # Times a request rejected for its nonce is signed again with a fresh one
+    NONCE_RETRIES = 1
+    BOOK_LENGTHS = [1, 25, 100, 250]
+    METRIC_ENDPOINT_PATTERNS = [
+        # v2 symbols, ie. tBTCUSD, tTESTBTC:TESTUSD or fUSD, also within candle keys
+        (re.compile(r"(?<=[/:])[tf][A-Z0-9]{3,}(?::[A-Z0-9]{3,})?(?=[/:]|$)"), "{symbol}"),
+        (re.compile(r"(?<=/)[PR]\d(?=/|$)"), "{precision}"),
+        (re.compile(r"(?<=trade:)\w+(?=:)"), "{interval}"),
+        # v1 symbols, ie. btcusd
+        (re.compile(r"^(/v1/(?:pubticker|book|trades|stats|lendbook|lends)/)[^/]+"), r"\1{symbol}"),
+    ]
+    CANDLE_INTERVALS = {
+        "1m": "1m",
+        "5m": "5m",
+        "15m": "15m",
+        "30m": "30m",
+        "1h": "1h",
+        "4h": "4h",
+        "6h": "6h",
+        "12h": "12h",
+        "1d": "1D",
+        "1w": "1W",
+    }
+    CANDLES_PAGE_SIZE = 10000
+
+    def pull_symbols(self):
+        # ["BTCUSD", "TESTBTC:TESTUSD", ...]
+        return self.brequest(2, "conf/pub:list:pair:exchange")[0]
+
+    @property
+    def exchange_symbols(self):
+        """Set of every trading symbol, ie. tBTCUSD, shared by every client and refreshed in the background"""
+        cache = metadata_cache("bitfinex_pairs", transform=lambda pairs: frozenset("t" + pair for pair in pairs))
+        return cache.get(self.pull_symbols)
 
     def get_symbol(self, stake_currency, trade_currency):
         return self.make_symbol(trade_currency + "/" + stake_currency)
@@ -18,44 +94,178 @@ class BitfinexApi(BaseExchangeApi):
         return self.unmake_symbol(symbol)
 
     def unmake_symbol(self, bitfinex_symbol):
-        assert re.match("t[A-Z0-9]{3,}[:]?[A-Z0-9]{3,}", bitfinex_symbol), (
-            "Format of bitfinex_symbol should be t$trade_currency$stake_currency or t$trade_currency:$stake_currency"
-            " (for pairs with >3 chars on one side): {}".format(bitfinex_symbol)
-        )
-        if ":" in bitfinex_symbol:
-            # tXAUT:USD -> XAUT/USD
-            pieces = bitfinex_symbol.lstrip("t").split(":")
-            return "{}/{}".format(pieces[0], pieces[1])
-        else:
-            # tETHUSD -> ETH/USD
-            return "{}/{}".format(bitfinex_symbol[1:-3], bitfinex_symbol[-3:])
+        return _unmake_symbol(bitfinex_symbol)
 
     def make_symbol(self, symbol):
-        assert re.match(
-            "[A-Z0-9]{3,}/[A-Z0-9]{3,}", symbol
-        ), "Format of symbol should be $trade_currency/$stake_currency: {}".format(symbol)
-        pieces = symbol.split("/")
-        if len(pieces[0]) > 3 or len(pieces[1]) > 3:  # these will have a : between symbols
-            # TESTBTC/TESTUSDT -> tTESTBTC:TESTUSDT
-            return "t{}:{}".format(pieces[0], pieces[1])
-        else:
-            # ETH/USD -> tETHUSD
-            return "t{}{}".format(pieces[0], pieces[1])
+        return _make_symbol(symbol)
+
+    def unmake_symbols(self, bitfinex_symbols):
+        return list(map(_unmake_symbol, bitfinex_symbols))
+
+    def make_symbols(self, symbols):
+        return list(map(_make_symbol, symbols))
+
+    def get_balances(self):
+        # Summed over the exchange, margin and funding wallets
+        # [[WALLET_TYPE, CURRENCY, BALANCE, UNSETTLED_INTEREST, AVAILABLE_BALANCE, ...], ...]
+        balances = {}
+        for wallet in self.brequest(2, "auth/r/wallets", authenticate=True, method="POST"):
+            total = D(str(wallet[2]))
+            if not total:
+                continue
+            # Available balance is null until the wallet is used, or calculated with calc/wallet/available
+            available = D(str(wallet[4])) if wallet[4] is not None else total
+            balance = balances.setdefault(wallet[1], {"total": D(0), "available": D(0)})
+            balance["total"] += total
+            balance["available"] += available
+        return balances
+
+    def iter_trade_history(self, since=None, until=None):
+        # Oldest first (sort=1), each page starting at the time of the last trade of the previous one
+        start = milliseconds(since) if since else 0
+        end = milliseconds(until) if until else None
+        seen = set()  # ids of trades at `start`, which the next page returns again
+        while True:
+            data = {"start": start, "limit": self.TRADES_PAGE_SIZE, "sort": 1}
+            if end is not None:
+                data["end"] = end - 1
+            trades = self.brequest(2, "auth/r/trades/hist", authenticate=True, method="POST", data=data)
+            for trade in trades:
+                if trade[0] not in seen:
+                    yield self.normalize_trade(trade)
+            if len(trades) < self.TRADES_PAGE_SIZE:
+                return
+
+            last = trades[-1][2]
+            if last == start:
+                # A whole page in the same millisecond, move on rather than asking for it forever
+                start, seen = last + 1, set()
+            else:
+                start, seen = last, {trade[0] for trade in trades if trade[2] == last}
+
+    def normalize_trade(self, trade):
+        # [ID, SYMBOL, MTS, ORDER_ID, EXEC_AMOUNT, EXEC_PRICE, ORDER_TYPE, ORDER_PRICE, MAKER, FEE, FEE_CURRENCY, CID]
+        trade_curr, stake_curr = self.unmake_symbol(trade[1]).split("/")
+        amount = D(str(trade[4]))
+        price = D(str(trade[5]))
+        # Fees are negative
+        fees = abs(D(str(trade[9])))
+        if trade[10] == trade_curr:
+            fees *= price
+        record = {
+            "exchange_txn_id": str(trade[0]),
+            "time": arrow.get(trade[2] / 1000),
+            "action": "buy" if amount > 0 else "sell",
+            "stake_curr": stake_curr,
+            "trade_curr": trade_curr,
+            "amount": abs(amount),
+            "price": price,
+            "fees": fees,
+        }
+        if len(trade) > 11 and trade[11]:
+            record["client_order_id"] = str(trade[11])
+        if trade[10] not in (trade_curr, stake_curr):
+            record["fee_curr"] = trade[10]
+        return record
+
+    def get_tickers(self, symbols=None):
+        # [SYMBOL, BID, BID_SIZE, ASK, ASK_SIZE, DAILY_CHANGE, DAILY_CHANGE_RELATIVE, LAST_PRICE, VOLUME, HIGH, LOW]
+        # for trading pairs, funding currencies (fUSD) are left out
+        params = {"symbols": ",".join(self.make_symbols(symbols)) if symbols else "ALL"}
+        tickers = {}
+        for ticker in self.brequest(2, "tickers", params=params):
+            if ticker[0].startswith("t"):
+                pair = self.unmake_symbol(ticker[0])
+                tickers[pair] = Ticker(
+                    pair, decimal(ticker[1]), decimal(ticker[3]), decimal(ticker[7]), decimal(ticker[8]), None
+                )
+        return tickers
+
+    def get_order_book(self, symbol, depth=100):
+        # [[PRICE, COUNT, AMOUNT], ...], bids (positive amounts) then asks, best first
+        params = {"len": rounded_depth(depth, self.BOOK_LENGTHS)}
+        entries = self.brequest(2, f"book/{self.make_symbol(symbol)}/P0", params=params)
+        bids = [(decimal(price), decimal(amount)) for price, _, amount in entries if amount > 0]
+        asks = [(decimal(price), -decimal(amount)) for price, _, amount in entries if amount < 0]
+        return OrderBookSnapshot(symbol, bids[:depth], asks[:depth], None, None)
+
+    def get_candles(self, symbol, interval="1m", start=None, end=None):
+        endpoint = f"candles/trade:{interval_name(interval, self.CANDLE_INTERVALS)}:{self.make_symbol(symbol)}/hist"
+        start = milliseconds(start) if start else None
+        end = milliseconds(end) if end else None
+        params = {"limit": self.CANDLES_PAGE_SIZE}
+        if end is not None:
+            params["end"] = end - 1
+        if start is not None:
+            # Oldest first, to page forward
+            params["sort"] = 1
+        candles = []
+        page_start = start
+        while True:
+            if page_start is not None:
+                params["start"] = page_start
+            # [[MTS, OPEN, CLOSE, HIGH, LOW, VOLUME], ...]
+            page = self.brequest(2, endpoint, params=params)
+            candles.extend(
+                Candle(c[0], decimal(c[1]), decimal(c[3]), decimal(c[4]), decimal(c[2]), decimal(c[5])) for c in page
+            )
+            if start is None or len(page) < self.CANDLES_PAGE_SIZE:
+                return candle_range(candles, start, end)
+            page_start = page[-1][0] + 1
 
     def brequest(
-        self, api_version, endpoint=None, authenticate=False, method="GET", params=None, data=None, nonce_increment=0
+        self,
+        api_version,
+        endpoint=None,
+        authenticate=False,
+        method="GET",
+        params=None,
+        data=None,
+        raw=None,
+        nonce_increment=None,  # deprecated and ignored, nonces come from nonce_generator
     ):
         # Inspired by https://raw.githubusercontent.com/faberquisque/pyfinex/master/pyfinex/api.py
         # Handle requests for both v1 and v2 versions of the API with one wrapper
         # Why both, you ask? v2 has better data, but does not support write requests (only in v2 websockets API)
         # So we have to use v1 for anything that writes
+        request = self.prepare_brequest(api_version, endpoint, authenticate, method, params, data)
+        retries = 0
+        while True:
+            try:
+                return self.request(**request, raw=raw)
+            except ExchangeApiException as exc:
+                if not self.is_nonce_error(exc, retries):
+                    raise
+            retries += 1
 
+    async def abrequest(
+        self,
+        api_version,
+        endpoint=None,
+        authenticate=False,
+        method="GET",
+        params=None,
+        data=None,
+        raw=None,
+        nonce_increment=None,  # deprecated and ignored, nonces come from nonce_generator
+    ):
+        request = self.prepare_brequest(api_version, endpoint, authenticate, method, params, data)
+        retries = 0
+        while True:
+            try:
+                return await self.arequest(**request, raw=raw)
+            except ExchangeApiException as exc:
+                if not self.is_nonce_error(exc, retries):
+                    raise
+            retries += 1
+
+    def prepare_brequest(self, api_version, endpoint, authenticate, method, params, data):
         assert api_version in [1, 2]
         assert not endpoint.startswith("/v"), "endpoint should not be a full path, but the url after v1/v2"
 
-        base_url = "https://api.bitfinex.com"
+        base_url = self.BASE_URL
         if api_version == 2 and authenticate is False:
-            base_url = "https://api-pub.bitfinex.com"
+            base_url = self.PUBLIC_BASE_URL
 
         api_path = "/v%s/%s" % (api_version, endpoint)
         headers = self.DEFAULT_HEADERS.copy()
@@ -63,23 +273,28 @@ class BitfinexApi(BaseExchangeApi):
         # Required because data for the signature must match the data that is passed in the body as json, even if empty
         data = data or {}
 
-        if authenticate:
-            # Use the retry value to increment the nonce if needed
-            nonce = self.nonce(nonce_increment)
-            payload = self.generate_payload(api_version, api_path, nonce, data)
-            headers.update(self.auth_headers(self.key, self.secret, api_version, nonce, payload))
+        sign = partial(self.sign_request, api_version, api_path, data) if authenticate else None
 
         url = base_url + api_path
+        return dict(url=url, method=method, params=params, data=data, headers=headers, sign=sign)
 
-        try:
-            return self.request(url, method, params, data, headers)
-        except ExchangeApiException as exc:
-            if exc.message in ["nonce: small", "Nonce is too small."]:
-                if nonce_increment > 3:
-                    raise BitfinexNonceException(method, url, exc.status_code, exc.message)
-                return self.brequest(api_version, endpoint, authenticate, method, params, data, nonce_increment + 1)
-            else:
-                raise
+    def sign_request(self, api_version, api_path, data, headers, params):
+        nonce = self.nonce()
+        payload = self.generate_payload(api_version, api_path, nonce, data)
+        headers.update(self.auth_headers(self.key, self.secret, api_version, nonce, payload))
+        return headers, params
+
+    def is_nonce_error(self, exc, retries):
+        """True if the request should be sent again, signed with a fresh nonce: another request of this process may
+        have been signed after it but reached Bitfinex first. Raises BitfinexNonceException once it's been retried
+        NONCE_RETRIES times, then the larger nonce was used elsewhere (another process using the key without sharing
+        a FileNonceGenerator, or another scale) and retrying won't fix that"""
+        if exc.message not in ["nonce: small", "Nonce is too small."]:
+            return False
+        if retries >= self.NONCE_RETRIES:
+            raise BitfinexNonceException(exc.method, exc.url, exc.status_code, exc.message) from exc
+        logger.warning(f"Bitfinex nonce too small, signing {exc.url} again")
+        return True
 
     def generate_payload(self, api_version, api_path, nonce, data):
         """Return the header's payload based on version"""
@@ -113,10 +328,16 @@ class BitfinexApi(BaseExchangeApi):
             headers["bfx-signature"] = self.sign(secret, message)
         return headers
 
+    def retry_after(self, response):
+        retry_after = super().retry_after(response)
+        if retry_after is None and response.status_code == 429:
+            return self.RATE_LIMIT_BLOCK
+        return retry_after
+
     def parse_error_text(self, response):
         # Exchange-specific error handling
         try:
-            error_json = ujson.loads(response.content)
+            error_json = self.loads(response.content)
             # V1
             # {"message":"Nonce is too small."}
             if "message" in error_json:
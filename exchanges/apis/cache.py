@@ -0,0 +1,199 @@
+from concurrent.futures import Future
+from urllib.parse import urlencode, urlsplit
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from cachetools import LRUCache
+
+
+class ResponseCache:
+    """Cache of unauthenticated GET responses, set as `client.response_cache` (share one between clients).
+
+    ttls: {endpoint: seconds}, where endpoint is the end of the url path, ie. {"ticker/price": 1, "tickers": 2}.
+        Other endpoints are cached for default_ttl seconds, 0 (the default) to not cache them
+    maxsize: responses kept in memory, the least recently used are evicted first
+    backend: optional SqliteCacheBackend, to share responses with other processes on the host
+
+    Responses are keyed on the url and params, and kept as the raw body: each caller decodes its own copy, so
+    results can be changed freely. Concurrent requests for the same key share one in-flight request, the first
+    caller sends it and the others wait for its response (or its exception).
+    """
+
+    def __init__(self, ttls=None, default_ttl=0, maxsize=1024, backend=None):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.entries = LRUCache(maxsize=maxsize)  # key -> (monotonic expiry, content)
+        self.inflight = {}  # key -> Future, for blocking callers
+        self.ainflight = {}  # (loop, key) -> asyncio.Future, for coroutines
+        self.path_ttls = {}  # url path -> ttl, memoized matches of self.ttls
+        self.hits = self.misses = self.coalesced = 0
+
+    def ttl(self, url):
+        path = urlsplit(url).path
+        ttl = self.path_ttls.get(path)
+        if ttl is None:
+            matches = [endpoint for endpoint in self.ttls if path.endswith("/" + endpoint.strip("/"))]
+            # The most specific endpoint wins
+            ttl = self.ttls[max(matches, key=len)] if matches else self.default_ttl
+            self.path_ttls[path] = ttl
+        return ttl
+
+    @staticmethod
+    def key(url, params):
+        return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+    def cached(self, key):
+        """The content cached in memory for key, if still fresh. Call with the lock held"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def load(self, key):
+        """Content the backend has for key, kept in memory for as long as it has left there, or None"""
+        found = self.backend.get(key) if self.backend is not None else None
+        if found is None:
+            return None
+        content, expires = found
+        with self.lock:
+            self.entries[key] = (time.monotonic() + expires - time.time(), content)
+        return content
+
+    def store(self, key, content, ttl):
+        """Keep fetched content for ttl seconds, in memory and in the backend"""
+        if self.backend is not None:
+            self.backend.set(key, content, ttl)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, content)
+        return content
+
+    def get(self, url, params, fetch):
+        """Content of a GET, cached or from fetch() (which returns the body as bytes)"""
+        ttl = self.ttl(url)
+        if ttl <= 0:
+            return fetch()
+        key = self.key(url, params)
+        with self.lock:
+            content = self.cached(key)
+            if content is not None:
+                return content
+            pending = self.inflight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self.inflight[key] = future = Future()
+        if pending is not None:
+            return pending.result()
+
+        try:
+            content = self.load(key)
+            if content is None:
+                content = self.store(key, fetch(), ttl)
+            future.set_result(content)
+            return content
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    async def aget(self, url, params, fetch):
+        """get() for coroutines, fetch being a coroutine function"""
+        ttl = self.ttl(url)
+        if ttl <= 0:
+            return await fetch()
+        key = self.key(url, params)
+        # asyncio futures belong to a loop
+        inflight_key = (asyncio.get_running_loop(), key)
+        with self.lock:
+            content = self.cached(key)
+            if content is not None:
+                return content
+            pending = self.ainflight.get(inflight_key)
+            if pending is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self.ainflight[inflight_key] = future = asyncio.get_running_loop().create_future()
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        try:
+            content = self.load(key)
+            if content is None:
+                content = self.store(key, await fetch(), ttl)
+            future.set_result(content)
+            return content
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Only raised to the waiters, if any
+            future.exception()
+            raise
+        finally:
+            with self.lock:
+                del self.ainflight[inflight_key]
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "size": len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SqliteCacheBackend:
+    """Responses shared by the processes of a host through a SQLite file, ie.
+    ResponseCache(ttls, backend=SqliteCacheBackend("/dev/shm/exchanges-cache.db")) for a file kept in memory.
+    Each process still sends its own request on a miss, only the responses are shared"""
+
+    # Delete expired responses every this many writes
+    PURGE_INTERVAL = 100
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connection as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, content BLOB)")
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared between threads
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def get(self, key):
+        """(content, expiry as a unix time) of a response that hasn't expired, or None"""
+        row = self.connection.execute(
+            "SELECT content, expires FROM responses WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key, content, ttl):
+        now = time.time()
+        with self.connection as db:
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, now + ttl, content))
+            self.writes += 1
+            if self.writes % self.PURGE_INTERVAL == 0:
+                db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+
+    def close(self):
+        db = getattr(self.local, "db", None)
+        if db is not None:
+            db.close()
+            self.local.db = None
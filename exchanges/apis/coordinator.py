@@ -0,0 +1,259 @@
+"""Rate limits and nonces shared by the processes using the same keys, through a coordinator on a Unix socket.
+
+Run one coordinator per host, owning a rate limiter per key:
+
+    python -m exchanges.apis.coordinator /run/exchanges.sock binance-main=binance bitfinex-main=bitfinex
+
+and point the clients of every process at it:
+
+    BinanceApi.rate_limiter = CoordinatedRateLimiter("/run/exchanges.sock", "binance-main")
+    BitfinexApi.rate_limiter = CoordinatedRateLimiter("/run/exchanges.sock", "bitfinex-main")
+    BitfinexApi.nonce_generator = CoordinatedNonceGenerator("/run/exchanges.sock", "bitfinex-main")
+
+Each reservation and nonce is a round trip to the coordinator (tens of microseconds), waits are slept by the caller.
+"""
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from types import SimpleNamespace
+import json
+import os
+import socket
+import sys
+import threading
+import uuid
+
+from cachetools import LRUCache
+from loguru import logger
+from requests.structures import CaseInsensitiveDict
+
+from .nonce import NonceGenerator
+from .ratelimit import (
+    BinanceFuturesRateLimiter,
+    BinanceRateLimiter,
+    BitfinexRateLimiter,
+    KuCoinRateLimiter,
+    RateLimiter,
+)
+
+# Rate limiters the coordinator can be started with from the command line
+RATE_LIMITERS = {
+    "default": RateLimiter,
+    "binance": BinanceRateLimiter,
+    "binancefutures": BinanceFuturesRateLimiter,
+    "bitfinex": BitfinexRateLimiter,
+    "kucoin": KuCoinRateLimiter,
+}
+
+
+class CoordinatorError(Exception):
+    pass
+
+
+class CoordinatorHandler(StreamRequestHandler):
+    """One connection: a JSON request per line, answered by a JSON line (except updates, which aren't answered)"""
+
+    def setup(self):
+        super().setup()
+        with self.server.connections_lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.connection)
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            message = None
+            try:
+                message = json.loads(line)
+                reply = self.server.handle_message(message)
+            except Exception as exc:
+                # Including malformed lines, which shouldn't take the connection down
+                logger.warning(f"Coordinator could not handle {line!r}: {exc!r}")
+                reply = {"error": f"{type(exc).__name__}: {exc}"}
+            if not isinstance(message, dict) or message.get("op") != "update":
+                self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class CoordinatorServer(ThreadingUnixStreamServer):
+    """Owns a rate limiter per key (rate_limiters: {key: RateLimiter}) and a nonce generator per key, created as
+    nonces are asked for. Call serve_forever(), or use serve()"""
+
+    daemon_threads = True
+    # Replies kept by request id, for requests sent again after their reply was lost
+    REPLIES_KEPT = 10000
+
+    def __init__(self, path, rate_limiters):
+        self.rate_limiters = dict(rate_limiters)
+        self.nonce_generators = {}
+        self.nonce_lock = threading.Lock()
+        self.replies = LRUCache(maxsize=self.REPLIES_KEPT)  # request id -> reply
+        self.replies_lock = threading.Lock()
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        # A socket left by a coordinator that didn't shut down cleanly
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, CoordinatorHandler)
+
+    def rate_limiter(self, key):
+        rate_limiter = self.rate_limiters.get(key)
+        if rate_limiter is None:
+            raise CoordinatorError(f"No rate limiter for {key}")
+        return rate_limiter
+
+    def nonce_generator(self, key):
+        with self.nonce_lock:
+            if key not in self.nonce_generators:
+                self.nonce_generators[key] = NonceGenerator()
+            return self.nonce_generators[key]
+
+    def handle_message(self, message):
+        request_id = message.get("id")
+        if request_id is None:
+            return self.reply(message)
+        # A request sent again is answered as the first time, ie. a reservation isn't counted twice
+        with self.replies_lock:
+            if request_id not in self.replies:
+                self.replies[request_id] = self.reply(message)
+            return self.replies[request_id]
+
+    def reply(self, message):
+        op, key = message["op"], message["key"]
+        if op == "reserve":
+            return {"wait": self.rate_limiter(key).reserve(message["method"], message["url"], message["params"])}
+        if op == "update":
+            # What RateLimiter.update() reads of a response
+            response = SimpleNamespace(
+                headers=CaseInsensitiveDict(message["headers"]),
+                request=SimpleNamespace(method=message["method"], url=message["url"]),
+            )
+            self.rate_limiter(key).update(response)
+            return None
+        if op == "nonce":
+            return {"nonce": self.nonce_generator(key).next()}
+        if op == "stats":
+            return self.rate_limiter(key).stats()
+        raise CoordinatorError(f"Unknown operation {op}")
+
+    def server_close(self):
+        super().server_close()
+        # Clients reconnect to the next coordinator rather than talking to this one's leftover threads
+        with self.connections_lock:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:  # pragma: no cover
+                    pass
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class CoordinatorClient:
+    """Connection to a coordinator, one per thread (and reopened in forked processes)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self.local.socket, self.local.file, self.local.pid = sock, sock.makefile("rb"), os.getpid()
+        return self.local.socket, self.local.file
+
+    def disconnect(self):
+        if getattr(self.local, "pid", None) == os.getpid():
+            self.local.file.close()
+            self.local.socket.close()
+        self.local.pid = None
+
+    def send(self, message, reply=True):
+        """Reply of the coordinator to message. A message whose reply is lost (ie. the coordinator restarted) is sent
+        once more, and handled again unless it has an "id", which the coordinator answers with the first reply"""
+        line = json.dumps(message, default=str).encode() + b"\n"
+        # Once more on a new connection if the coordinator was restarted
+        for attempt in range(2):
+            try:
+                sock, file = self.connection()
+                sock.sendall(line)
+                if not reply:
+                    return None
+                response = file.readline()
+                if response:
+                    break
+                raise ConnectionResetError("Coordinator closed the connection")
+            except OSError as exc:
+                self.disconnect()
+                if attempt:
+                    raise CoordinatorError(f"Coordinator at {self.path} unavailable: {exc}") from exc
+        response = json.loads(response)
+        if "error" in response:
+            raise CoordinatorError(response["error"])
+        return response
+
+    def close(self):
+        self.disconnect()
+
+
+class CoordinatedRateLimiter(RateLimiter):
+    """RateLimiter whose buckets are the coordinator's rate limiter for key, shared with every process using it"""
+
+    def __init__(self, path, key):
+        super().__init__()
+        self.key = key
+        self.client = CoordinatorClient(path)
+
+    def reserve(self, method, url, params=None):
+        message = {"op": "reserve", "key": self.key, "method": method, "url": url, "params": params}
+        # Reserved once even if sent again
+        message["id"] = uuid.uuid4().hex
+        wait = self.client.send(message)["wait"]
+        self.record(method, url, wait)
+        return wait
+
+    def update(self, response):
+        request = response.request
+        self.client.send(
+            {
+                "op": "update",
+                "key": self.key,
+                "method": request.method,
+                "url": str(request.url),
+                "headers": dict(response.headers),
+            },
+            reply=False,
+        )
+
+    def shared_stats(self):
+        """stats() of the coordinator's rate limiter, for every process"""
+        return self.client.send({"op": "stats", "key": self.key})
+
+
+class CoordinatedNonceGenerator:
+    """Nonces for key from the coordinator, increasing across every process using it"""
+
+    def __init__(self, path, key):
+        self.key = key
+        self.client = CoordinatorClient(path)
+
+    def next(self):
+        return self.client.send({"op": "nonce", "key": self.key})["nonce"]
+
+    def close(self):
+        self.client.close()
+
+
+def serve(path, rate_limiters):
+    server = CoordinatorServer(path, rate_limiters)
+    logger.info(f"Coordinating {', '.join(server.rate_limiters) or 'nonces'} on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    # coordinator.py SOCKET_PATH [KEY=RATE_LIMITER ...], RATE_LIMITER one of RATE_LIMITERS
+    serve(sys.argv[1], {key: RATE_LIMITERS[name]() for key, name in (arg.split("=") for arg in sys.argv[2:])})
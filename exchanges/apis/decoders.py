@@ -0,0 +1,33 @@
+from decimal import Decimal as D
+from functools import lru_cache, partial
+import json
+
+import ujson
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Backends taking bytes or str. Only decoding is pluggable: request bodies and the payloads Bitfinex signs are
+# always encoded with json.dumps, as the signature is computed over those exact bytes
+DECODERS = ["json", "ujson", "orjson"]
+
+
+@lru_cache(maxsize=None)
+def json_decoder(name="json", decimals=False):
+    """loads() of a backend, see BaseExchangeApi.JSON_DECODER. With decimals, numbers with a fraction or exponent
+    are parsed to Decimal from their text, rather than to a float first (only the json backend can). Prices sent as
+    strings (ie. Binance) are left as str, so decimals only matter for venues sending numbers, like Bitfinex"""
+    assert name in DECODERS, f"Unknown JSON decoder {name}, one of {DECODERS}"
+    if decimals:
+        if name != "json":
+            raise ValueError(f"The {name} decoder can't parse numbers to Decimal, use json")
+        return partial(json.loads, parse_float=D)
+    if name == "orjson":
+        if orjson is None:  # pragma: no cover
+            raise ImportError("orjson is required for the orjson decoder: pip install exchanges[orjson]")
+        return orjson.loads
+    if name == "ujson":
+        return ujson.loads
+    return json.loads
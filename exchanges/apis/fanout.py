@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+from loguru import logger
+
+
+class FanOutResult:
+    """Outcome of a fan out: {key: result} for the calls that succeeded and {key: exception} for the ones that
+    failed, with the wall time of the whole batch and the sum of the time each call took (ie. run serially)"""
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.wall_time = 0.0
+        self.serial_time = 0.0
+
+    @property
+    def speedup(self):
+        return self.serial_time / self.wall_time if self.wall_time else 1.0
+
+    def __repr__(self):
+        return (
+            f"<FanOutResult {len(self.results)} ok, {len(self.errors)} failed, "
+            f"{self.wall_time:.2f}s wall, {self.serial_time:.2f}s serial>"
+        )
+
+    def add(self, key, value, error, elapsed):
+        if error is None:
+            self.results[key] = value
+        else:
+            logger.warning(f"Fan out call {key} failed: {error}")
+            self.errors[key] = error
+        self.serial_time += elapsed
+
+
+def timed_call(fn, kwargs):
+    """(result, exception, seconds) of fn(**kwargs)"""
+    start = time.perf_counter()
+    try:
+        return fn(**kwargs), None, time.perf_counter() - start
+    except Exception as exc:
+        return None, exc, time.perf_counter() - start
+
+
+def fan_out(fn, calls, max_workers):
+    """Call fn(**kwargs) for each {key: kwargs} of calls on a thread pool"""
+    result = FanOutResult()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fan-out") as executor:
+        futures = {key: executor.submit(timed_call, fn, kwargs) for key, kwargs in calls.items()}
+        for key, future in futures.items():
+            result.add(key, *future.result())
+    result.wall_time = time.perf_counter() - start
+    return result
+
+
+async def afan_out(fn, calls, concurrency):
+    """Await fn(**kwargs) for each {key: kwargs} of calls, at most `concurrency` at a time"""
+    result = FanOutResult()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(key, kwargs):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result.add(key, await fn(**kwargs), None, time.perf_counter() - start)
+            except Exception as exc:
+                result.add(key, None, exc, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(key, kwargs) for key, kwargs in calls.items()))
+    result.wall_time = time.perf_counter() - start
+    return result
@@ -0,0 +1,171 @@
+from decimal import Decimal as D
+import json
+import sqlite3
+import threading
+
+from loguru import logger
+import arrow
+
+from .base import milliseconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    exchange TEXT NOT NULL,
+    account TEXT NOT NULL,
+    pair TEXT NOT NULL,
+    exchange_txn_id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (exchange, account, pair, exchange_txn_id)
+);
+CREATE INDEX IF NOT EXISTS trades_time ON trades (exchange, account, time);
+CREATE TABLE IF NOT EXISTS cursors (
+    exchange TEXT NOT NULL,
+    account TEXT NOT NULL,
+    synced_until INTEGER,
+    run_since INTEGER,
+    run_until INTEGER,
+    checkpoint INTEGER,
+    PRIMARY KEY (exchange, account)
+);
+"""
+
+DECIMAL_FIELDS = ["amount", "price", "fees"]
+
+
+def dump_record(record):
+    return json.dumps({**record, "time": milliseconds(record["time"])}, default=str)
+
+
+def load_record(text):
+    record = json.loads(text)
+    record["time"] = arrow.get(record["time"] / 1000)
+    for field in DECIMAL_FIELDS:
+        record[field] = D(record[field])
+    return record
+
+
+class TradeHistorySync:
+    """Incremental copy of an account's normalized trade history (see BaseExchangeApi.get_trade_history) in SQLite.
+
+    Each sync() only asks the exchange for trades since the end of the previous sync (less `overlap` seconds, for
+    trades the exchange reports late), and stores the ones it doesn't have yet. Trades are unique per exchange,
+    account, pair and exchange_txn_id (Binance trade ids are only unique per symbol).
+
+    Trades are committed `batch_size` at a time. If a sync is interrupted, the next one fetches the same time
+    window again, starting after the last stored trade when the client yields trades in order
+    (TRADE_HISTORY_ORDERED), and skipping the ones already stored.
+
+    history_kwargs are passed on to iter_trade_history, ie. symbols=[...] for Binance.
+    """
+
+    def __init__(self, client, exchange, account, path, batch_size=500, overlap=300, **history_kwargs):
+        self.client = client
+        self.exchange = exchange
+        self.account = account
+        self.batch_size = batch_size
+        self.overlap = overlap
+        self.history_kwargs = history_kwargs
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.executescript(SCHEMA)
+            self.db.execute(
+                "INSERT OR IGNORE INTO cursors (exchange, account) VALUES (?, ?)", (self.exchange, self.account)
+            )
+
+    def cursor(self):
+        """{"synced_until", "run_since", "run_until", "checkpoint"}, in epoch milliseconds. run_* are set while a
+        sync is running, or if one was interrupted"""
+        row = self.db.execute(
+            "SELECT synced_until, run_since, run_until, checkpoint FROM cursors WHERE exchange = ? AND account = ?",
+            (self.exchange, self.account),
+        ).fetchone()
+        return dict(zip(["synced_until", "run_since", "run_until", "checkpoint"], row))
+
+    def sync(self, until=None):
+        """Fetch and store the trades since the last sync. Returns how many new trades were stored"""
+        with self.lock:
+            since, until = self.start_run(until)
+            logger.info(f"Syncing {self.exchange} {self.account} trades from {since} to {until}")
+            added = 0
+            batch = []
+            for record in self.client.iter_trade_history(
+                since=None if since is None else arrow.get(since / 1000),
+                until=arrow.get(until / 1000),
+                **self.history_kwargs,
+            ):
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    added += self.store(batch)
+                    batch = []
+            added += self.store(batch)
+
+            with self.db:
+                self.db.execute(
+                    "UPDATE cursors SET synced_until = ?, run_since = NULL, run_until = NULL, checkpoint = NULL"
+                    " WHERE exchange = ? AND account = ?",
+                    (until, self.exchange, self.account),
+                )
+            logger.info(f"Synced {added} new {self.exchange} {self.account} trades")
+            return added
+
+    def start_run(self, until):
+        cursor = self.cursor()
+        if cursor["run_until"] is not None:
+            # The previous sync was interrupted, finish its window first
+            since = cursor["run_since"]
+            if self.client.TRADE_HISTORY_ORDERED and cursor["checkpoint"] is not None:
+                since = cursor["checkpoint"]
+            logger.info(f"Resuming interrupted {self.exchange} {self.account} trade sync")
+            return since, cursor["run_until"]
+
+        since = None
+        if cursor["synced_until"] is not None:
+            since = cursor["synced_until"] - self.overlap * 1000
+        until = milliseconds(until or arrow.utcnow())
+        with self.db:
+            self.db.execute(
+                "UPDATE cursors SET run_since = ?, run_until = ?, checkpoint = NULL WHERE exchange = ? AND account = ?",
+                (since, until, self.exchange, self.account),
+            )
+        return since, until
+
+    def store(self, records):
+        """Insert the trades not stored yet and move the checkpoint, in one transaction. Returns the number inserted"""
+        if not records:
+            return 0
+        rows = [
+            (
+                self.exchange,
+                self.account,
+                f"{record['trade_curr']}/{record['stake_curr']}",
+                record["exchange_txn_id"],
+                milliseconds(record["time"]),
+                dump_record(record),
+            )
+            for record in records
+        ]
+        with self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO trades (exchange, account, pair, exchange_txn_id, time, record)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = self.db.total_changes - before
+            self.db.execute(
+                "UPDATE cursors SET checkpoint = ? WHERE exchange = ? AND account = ?",
+                (rows[-1][4], self.exchange, self.account),
+            )
+        return added
+
+    def trades(self, since=None, until=None):
+        """Stored trades between since and until, oldest first"""
+        query = "SELECT record FROM trades WHERE exchange = ? AND account = ? AND time >= ? AND time < ? ORDER BY time"
+        bounds = (milliseconds(since) if since else 0, milliseconds(until) if until else 2**62)
+        for (text,) in self.db.execute(query, (self.exchange, self.account, *bounds)):
+            yield load_record(text)
+
+    def close(self):
+        self.db.close()
@@ -1,20 +1,199 @@
+from decimal import Decimal as D
+from functools import partial
 from typing import Dict
+from urllib.parse import urlencode
 import base64
 import hashlib
 import hmac
 import json
 import time
 
-from .base import BaseExchangeApi, ExchangeApiException
+import arrow
 
+from .aio import AsyncBaseExchangeApi
+from .base import ExchangeApiException, milliseconds
+from .marketdata import (
+    INTERVALS,
+    Candle,
+    OrderBookSnapshot,
+    Ticker,
+    candle_range,
+    decimal,
+    interval_name,
+    levels,
+    rounded_depth,
+)
+from .metadata import metadata_cache
 
-class KuCoinApi(BaseExchangeApi):
+
+class KuCoinApi(AsyncBaseExchangeApi):
     api_prefix = "api"
+    BASE_URL = "https://api.kucoin.com"
+    TRADES_PAGE_SIZE = 500
+    TRADE_HISTORY_ORDERED = True
+    # startAt / endAt can't be more than 7 days apart
+    TRADES_WINDOW = 7 * 24 * 60 * 60 * 1000
+    # Default start of the trade history, when KuCoin launched
+    HISTORY_START = "2017-09-01"
+    # Partial books served without authentication
+    BOOK_DEPTHS = [20, 100]
+    CANDLE_INTERVALS = {
+        "1m": "1min",
+        "5m": "5min",
+        "15m": "15min",
+        "30m": "30min",
+        "1h": "1hour",
+        "4h": "4hour",
+        "6h": "6hour",
+        "12h": "12hour",
+        "1d": "1day",
+        "1w": "1week",
+    }
+    CANDLES_PAGE_SIZE = 1500
 
     def __init__(self, passphrase=None, key=None, secret=None):
         self.passphrase = passphrase
         super().__init__(key=key, secret=secret)
 
+    def get_symbol(self, stake_currency, trade_currency):
+        return self.make_symbol(f"{trade_currency}/{stake_currency}")
+
+    def get_pair(self, symbol):
+        return self.unmake_symbol(symbol)
+
+    def unmake_symbol(self, symbol):
+        # BTC-USDT -> BTC/USDT
+        return symbol.replace("-", "/", 1)
+
+    def make_symbol(self, symbol):
+        # BTC/USDT -> BTC-USDT
+        return symbol.replace("/", "-", 1)
+
+    def unmake_symbols(self, symbols):
+        return [symbol.replace("-", "/", 1) for symbol in symbols]
+
+    def make_symbols(self, symbols):
+        return [symbol.replace("/", "-", 1) for symbol in symbols]
+
+    def pull_symbols(self):
+        return self.brequest(2, "symbols")["data"]
+
+    @property
+    def symbol_index(self):
+        """{symbol: symbol info} for every trading pair, ie. BTC-USDT, shared by every client and refreshed in the
+        background"""
+        cache = metadata_cache("kucoin_symbols", transform=lambda symbols: {info["symbol"]: info for info in symbols})
+        return cache.get(self.pull_symbols)
+
+    def get_balances(self):
+        # Summed over the main, trade and margin accounts
+        balances = {}
+        for account in self.brequest(1, "accounts", authenticate=True)["data"]:
+            total = D(account["balance"])
+            if not total:
+                continue
+            balance = balances.setdefault(account["currency"], {"total": D(0), "available": D(0)})
+            balance["total"] += total
+            balance["available"] += D(account["available"])
+        return balances
+
+    def iter_trade_history(self, since=None, until=None):
+        # Oldest first. Fills are listed one week at a time, newest first, so each week is read from its last page
+        start = milliseconds(since or self.HISTORY_START)
+        end = milliseconds(until or arrow.utcnow())
+        for window_start in range(start, end, self.TRADES_WINDOW):
+            window_end = min(window_start + self.TRADES_WINDOW, end)
+            first_page = self.fills_page(window_start, window_end, 1)
+            for page in range(first_page["totalPage"], 1, -1):
+                for fill in reversed(self.fills_page(window_start, window_end, page)["items"]):
+                    yield self.normalize_trade(fill)
+            for fill in reversed(first_page["items"]):
+                yield self.normalize_trade(fill)
+
+    def fills_page(self, start, end, page):
+        params = {
+            "tradeType": "TRADE",
+            "startAt": start,
+            "endAt": end - 1,
+            "currentPage": page,
+            "pageSize": self.TRADES_PAGE_SIZE,
+        }
+        return self.brequest(1, "fills", authenticate=True, params=params)["data"]
+
+    def normalize_trade(self, fill):
+        trade_curr, stake_curr = self.unmake_symbol(fill["symbol"]).split("/")
+        price = D(fill["price"])
+        fees = D(fill["fee"])
+        if fill["feeCurrency"] == trade_curr:
+            fees *= price
+        record = {
+            "exchange_txn_id": str(fill["tradeId"]),
+            "time": arrow.get(fill["createdAt"] / 1000),
+            "action": fill["side"],
+            "stake_curr": stake_curr,
+            "trade_curr": trade_curr,
+            "amount": D(fill["size"]),
+            "price": price,
+            "fees": fees,
+        }
+        if fill["feeCurrency"] not in (trade_curr, stake_curr):
+            record["fee_curr"] = fill["feeCurrency"]
+        return record
+
+    def get_ticker(self, symbol):
+        stats = self.brequest(1, "market/stats", params={"symbol": self.make_symbol(symbol)})["data"]
+        return self.normalize_ticker(stats, stats["time"])
+
+    def get_tickers(self, symbols=None):
+        # Every symbol in one request, whichever are asked for
+        data = self.brequest(1, "market/allTickers")["data"]
+        wanted = set(self.make_symbols(symbols)) if symbols else None
+        return {
+            self.unmake_symbol(ticker["symbol"]): self.normalize_ticker(ticker, data["time"])
+            for ticker in data["ticker"]
+            if wanted is None or ticker["symbol"] in wanted
+        }
+
+    def normalize_ticker(self, ticker, time):
+        # Symbols without trades have null prices
+        return Ticker(
+            self.unmake_symbol(ticker["symbol"]),
+            decimal(ticker["buy"]),
+            decimal(ticker["sell"]),
+            decimal(ticker["last"]),
+            decimal(ticker["vol"]),
+            time,
+        )
+
+    def get_order_book(self, symbol, depth=100):
+        endpoint = f"market/orderbook/level2_{rounded_depth(depth, self.BOOK_DEPTHS)}"
+        book = self.brequest(1, endpoint, params={"symbol": self.make_symbol(symbol)})["data"]
+        return OrderBookSnapshot(
+            symbol, levels(book["bids"], depth), levels(book["asks"], depth), int(book["sequence"]), book["time"]
+        )
+
+    def get_candles(self, symbol, interval="1m", start=None, end=None):
+        params = {"symbol": self.make_symbol(symbol), "type": interval_name(interval, self.CANDLE_INTERVALS)}
+        start = milliseconds(start) // 1000 if start else None
+        end = milliseconds(end) // 1000 if end else None
+        if start is None:
+            windows = [(None, end)]
+        else:
+            # Up to CANDLES_PAGE_SIZE candles a request, so one request per that many intervals
+            window = self.CANDLES_PAGE_SIZE * INTERVALS[interval]
+            stop = end or milliseconds(arrow.utcnow()) // 1000
+            windows = [(at, min(at + window, stop)) for at in range(start, stop, window)]
+        candles = []
+        for window_start, window_end in windows:
+            if window_start is not None:
+                params["startAt"] = window_start
+            if window_end is not None:
+                params["endAt"] = window_end
+            # [[start (seconds), open, close, high, low, volume, turnover], ...], newest first
+            for c in self.brequest(1, "market/candles", params=params)["data"]:
+                candles.append(Candle(int(c[0]) * 1000, D(c[1]), D(c[3]), D(c[4]), D(c[2]), D(c[5])))
+        return candle_range(candles, start and start * 1000, end and end * 1000)
+
     def brequest(
         self,
         api_version,
@@ -23,27 +202,59 @@ class KuCoinApi(BaseExchangeApi):
         method="GET",
         params=None,
         data={},
+        raw=None,
+    ):
+        return self.request(**self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw)
+
+    async def abrequest(
+        self,
+        api_version,
+        endpoint=None,
+        authenticate=False,
+        method="GET",
+        params=None,
+        data={},
+        raw=None,
     ):
+        return await self.arequest(
+            **self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw
+        )
+
+    def prepare_brequest(self, api_version, endpoint, authenticate, method, params, data):
         assert not endpoint.startswith(
             (f"/{self.api_prefix}", f"{self.api_prefix}")
         ), "endpoint should not be a full path, but the url after api/v1/"
 
-        base_url = "https://api.kucoin.com"
         api_path = f"/{self.api_prefix}/v{api_version}/{endpoint}"
         headers = self.DEFAULT_HEADERS.copy()
 
-        if authenticate:
-            headers.update(self.auth_headers(api_version, method, api_path, data))
+        sign = partial(self.sign_request, api_version, method, api_path, data) if authenticate else None
+
+        url = self.BASE_URL + api_path
+        return dict(url=url, method=method, params=params, data=data, headers=headers, sign=sign)
 
-        url = base_url + api_path
+    def sign_request(self, api_version, method, api_path, data, headers, params):
+        if params:
+            # The query string is part of the signed path, encode it once so what is sent matches
+            params = urlencode(params, doseq=True)
+            api_path = f"{api_path}?{params}"
+        headers.update(self.auth_headers(api_version, method, api_path, data))
+        return headers, params
 
-        return self.request(url, method, params, data, headers)
+    def retry_after(self, response):
+        # gw-ratelimit-reset is the number of milliseconds until the resource pool is refilled
+        reset = response.headers.get("gw-ratelimit-reset")
+        if response.status_code == 429 and reset:
+            return int(reset) / 1000
+        return super().retry_after(response)
 
     def auth_headers(self, api_version: int, method: str, api_path: str, payload: Dict):
         """Refer to https://docs.kucoin.com/#authentication for more details"""
         assert api_version in [1]
         now = int(time.time() * 1000)
-        str_to_sign = str(now) + method.upper() + api_path + json.dumps(payload)
+        # Empty data isn't sent, so there's no body to sign (ie. GET)
+        body = json.dumps(payload) if payload else ""
+        str_to_sign = str(now) + method.upper() + api_path + body
         signature = base64.b64encode(
             hmac.new(self.secret.encode("utf-8"), str_to_sign.encode("utf-8"), hashlib.sha256).digest()
         )
@@ -0,0 +1,86 @@
+from urllib.parse import parse_qsl, urlencode
+import itertools
+
+from loguru import logger
+
+REDACTED = "<redacted>"
+# Header and parameter names containing any of these (case-insensitive) are redacted: api keys, signatures,
+# passphrases and signed payloads (X-MBX-APIKEY, bfx-signature, KC-API-SIGN, X-BFX-PAYLOAD, signature, ...)
+SENSITIVE = ["key", "sign", "secret", "passphrase", "payload", "authorization", "token"]
+
+
+class RequestLog:
+    """Debug lines of the requests and responses of clients, see BaseExchangeApi.request_log.
+
+    Nothing is formatted unless a loguru handler takes DEBUG: messages are built lazily, by loguru, once a handler
+    takes them, so with DEBUG off a line costs a call into loguru. When on, credentials are redacted, long params
+    are truncated to max_length, and only one in `sample_every` requests (and responses) is logged, ie.
+
+        BaseExchangeApi.request_log = RequestLog(sample_every=100)
+
+    loguru has no public way to tell whether DEBUG is taken, so clients that never log requests turn it off with
+    `enabled=False` (or set `enabled` later), which skips everything but the check.
+    """
+
+    def __init__(self, sample_every=1, sensitive=SENSITIVE, max_length=500, enabled=True):
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.sensitive = tuple(name.lower() for name in sensitive)
+        self.max_length = max_length
+        self.request_count = itertools.count()
+        self.response_count = itertools.count()
+        # Reported at the caller's line rather than here
+        self.logger = logger.opt(lazy=True, depth=1)
+
+    def sampled(self, counter):
+        return self.sample_every == 1 or next(counter) % self.sample_every == 0
+
+    def redact(self, values):
+        if not isinstance(values, dict):
+            return values
+        return {
+            name: REDACTED if any(word in str(name).lower() for word in self.sensitive) else value
+            for name, value in values.items()
+        }
+
+    def redact_url(self, url):
+        # Signed query strings, ie. Binance's &signature=
+        path, _, query = url.partition("?")
+        if not query:
+            return url
+        return f"{path}?{urlencode(self.redact(dict(parse_qsl(query))), safe='<>')}"
+
+    def truncate(self, text):
+        if len(text) > self.max_length:
+            return f"{text[:self.max_length]}... ({len(text)} characters)"
+        return text
+
+    def request(self, method, url, params, data, headers):
+        if self.enabled and self.sampled(self.request_count):
+            self.logger.debug("{}", lambda: self.format_request(method, url, params, data, headers))
+
+    def format_request(self, method, url, params, data, headers):
+        message = f"Requesting {method} {url} with {self.truncate(str(self.redact(params or data)))}"
+        if headers:
+            message += f", headers {self.redact(headers)}"
+        return message
+
+    def response(self, response):
+        if self.enabled and self.sampled(self.response_count):
+            url = response.request.url
+            self.logger.debug(
+                "Request to {} took {:.2f}s", lambda: self.redact_url(url), response.elapsed.total_seconds
+            )
+
+    def error(self, request_headers, response_headers):
+        """Headers of a request that failed, not sampled"""
+        if not self.enabled:
+            return
+        self.logger.debug(
+            "Request headers: {}, response headers: {}",
+            lambda: self.redact(dict(request_headers)),
+            lambda: dict(response_headers),
+        )
+
+
+request_log = RequestLog()
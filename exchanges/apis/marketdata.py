@@ -0,0 +1,74 @@
+"""Records of the normalized market data methods (get_ticker(s), get_order_book, get_candles). Prices and sizes are
+Decimal, times epoch milliseconds (int), and symbols pairs, ie. BTC/USDT"""
+from decimal import Decimal as D
+from typing import List, NamedTuple, Optional, Tuple
+
+# Candle intervals every exchange is asked for, and their length in seconds
+INTERVALS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "15m": 15 * 60,
+    "30m": 30 * 60,
+    "1h": 60 * 60,
+    "4h": 4 * 60 * 60,
+    "6h": 6 * 60 * 60,
+    "12h": 12 * 60 * 60,
+    "1d": 24 * 60 * 60,
+    "1w": 7 * 24 * 60 * 60,
+}
+
+
+class Ticker(NamedTuple):
+    symbol: str
+    bid: Optional[D]
+    ask: Optional[D]
+    last: Optional[D]
+    volume: Optional[D]  # of the base currency, over the last 24 hours
+    time: Optional[int]  # when the exchange has it
+
+
+class OrderBookSnapshot(NamedTuple):
+    symbol: str
+    bids: List[Tuple[D, D]]  # (price, size), best first
+    asks: List[Tuple[D, D]]
+    sequence: Optional[int]  # to continue from with orderbook.py, when the exchange numbers updates
+    time: Optional[int]
+
+
+class Candle(NamedTuple):
+    time: int  # start of the interval
+    open: D
+    high: D
+    low: D
+    close: D
+    volume: D
+
+
+def decimal(value):
+    """Decimal of a number or numeric string, None for None or an empty string. Floats go through their text, so
+    0.1 is Decimal("0.1")"""
+    if value is None or value == "":
+        return None
+    return D(value) if isinstance(value, str) else D(str(value))
+
+
+def levels(entries, depth=None):
+    """(price, size) of the first depth entries of a side, from [price, size, ...] lists"""
+    return [(decimal(entry[0]), decimal(entry[1])) for entry in entries[:depth]]
+
+
+def rounded_depth(depth, depths):
+    """The smallest of the depths an exchange serves covering depth, or its largest"""
+    return next((served for served in depths if served >= depth), depths[-1])
+
+
+def interval_name(interval, names):
+    """The exchange's name for an interval, from {interval: name}"""
+    assert interval in names, f"Interval {interval} not supported, one of {list(names)}"
+    return names[interval]
+
+
+def candle_range(candles, start, end):
+    """Candles sorted by time, without duplicates (pages overlap) or candles outside [start, end)"""
+    unique = {candle.time: candle for candle in candles}
+    return [unique[time] for time in sorted(unique) if (start is None or time >= start) and (end is None or time < end)]
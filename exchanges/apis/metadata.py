@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+
+def snapshot_dir():
+    return os.environ.get("EXCHANGES_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "exchanges")
+
+
+class MetadataCache:
+    """Exchange metadata (ie. symbol lists) with stale-while-revalidate refreshes and a disk snapshot.
+
+    get(loader) returns the cached value, and once it is older than `ttl` seconds keeps returning it while a
+    background thread calls `loader` for a new one. Only the very first load of a process without a snapshot
+    blocks. Every successful load is written to `<snapshot dir>/<name>.json` (see EXCHANGES_CACHE_DIR), which is
+    what a cold start serves from. `transform` turns the raw, JSON-serializable value into what get() returns.
+    """
+
+    # Wait this long before trying again after a failed refresh
+    RETRY_INTERVAL = 30
+
+    def __init__(self, name, ttl=300, transform=None):
+        self.name = name
+        self.ttl = ttl
+        self.transform = transform or (lambda value: value)
+        self.lock = threading.Lock()
+        self.value = None
+        self.fetched_at = None  # epoch seconds, so snapshots can be aged across restarts
+        self.next_refresh = 0
+        self.refreshing = False
+
+    @property
+    def path(self):
+        return os.path.join(snapshot_dir(), f"{self.name}.json")
+
+    def get(self, loader):
+        with self.lock:
+            if self.value is None:
+                self.load_snapshot()
+            if self.value is None:
+                # Nothing to serve yet, load synchronously (other callers wait for this one)
+                self.store(loader())
+                return self.value
+
+            now = time.time()
+            if now - self.fetched_at > self.ttl and now >= self.next_refresh and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(target=self.refresh, args=(loader,), name=f"refresh-{self.name}", daemon=True).start()
+            return self.value
+
+    def refresh(self, loader):
+        try:
+            raw = loader()
+        except Exception as exc:
+            logger.warning(f"Refreshing {self.name} failed, serving the cached copy: {exc}")
+            with self.lock:
+                self.next_refresh = time.time() + self.RETRY_INTERVAL
+                self.refreshing = False
+            return
+        with self.lock:
+            self.store(raw)
+            self.refreshing = False
+
+    def store(self, raw, fetched_at=None, save=True):
+        self.value = self.transform(raw)
+        self.fetched_at = fetched_at or time.time()
+        if save:
+            self.save_snapshot(raw)
+
+    def load_snapshot(self):
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+            self.store(snapshot["data"], fetched_at=snapshot["fetched_at"], save=False)
+            logger.debug(f"Loaded {self.name} snapshot from {self.path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.warning(f"Ignoring unreadable {self.name} snapshot {self.path}: {exc}")
+
+    def save_snapshot(self, raw):
+        path = self.path
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"fetched_at": self.fetched_at, "data": raw}, f)
+            # Atomic, so other processes never read a partial snapshot
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning(f"Could not write {self.name} snapshot to {path}: {exc}")
+
+    def clear(self):
+        with self.lock:
+            self.value = self.fetched_at = None
+            self.next_refresh = 0
+
+
+METADATA_CACHES = {}
+METADATA_CACHES_LOCK = threading.Lock()
+
+
+def metadata_cache(name, ttl=300, transform=None):
+    """The process-wide MetadataCache called `name`, created on first use"""
+    with METADATA_CACHES_LOCK:
+        if name not in METADATA_CACHES:
+            METADATA_CACHES[name] = MetadataCache(name, ttl=ttl, transform=transform)
+        return METADATA_CACHES[name]
@@ -0,0 +1,162 @@
+from bisect import bisect_left
+import socket
+import threading
+
+from loguru import logger
+
+# Upper bounds (seconds) of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def status_class(status_code):
+    """The status class, ie. "2xx", or "error" when there was no response (timeout, connection error)"""
+    return f"{status_code // 100}xx" if status_code else "error"
+
+
+class MetricsSink:
+    """Receives the measurements of requests when set as `client.metrics` (share one between clients).
+
+    Tags are a dict, with the exchange, endpoint (the url path) and method of every request, and the status class
+    once there's a response. Measurements:
+        request_seconds: time to send the request and read the response (headers only when streamed), by status
+        decode_seconds: time to decode the JSON response
+        rate_limit_wait_seconds: time waited for the rate limiter and backoff before sending, when there was a wait
+        retries_total: requests sent again, by reason ("status" retried by urllib3, "rate_limit" by the backoff)
+        sent_bytes_total, received_bytes_total: request and response bodies
+    """
+
+    def increment(self, name, value, tags):  # pragma: no cover
+        raise NotImplementedError
+
+    def observe(self, name, value, tags):  # pragma: no cover
+        raise NotImplementedError
+
+
+class InMemoryMetrics(MetricsSink):
+    """Counters and histograms kept in this process, ie. to check where the time goes:
+
+    metrics.histogram("request_seconds", exchange="binance") -> (count, sum)
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, tags) -> value
+        self.histograms = {}  # (name, tags) -> [count per bucket (and one above the last), sum]
+
+    def increment(self, name, value, tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+
+    @staticmethod
+    def matches(key_tags, tags):
+        key_tags = dict(key_tags)
+        return all(key_tags.get(name) == value for name, value in tags.items())
+
+    def counter(self, name, **tags):
+        """Sum of a counter over every series matching the tags"""
+        with self.lock:
+            return sum(
+                value
+                for (key, key_tags), value in self.counters.items()
+                if key == name and self.matches(key_tags, tags)
+            )
+
+    def histogram(self, name, **tags):
+        """(count, sum) of a histogram over every series matching the tags"""
+        count, total = 0, 0.0
+        with self.lock:
+            for (key, key_tags), (counts, value) in self.histograms.items():
+                if key == name and self.matches(key_tags, tags):
+                    count += sum(counts)
+                    total += value
+        return count, total
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    """InMemoryMetrics rendered in the Prometheus text format by render(), ie. for a /metrics handler"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix="exchanges_"):
+        super().__init__(buckets)
+        self.prefix = prefix
+
+    @staticmethod
+    def labels(tags, **extra):
+        tags = {**dict(tags), **extra}
+        if not tags:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in tags.values())
+        return "{" + ",".join(f'{name}="{value}"' for name, value in zip(tags, escaped)) + "}"
+
+    def render(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(counts), total)) for key, (counts, total) in self.histograms.items())
+
+        lines = []
+        typed = set()
+        for (name, tags), value in counters:
+            name = self.prefix + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self.labels(tags)} {value}")
+        for (name, tags), (counts, total) in histograms:
+            name = self.prefix + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self.labels(tags, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{self.labels(tags)} {total}")
+            lines.append(f"{name}_count{self.labels(tags)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class StatsdMetrics(MetricsSink):
+    """Sends every measurement to a StatsD agent over UDP, with DogStatsD tags (understood by Datadog, Telegraf and
+    the Prometheus statsd_exporter). Seconds are sent as timings in milliseconds"""
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="exchanges."):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    @staticmethod
+    def format_tags(tags):
+        return ",".join(f"{name}:{value}" for name, value in tags.items())
+
+    def send(self, line):
+        try:
+            self.socket.sendto(line.encode(), self.address)
+        except OSError as exc:
+            logger.debug(f"Could not send metrics to {self.address}: {exc}")
+
+    def increment(self, name, value, tags):
+        self.send(f"{self.prefix}{name}:{value}|c|#{self.format_tags(tags)}")
+
+    def observe(self, name, value, tags):
+        if name.endswith("_seconds"):
+            self.send(f"{self.prefix}{name[:-len('_seconds')]}:{value * 1000:.3f}|ms|#{self.format_tags(tags)}")
+        else:
+            self.send(f"{self.prefix}{name}:{value}|h|#{self.format_tags(tags)}")
+
+    def close(self):
+        self.socket.close()
@@ -0,0 +1,138 @@
+import threading
+import time
+
+
+class Middleware:
+    """Hooks around every request of a client, set as `client.middlewares` (a list, run in order).
+
+    Override any of:
+        before_sign(call): before each attempt is signed and sent, after the rate limiter. call.headers and
+            call.params can be changed (ie. a request id header), and are signed as changed
+        after_send(call, response): with each response, whatever its status, before it is checked and parsed
+        after_parse(call, result): with what request() is about to return, returns it (or a replacement)
+        on_error(call, exc): with the ExchangeApiException about to be raised, returns it (or another one to raise)
+    The after_* and on_error hooks run in reverse order, so the first middleware wraps the others. `call.context`
+    is a dict for middlewares to keep their state in (ie. an OpenTelemetry span).
+    """
+
+    def before_sign(self, call):
+        pass
+
+    def after_send(self, call, response):
+        pass
+
+    def after_parse(self, call, result):
+        return result
+
+    def on_error(self, call, exc):
+        return exc
+
+
+class RequestCall:
+    """One request() as seen by the middlewares. attempt counts the attempts already made (backoff retries)"""
+
+    def __init__(self, client, method, url, params, data, headers):
+        self.client = client
+        self.method = method
+        self.url = url
+        self.params = params
+        self.data = data
+        self.headers = headers
+        self.attempt = 0
+        self.response = None
+        self.started = time.perf_counter()
+        self.context = {}
+
+    @property
+    def endpoint(self):
+        return self.client.metric_endpoint(self.url)
+
+    def before_sign(self, headers, params):
+        # Copies, so the next attempt starts from the caller's values again
+        self.headers = dict(headers or {})
+        self.params = dict(params or {})
+        for middleware in self.client.middlewares:
+            middleware.before_sign(self)
+        return self.headers, self.params if self.params or params is not None else params
+
+    def after_send(self, response):
+        self.response = response
+        for middleware in reversed(self.client.middlewares):
+            middleware.after_send(self, response)
+
+    def after_parse(self, result):
+        for middleware in reversed(self.client.middlewares):
+            result = middleware.after_parse(self, result)
+        return result
+
+    def on_error(self, exc):
+        for middleware in reversed(self.client.middlewares):
+            exc = middleware.on_error(self, exc)
+        return exc
+
+
+class ProfilerMiddleware(Middleware):
+    """Where the time of each call goes:
+        wait: rate limiter and backoff waits, before the first attempt and between attempts
+        send: signing, network and the retries urllib3 makes, until the response is read
+        parse: checking and decoding the response
+    Each call's breakdown is in call.context["profile"] and passed to callback(call, profile) if given, and the
+    totals per endpoint are in stats() and report()."""
+
+    PHASES = ["wait", "send", "parse"]
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.totals = {}  # (exchange, endpoint) -> {"calls", "errors", "attempts", "wait", "send", "parse", "total"}
+
+    def mark(self, call, phase):
+        now = time.perf_counter()
+        profile = call.context.get("profile")
+        if profile is None:
+            profile = call.context["profile"] = {"attempts": 0, "wait": 0.0, "send": 0.0, "parse": 0.0}
+        profile[phase] += now - call.context.get("profile_mark", call.started)
+        call.context["profile_mark"] = now
+        return profile
+
+    def before_sign(self, call):
+        self.mark(call, "wait")["attempts"] += 1
+
+    def after_send(self, call, response):
+        self.mark(call, "send")
+
+    def after_parse(self, call, result):
+        self.record(call, self.mark(call, "parse"), error=False)
+        return result
+
+    def on_error(self, call, exc):
+        # ie. a connection error, time since the last mark is still sending
+        self.record(call, self.mark(call, "parse" if call.response is not None else "send"), error=True)
+        return exc
+
+    def record(self, call, profile, error):
+        profile["total"] = time.perf_counter() - call.started
+        key = (call.client.exchange_name(), call.endpoint)
+        with self.lock:
+            totals = self.totals.get(key)
+            if totals is None:
+                totals = self.totals[key] = dict.fromkeys(["calls", "errors", "attempts", *self.PHASES, "total"], 0)
+            totals["calls"] += 1
+            totals["errors"] += error
+            for name in ["attempts", *self.PHASES, "total"]:
+                totals[name] += profile[name]
+        if self.callback is not None:
+            self.callback(call, profile)
+
+    def stats(self):
+        with self.lock:
+            return {key: dict(totals) for key, totals in self.totals.items()}
+
+    def report(self):
+        """Average milliseconds per call in each phase, per endpoint, slowest first"""
+        lines = [f"{'endpoint':<40} {'calls':>6} {'errors':>6} {'wait':>9} {'send':>9} {'parse':>9} {'total':>9}"]
+        for (exchange, endpoint), totals in sorted(self.stats().items(), key=lambda item: -item[1]["total"]):
+            calls = totals["calls"]
+            averages = " ".join(f"{totals[name] / calls * 1000:9.2f}" for name in [*self.PHASES, "total"])
+            lines.append(f"{exchange + ' ' + endpoint:<40} {calls:>6} {totals['errors']:>6} {averages}")
+        return "\n".join(lines)
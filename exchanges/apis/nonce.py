@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# Fixed width so the file is overwritten in place
+WIDTH = 20
+
+
+def clock():
+    # 100ns ticks since the epoch, the scale nonces have always used, so they keep increasing over ones already sent
+    return time.time_ns() // 100
+
+
+class NonceGenerator:
+    """Monotonic nonces for every client in this process: the clock, or one more than the last nonce when the clock
+    hasn't moved (or went back). Thread-safe, and only a clock read per nonce.
+
+    Exchanges reject a nonce that isn't larger than the last one they saw for the key, so clients sharing a key have to
+    share the generator, which they do by default (BaseExchangeApi.nonce_generator). Processes sharing a key need a
+    FileNonceGenerator.
+    """
+
+    def __init__(self):
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            self.last = max(self.last + 1, clock())
+            return self.last
+
+
+class FileNonceGenerator:
+    """Monotonic nonces across processes: the last nonce is kept in a file, read and updated under an exclusive
+    lock (flock), ie. BitfinexApi.nonce_generator = FileNonceGenerator("/var/run/bitfinex-main.nonce")"""
+
+    def __init__(self, path):
+        if fcntl is None:  # pragma: no cover
+            raise ImportError("FileNonceGenerator needs fcntl, which is only available on Unix")
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+
+    def open(self):
+        # flock is per open file, so a forked child opens its own rather than sharing the parent's lock
+        if self.pid != os.getpid():
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.pid = os.getpid()
+        return self.fd
+
+    def next(self):
+        with self.lock:
+            fd = self.open()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                last = os.pread(fd, WIDTH, 0)
+                nonce = max(int(last or 0) + 1, clock())
+                os.pwrite(fd, b"%020d" % nonce, 0)
+                return nonce
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None and self.pid == os.getpid():
+                os.close(self.fd)
+            self.fd = self.pid = None
+
+
+shared_nonce_generator = NonceGenerator()
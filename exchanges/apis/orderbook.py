@@ -0,0 +1,203 @@
+from decimal import Decimal as D
+
+from sortedcontainers import SortedList
+
+
+class OrderBookGap(Exception):
+    """An update doesn't follow the book's sequence: updates were missed, and the book has to be fetched again"""
+
+
+class BookSide:
+    """Price levels of one side of a book, best first. Prices are kept in a SortedList (negated for bids, so the best
+    price is always first), which adds and removes levels in logarithmic time, and mapped to their sizes"""
+
+    def __init__(self, descending):
+        self.sign = -1 if descending else 1
+        self.keys = SortedList()  # sign * price
+        self.sizes = {}  # price -> size
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, price, size):
+        """Set the size at a price, removing the level if size is 0"""
+        if size:
+            if price not in self.sizes:
+                self.keys.add(self.sign * price)
+            self.sizes[price] = size
+        elif price in self.sizes:
+            del self.sizes[price]
+            self.keys.remove(self.sign * price)
+
+    def clear(self):
+        self.keys.clear()
+        self.sizes = {}
+
+    def best(self):
+        """(price, size) of the best level, or None if empty"""
+        if not self.keys:
+            return None
+        price = self.sign * self.keys[0]
+        return price, self.sizes[price]
+
+    def levels(self, count=None):
+        """[(price, size), ...] best first"""
+        keys = self.keys if count is None else self.keys.islice(stop=count)
+        return [(self.sign * key, self.sizes[self.sign * key]) for key in keys]
+
+    def vwap(self, size):
+        """Average price of taking `size` from this side, or None if the book isn't that deep"""
+        remaining = size
+        cost = D(0)
+        for key in self.keys:
+            price = self.sign * key
+            taken = min(remaining, self.sizes[price])
+            cost += taken * price
+            remaining -= taken
+            if not remaining:
+                return cost / size
+        return None
+
+
+class OrderBook:
+    """Local order book seeded from a snapshot and kept current with diff updates.
+
+    Prices and sizes are Decimals. `sequence` is the exchange's sequence number of the last update applied:
+    apply_diff() ignores updates the book already contains and raises OrderBookGap when one was missed, in which
+    case fetch a new snapshot. The exchange classes below parse each exchange's snapshots and updates.
+    """
+
+    def __init__(self, symbol=None):
+        self.symbol = symbol
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.sequence = None
+
+    def load_snapshot(self, bids, asks, sequence=None):
+        """bids and asks: [(price, size), ...]"""
+        self.bids.clear()
+        self.asks.clear()
+        for price, size in bids:
+            self.bids.set(D(price), D(size))
+        for price, size in asks:
+            self.asks.set(D(price), D(size))
+        self.sequence = sequence
+        return self
+
+    def apply_diff(self, bids, asks, first_sequence=None, last_sequence=None):
+        """Apply the changed levels ([(price, new size), ...], size 0 removes the level) of the updates numbered
+        first_sequence to last_sequence. Returns False if the book already had them"""
+        if last_sequence is not None and self.sequence is not None:
+            if last_sequence <= self.sequence:
+                return False
+            if first_sequence > self.sequence + 1:
+                raise OrderBookGap(f"{self.symbol}: expected update {self.sequence + 1}, got {first_sequence}")
+        for price, size in bids:
+            self.bids.set(D(price), D(size))
+        for price, size in asks:
+            self.asks.set(D(price), D(size))
+        if last_sequence is not None:
+            self.sequence = last_sequence
+        return True
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def spread(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        return ask[0] - bid[0] if bid and ask else None
+
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        return (ask[0] + bid[0]) / 2 if bid and ask else None
+
+    def depth_at(self, price):
+        """Size resting at a price, on either side"""
+        price = D(price)
+        return self.bids.sizes.get(price) or self.asks.sizes.get(price) or D(0)
+
+    def depth(self, levels=10):
+        """(bids, asks), each [(price, size), ...] best first"""
+        return self.bids.levels(levels), self.asks.levels(levels)
+
+    def vwap(self, action, size):
+        """Average price to buy (taking asks) or sell (taking bids) `size`, or None if the book isn't that deep"""
+        assert action in ["buy", "sell"]
+        return (self.asks if action == "buy" else self.bids).vwap(D(size))
+
+
+class BinanceOrderBook(OrderBook):
+    """Snapshot from depth, updates from the <symbol>@depth stream.
+    https://binance-docs.github.io/apidocs/spot/en/#how-to-manage-a-local-order-book-correctly"""
+
+    @classmethod
+    def fetch(cls, client, symbol, limit=1000):
+        return cls.from_snapshot(symbol, client.brequest(3, "depth", params={"symbol": symbol, "limit": limit}))
+
+    @classmethod
+    def from_snapshot(cls, symbol, snapshot):
+        # {"lastUpdateId": 1027024, "bids": [["4.00000000", "431.00000000"]], "asks": [...]}
+        return cls(symbol).load_snapshot(snapshot["bids"], snapshot["asks"], snapshot["lastUpdateId"])
+
+    def apply_update(self, event):
+        # {"e": "depthUpdate", "U": first update id, "u": last update id, "b": [[price, size]], "a": [...]}
+        return self.apply_diff(event["b"], event["a"], event["U"], event["u"])
+
+
+class BitfinexOrderBook(OrderBook):
+    """Snapshot from book/<symbol>/<precision>, updates from the book websocket channel. Entries are
+    [PRICE, COUNT, AMOUNT], with a positive amount for bids, and a count of 0 to remove the level. Bitfinex only
+    numbers messages when the SEQ_ALL flag is set, pass its sequence to apply_update() to detect gaps.
+    https://docs.bitfinex.com/reference/ws-public-books"""
+
+    @classmethod
+    def fetch(cls, client, symbol, precision="P0", length=100):
+        return cls.from_snapshot(symbol, client.brequest(2, f"book/{symbol}/{precision}", params={"len": length}))
+
+    @classmethod
+    def from_snapshot(cls, symbol, entries, sequence=None):
+        book = cls(symbol)
+        bids = [(D(str(price)), D(str(amount))) for price, _, amount in entries if amount > 0]
+        asks = [(D(str(price)), -D(str(amount))) for price, _, amount in entries if amount < 0]
+        return book.load_snapshot(bids, asks, sequence)
+
+    def apply_update(self, entry, sequence=None):
+        price, count, amount = entry
+        price, amount = D(str(price)), D(str(amount))
+        size = abs(amount) if count else D(0)
+        if amount > 0:
+            return self.apply_diff([(price, size)], [], sequence, sequence)
+        return self.apply_diff([], [(price, size)], sequence, sequence)
+
+
+class KuCoinOrderBook(OrderBook):
+    """Snapshot from market/orderbook/level2_100, updates from the /market/level2 websocket topic, where each change
+    has its own sequence number. https://www.kucoin.com/docs/websocket/spot-trading/public-channels/level2-market-data
+    """
+
+    @classmethod
+    def fetch(cls, client, symbol):
+        return cls.from_snapshot(symbol, client.brequest(1, "market/orderbook/level2_100", params={"symbol": symbol}))
+
+    @classmethod
+    def from_snapshot(cls, symbol, response):
+        # {"code": "200000", "data": {"sequence": "3262786978", "bids": [["6500.12", "0.45054140"]], "asks": [...]}}
+        data = response["data"]
+        return cls(symbol).load_snapshot(data["bids"], data["asks"], int(data["sequence"]))
+
+    def apply_update(self, data):
+        # {"sequenceStart": 1545896669105, "sequenceEnd": 1545896669106, "symbol": "BTC-USDT",
+        #  "changes": {"asks": [["6", "1", "1545896669105"]], "bids": [["4", "1", "1545896669106"]]}}
+        first, last = int(data["sequenceStart"]), int(data["sequenceEnd"])
+        if last <= self.sequence:
+            return False
+        if first > self.sequence + 1:
+            raise OrderBookGap(f"{self.symbol}: expected update {self.sequence + 1}, got {first}")
+        # Only the changes the snapshot doesn't include yet. A price of 0 is a sequence-only message
+        changes = data["changes"]
+        bids = [(price, size) for price, size, seq in changes["bids"] if int(seq) > self.sequence and D(price)]
+        asks = [(price, size) for price, size, seq in changes["asks"] if int(seq) > self.sequence and D(price)]
+        return self.apply_diff(bids, asks, first, last)
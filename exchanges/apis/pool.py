@@ -0,0 +1,129 @@
+from collections import Counter
+import threading
+import time
+
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+
+
+class SharedPoolManager(PoolManager):
+    """PoolManager that counts pool hits/misses and tracks when each host's pool was last used,
+    so idle pools can be evicted. urllib3 already bounds the number of pools (LRU over num_pools)"""
+
+    def __init__(self, registry, *args, **kwargs):
+        self.registry = registry
+        self.last_used = {}
+        super().__init__(*args, **kwargs)
+
+    def connection_from_pool_key(self, pool_key, request_context=None):
+        with self.pools.lock:
+            self.registry.record(pool_key, pool_key in self.pools)
+            self.last_used[pool_key] = time.monotonic()
+            pool = super().connection_from_pool_key(pool_key, request_context=request_context)
+        self.registry.maybe_evict_idle()
+        return pool
+
+
+class SharedPoolAdapter(HTTPAdapter):
+    """HTTPAdapter using the registry's pool manager. Retries, auth and hooks stay with the client's session"""
+
+    def __init__(self, registry, **kwargs):
+        self.registry = registry
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = self.registry.pool_manager
+
+    def close(self):
+        # The pools are shared with other clients, only the registry may clear them
+        for proxy in self.proxy_manager.values():
+            proxy.clear()
+
+
+class ConnectionPoolRegistry:
+    """Process-wide connection pools, one per host, shared by every client that opts in with
+    `POOL_REGISTRY = shared_pool_registry`. Safe to use from many threads.
+
+    max_hosts: number of host pools kept, least recently used are closed first
+    maxsize: number of idle connections kept per host
+    block: wait for a free connection when maxsize are in use instead of opening a throwaway one
+    idle_timeout: seconds after which an unused host pool is closed
+    """
+
+    def __init__(self, max_hosts=10, maxsize=10, block=False, idle_timeout=300):
+        self.max_hosts = max_hosts
+        self.maxsize = maxsize
+        self.block = block
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.last_sweep = time.monotonic()
+        self.pool_manager = SharedPoolManager(self, num_pools=max_hosts, maxsize=maxsize, block=block)
+
+    def adapter(self, max_retries):
+        return SharedPoolAdapter(
+            self,
+            pool_connections=self.max_hosts,
+            pool_maxsize=self.maxsize,
+            pool_block=self.block,
+            max_retries=max_retries,
+        )
+
+    def record(self, pool_key, hit):
+        with self.lock:
+            (self.hits if hit else self.misses)[pool_key.key_host] += 1
+
+    def maybe_evict_idle(self):
+        # Sweep at most a few times per idle_timeout, so the hot path only pays for a clock read
+        now = time.monotonic()
+        if now - self.last_sweep < self.idle_timeout / 4:
+            return
+        self.last_sweep = now
+        self.evict_idle()
+
+    def evict_idle(self, idle_timeout=None):
+        """Close host pools that have not been used for idle_timeout seconds. Returns the number closed"""
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        cutoff = time.monotonic() - idle_timeout
+        pools = self.pool_manager.pools
+        evicted = 0
+        with pools.lock:
+            for pool_key, last_used in list(self.pool_manager.last_used.items()):
+                if last_used > cutoff:
+                    continue
+                del self.pool_manager.last_used[pool_key]
+                if pool_key in pools:
+                    # Deleting from the container closes the pool's idle connections
+                    del pools[pool_key]
+                    evicted += 1
+        if evicted:
+            logger.debug(f"Evicted {evicted} idle connection pools")
+            with self.lock:
+                self.evictions += evicted
+        return evicted
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "evictions": self.evictions,
+                "pools": len(self.pool_manager.pools),
+                "hosts": {
+                    host: {"hits": self.hits[host], "misses": self.misses[host]} for host in self.hits | self.misses
+                },
+            }
+
+    def clear(self):
+        with self.pool_manager.pools.lock:
+            self.pool_manager.clear()
+            self.pool_manager.last_used.clear()
+
+
+shared_pool_registry = ConnectionPoolRegistry()
@@ -0,0 +1,275 @@
+from urllib.parse import parse_qs, urlsplit
+import re
+import threading
+import time
+
+from loguru import logger
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `capacity` tokens, refilled continuously over `period` seconds.
+
+    reserve() never blocks. It takes the tokens right away (the balance may go negative) and returns how long the
+    caller has to wait before its reservation is covered, so concurrent callers queue up in order, and both
+    threads (time.sleep) and coroutines (asyncio.sleep) can wait on it.
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost=1):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= cost
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def sync(self, used):
+        """Align with usage reported by the exchange (ie. other processes on the same IP). Only ever lowers the
+        balance, as the server's view lags behind our own reservations"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RateLimiter:
+    """Client-side rate limiter used by BaseExchangeApi.request when set as `client.rate_limiter`.
+
+    The base class is a single bucket of `limit` requests per `period` seconds. Exchange policies override
+    buckets() to charge per-endpoint weights against one or more buckets, and update() to sync the buckets from
+    the exchange's rate limit headers. Share one instance between clients that share a limit (ie. the same IP).
+    """
+
+    def __init__(self, limit=10, period=1):
+        self.limit = limit
+        self.period = period
+        self.bucket_lock = threading.Lock()
+        self._buckets = {}
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.throttled_requests = 0
+        self.throttled_seconds = 0.0
+
+    def bucket(self, name, capacity, period):
+        with self.bucket_lock:
+            if name not in self._buckets:
+                self._buckets[name] = TokenBucket(capacity, period)
+            return self._buckets[name]
+
+    def buckets(self, method, url, params):
+        """[(bucket, cost), ...] charged for this request"""
+        return [(self.bucket("default", self.limit, self.period), 1)]
+
+    def update(self, response):
+        """Called with every response, to sync buckets from the exchange's headers"""
+
+    def reserve(self, method, url, params=None):
+        """Reserve capacity for a request and return the seconds to wait before sending it"""
+        wait = max([bucket.reserve(cost) for bucket, cost in self.buckets(method, url, params)] or [0.0])
+        self.record(method, url, wait)
+        return wait
+
+    def record(self, method, url, wait):
+        with self.stats_lock:
+            self.requests += 1
+            if wait > 0:
+                self.throttled_requests += 1
+                self.throttled_seconds += wait
+        if wait > 0:
+            logger.debug(f"Rate limited {method} {url}, waiting {wait:.2f}s")
+
+    def acquire(self, method, url, params=None):
+        """Blocking reserve(). Returns the seconds spent waiting"""
+        wait = self.reserve(method, url, params)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "requests": self.requests,
+                "throttled_requests": self.throttled_requests,
+                "throttled_seconds": self.throttled_seconds,
+            }
+
+
+def get_param(params, name):
+    # params are a dict, or an already encoded query string for signed requests
+    if isinstance(params, str):
+        values = parse_qs(params).get(name)
+        return values[0] if values else None
+    return (params or {}).get(name)
+
+
+def per_symbol(with_symbol, without_symbol):
+    """Weight depending on whether the request is for some symbols or all of them"""
+    return lambda params: with_symbol if get_param(params, "symbol") or get_param(params, "symbols") else without_symbol
+
+
+def binance_depth_weight(params):
+    limit = int(get_param(params, "limit") or 100)
+    return 5 if limit <= 100 else 25 if limit <= 500 else 50 if limit <= 1000 else 250
+
+
+def binance_futures_depth_weight(params):
+    limit = int(get_param(params, "limit") or 500)
+    return 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+
+
+class BinanceRateLimiter(RateLimiter):
+    """Binance REQUEST_WEIGHT limit per IP, with the documented weight of each endpoint. Synced from the
+    X-MBX-USED-WEIGHT-1M response header. https://binance-docs.github.io/apidocs/spot/en/#limits"""
+
+    WEIGHT_LIMIT = 6000
+    WEIGHT_PERIOD = 60
+    DEFAULT_WEIGHT = 1
+    # path after /api/vX/ -> weight, or a function of the params
+    WEIGHTS = {
+        "depth": binance_depth_weight,
+        "exchangeInfo": 20,
+        "klines": 2,
+        "uiKlines": 2,
+        "trades": 25,
+        "historicalTrades": 25,
+        "aggTrades": 2,
+        "avgPrice": 2,
+        "ticker/24hr": per_symbol(2, 80),
+        "ticker/price": per_symbol(2, 4),
+        "ticker/bookTicker": per_symbol(2, 4),
+        "ticker": per_symbol(4, 80),
+        "account": 20,
+        "myTrades": 20,
+        "allOrders": 20,
+        "openOrders": per_symbol(6, 80),
+        "order": 4,
+    }
+    # Placing or cancelling an order is cheaper than querying one
+    WRITE_WEIGHTS = {"order": 1}
+
+    def __init__(self, weight_limit=None):
+        super().__init__(weight_limit or self.WEIGHT_LIMIT, self.WEIGHT_PERIOD)
+
+    def weight(self, method, url, params):
+        endpoint = urlsplit(url).path.split("/", 3)[-1]
+        if method != "GET" and endpoint in self.WRITE_WEIGHTS:
+            return self.WRITE_WEIGHTS[endpoint]
+        weight = self.WEIGHTS.get(endpoint, self.DEFAULT_WEIGHT)
+        return weight(params) if callable(weight) else weight
+
+    def buckets(self, method, url, params):
+        return [(self.bucket("weight", self.limit, self.period), self.weight(method, url, params))]
+
+    def update(self, response):
+        used = response.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used:
+            self.bucket("weight", self.limit, self.period).sync(int(used))
+
+
+class BinanceFuturesRateLimiter(BinanceRateLimiter):
+    """USD-M futures (fapi) weights. https://binance-docs.github.io/apidocs/futures/en/#limits"""
+
+    WEIGHT_LIMIT = 2400
+    WEIGHTS = {
+        **BinanceRateLimiter.WEIGHTS,
+        "depth": binance_futures_depth_weight,
+        "klines": 5,
+        "ticker/24hr": per_symbol(1, 40),
+        "ticker/price": per_symbol(1, 2),
+        "ticker/bookTicker": per_symbol(1, 2),
+        "account": 5,
+        "myTrades": 5,
+        "allOrders": 5,
+        "openOrders": per_symbol(1, 40),
+        "order": 1,
+    }
+
+
+class BitfinexRateLimiter(RateLimiter):
+    """Bitfinex limits each REST endpoint separately, between 10 and 90 requests per minute.
+    https://docs.bitfinex.com/docs/requirements-and-limitations"""
+
+    PERIOD = 60
+    DEFAULT_LIMIT = 90
+    # (pattern on the path after /vX/, requests per minute), first match wins
+    LIMITS = [
+        (re.compile(r"^platform/status"), 30),
+        (re.compile(r"^tickers?"), 30),
+        (re.compile(r"^trades/"), 30),
+        (re.compile(r"^book/"), 90),
+        (re.compile(r"^stats1/"), 90),
+        (re.compile(r"^candles/"), 30),
+        (re.compile(r"^conf/"), 90),
+        (re.compile(r"^status/"), 90),
+        (re.compile(r"^auth/r/trades"), 90),
+        (re.compile(r"^auth/r/ledgers"), 90),
+        (re.compile(r"^auth/r/orders/.*hist"), 90),
+    ]
+
+    def __init__(self):
+        super().__init__(self.DEFAULT_LIMIT, self.PERIOD)
+
+    def buckets(self, method, url, params):
+        endpoint = urlsplit(url).path.split("/", 2)[-1]
+        for pattern, limit in self.LIMITS:
+            if pattern.match(endpoint):
+                return [(self.bucket(pattern.pattern, limit, self.PERIOD), 1)]
+        # Every other endpoint has its own budget
+        return [(self.bucket(endpoint, self.DEFAULT_LIMIT, self.PERIOD), 1)]
+
+
+class KuCoinRateLimiter(RateLimiter):
+    """KuCoin resource pools: each endpoint has a weight charged against a pool shared by all endpoints of that
+    kind, per 30 seconds. Synced from the gw-ratelimit-* response headers.
+    https://www.kucoin.com/docs/basic-info/request-rate-limit/rest-api"""
+
+    PERIOD = 30
+    POOLS = {"public": 2000, "spot": 4000, "management": 2000, "futures": 2000}
+    # (method or None for any, pattern on the path after /api/vX/, pool, weight), first match wins
+    WEIGHTS = [
+        (None, re.compile(r"^market/allTickers"), "public", 15),
+        (None, re.compile(r"^market/orderbook/level2_100"), "public", 4),
+        (None, re.compile(r"^market/orderbook/level2_20"), "public", 2),
+        (None, re.compile(r"^market/orderbook/level1"), "public", 2),
+        (None, re.compile(r"^market/(candles|histories)"), "public", 3),
+        (None, re.compile(r"^market/stats"), "public", 15),
+        (None, re.compile(r"^(symbols|currencies|markets)"), "public", 4),
+        (None, re.compile(r"^(timestamp|status)"), "public", 3),
+        (None, re.compile(r"^(accounts|sub|deposit|withdrawals|transfer)"), "management", 5),
+        (None, re.compile(r"^(fills|limit/fills)"), "spot", 10),
+        ("POST", re.compile(r"^orders"), "spot", 2),
+        ("DELETE", re.compile(r"^orders"), "spot", 3),
+        ("GET", re.compile(r"^orders"), "spot", 2),
+        (None, re.compile(r"^margin/"), "spot", 5),
+    ]
+    DEFAULT = ("spot", 2)
+
+    def __init__(self):
+        super().__init__(self.POOLS["spot"], self.PERIOD)
+
+    def pool(self, method, url):
+        endpoint = urlsplit(url).path.split("/", 3)[-1]
+        for weight_method, pattern, pool, weight in self.WEIGHTS:
+            if (weight_method is None or weight_method == method) and pattern.match(endpoint):
+                return pool, weight
+        return self.DEFAULT
+
+    def buckets(self, method, url, params):
+        pool, weight = self.pool(method, url)
+        return [(self.bucket(pool, self.POOLS[pool], self.PERIOD), weight)]
+
+    def update(self, response):
+        limit = response.headers.get("gw-ratelimit-limit")
+        remaining = response.headers.get("gw-ratelimit-remaining")
+        if limit and remaining:
+            pool, _ = self.pool(response.request.method, response.request.url)
+            self.bucket(pool, self.POOLS[pool], self.PERIOD).sync(int(limit) - int(remaining))
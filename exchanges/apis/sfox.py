@@ -1,12 +1,32 @@
 from decimal import Decimal as D
+from functools import lru_cache
 import re
 
 import arrow
 
-from .base import BaseExchangeApi, ExchangeApiException
+from .aio import AsyncBaseExchangeApi
+from .base import SYMBOL_CACHE_SIZE, ExchangeApiException, milliseconds
+from .marketdata import Candle, OrderBookSnapshot, Ticker, candle_range, decimal, interval_name, levels
 
+PAIR_FORMAT = re.compile("[A-Z0-9]{3,}/[A-Z0-9]{3,}")
+
+
+@lru_cache(maxsize=SYMBOL_CACHE_SIZE)
+def _make_symbol(symbol):
+    assert PAIR_FORMAT.match(symbol), "Format of symbol should be $trade_currency/$stake_currency: {}".format(symbol)
+    pieces = symbol.split("/")
+    return f"{pieces[0]}{pieces[1]}".lower()
+
+
+class SFOXApi(AsyncBaseExchangeApi):
+    BASE_URL = "https://api.sfox.com"
+    CHARTDATA_URL = "https://chartdata.sfox.com"
+    TRADES_PAGE_SIZE = 1000
+    # Candle periods (seconds) of chartdata's candlesticks
+    CANDLE_INTERVALS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "6h": 21600, "1d": 86400}
+    CANDLES_PAGE_SIZE = 500
+    METRIC_ENDPOINT_PATTERNS = [(re.compile(r"(?<=/markets/orderbook/)[^/]+"), "{symbol}")]
 
-class SFOXApi(BaseExchangeApi):
     def get_symbol(self, stake_currency, trade_currency):
         return self.make_symbol(f"{trade_currency}/{stake_currency}")
 
@@ -18,20 +38,33 @@ class SFOXApi(BaseExchangeApi):
         return f"{symbol[:3]}/{symbol[3:]}".upper()
 
     def make_symbol(self, symbol):
-        assert re.match(
-            "[A-Z0-9]{3,}/[A-Z0-9]{3,}", symbol
-        ), "Format of symbol should be $trade_currency/$stake_currency: {}".format(symbol)
-        pieces = symbol.split("/")
-        return f"{pieces[0]}{pieces[1]}".lower()
+        return _make_symbol(symbol)
+
+    def make_symbols(self, symbols):
+        return list(map(_make_symbol, symbols))
 
-    def get_trade_history(self):
+    def get_balances(self):
+        balances = {}
+        for balance in self.brequest(1, "user/balance", authenticate=True):
+            total = D(str(balance["balance"]))
+            if total:
+                balances[balance["currency"].upper()] = {"total": total, "available": D(str(balance["available"]))}
+        return balances
+
+    def iter_trade_history(self, since=None, until=None):
         """Normalized view of trade history excluding deposits/withdrawals"""
-        history = []
-        for txn in self.brequest(1, "account/transactions", authenticate=True):
-            if txn["action"] not in ["Buy", "Sell"]:
-                continue
-            history.append(
-                {
+        params = {"limit": self.TRADES_PAGE_SIZE}
+        if since:
+            params["from"] = milliseconds(since)
+        if until:
+            params["to"] = milliseconds(until) - 1
+        offset = 0
+        while True:
+            txns = self.brequest(1, "account/transactions", authenticate=True, params={**params, "offset": offset})
+            for txn in txns:
+                if txn["action"] not in ["Buy", "Sell"]:
+                    continue
+                yield {
                     "exchange_txn_id": str(txn["id"]),
                     "client_order_id": str(txn.get("client_order_id")),
                     "time": arrow.get(txn["day"]),
@@ -42,8 +75,65 @@ class SFOXApi(BaseExchangeApi):
                     "price": D(txn["price"]),
                     "fees": D(txn["fees"]),
                 }
-            )
-        return history
+            if len(txns) < self.TRADES_PAGE_SIZE:
+                return
+            offset += len(txns)
+
+    def get_tickers(self, symbols=None):
+        """SFOX has no ticker endpoint: bid and ask come from the order book, last and volume from the hourly candles of
+        the last 24 hours. That's two requests a pair, for every pair of markets/currency-pairs without symbols"""
+        if symbols is None:
+            pairs = self.brequest(1, "markets/currency-pairs", authenticate=True)
+            symbols = [pair["formatted_symbol"] for pair in pairs.values()]
+        return {symbol: self.build_ticker(symbol) for symbol in symbols}
+
+    def build_ticker(self, symbol):
+        book = self.get_order_book(symbol, depth=1)
+        candles = self.get_candles(symbol, "1h", start=arrow.utcnow().shift(hours=-24))
+        return Ticker(
+            symbol,
+            book.bids[0][0] if book.bids else None,
+            book.asks[0][0] if book.asks else None,
+            candles[-1].close if candles else None,
+            sum(candle.volume for candle in candles) if candles else None,
+            book.time,
+        )
+
+    def get_order_book(self, symbol, depth=100):
+        # {"pair": "btcusd", "bids": [[price, quantity, exchange], ...], "asks": [...], "lastupdated": ms, ...}
+        book = self.brequest(1, f"markets/orderbook/{self.make_symbol(symbol)}", authenticate=True)
+        return OrderBookSnapshot(
+            symbol, levels(book["bids"], depth), levels(book["asks"], depth), None, book.get("lastupdated")
+        )
+
+    def get_candles(self, symbol, interval="1m", start=None, end=None):
+        period = interval_name(interval, self.CANDLE_INTERVALS)
+        # chartdata takes seconds, and always a range: without start, the latest page
+        end = milliseconds(end or arrow.utcnow()) // 1000
+        start = milliseconds(start) // 1000 if start else end - self.CANDLES_PAGE_SIZE * period
+        window = self.CANDLES_PAGE_SIZE * period
+        candles = []
+        for window_start in range(start, end, window):
+            params = {
+                "pair": self.make_symbol(symbol),
+                "period": period,
+                "startTime": window_start,
+                "endTime": min(window_start + window, end) - 1,
+            }
+            # [{"start_time": seconds, "open_price": .., "high_price": .., "low_price": .., "close_price": ..,
+            #   "volume": .., ...}, ...]
+            for c in self.brequest(endpoint="candlesticks", params=params):
+                candles.append(
+                    Candle(
+                        int(c["start_time"]) * 1000,
+                        decimal(c["open_price"]),
+                        decimal(c["high_price"]),
+                        decimal(c["low_price"]),
+                        decimal(c["close_price"]),
+                        decimal(c["volume"]),
+                    )
+                )
+        return candle_range(candles, start * 1000, end * 1000)
 
     def brequest(
         self,
@@ -53,22 +143,42 @@ class SFOXApi(BaseExchangeApi):
         method="GET",
         params=None,
         data=None,
+        raw=None,
     ):
+        return self.request(**self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw)
+
+    async def abrequest(
+        self,
+        api_version=1,
+        endpoint=None,
+        authenticate=False,
+        method="GET",
+        params=None,
+        data=None,
+        raw=None,
+    ):
+        return await self.arequest(
+            **self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw
+        )
+
+    def prepare_brequest(self, api_version, endpoint, authenticate, method, params, data):
         if endpoint.startswith("candlesticks"):
-            base_url = "https://chartdata.sfox.com"
+            base_url = self.CHARTDATA_URL
             api_path = f"/{endpoint}"
         else:
-            base_url = "https://api.sfox.com"
+            base_url = self.BASE_URL
             api_path = f"/v{api_version}/{endpoint}"
 
         headers = self.DEFAULT_HEADERS.copy()
 
-        if authenticate:
-            headers.update({"Authorization": f"Bearer {self.key}"})
+        sign = self.sign_request if authenticate else None
 
         url = base_url + api_path
+        return dict(url=url, method=method, params=params, data=data, headers=headers, sign=sign)
 
-        return self.request(url, method, params, data, headers)
+    def sign_request(self, headers, params):
+        headers.update({"Authorization": f"Bearer {self.key}"})
+        return headers, params
 
 
 class SFOXException(ExchangeApiException):
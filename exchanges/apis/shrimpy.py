@@ -5,15 +5,17 @@ import time
 
 from requests.auth import AuthBase
 
-from .base import BaseExchangeApi, ExchangeApiException
+from .aio import AsyncBaseExchangeApi
+from .base import ExchangeApiException
 
 
-class ShrimpyApi(BaseExchangeApi):
+class ShrimpyApi(AsyncBaseExchangeApi):
 
     """Shrimpy doesn't have trading pairs, only positions of a currency, so the symbol methods are
     NotImplementedError"""
 
     auth_provider = None
+    BASE_URL = "https://api.shrimpy.io"
 
     def __init__(self, key=None, secret=None):
         super().__init__(key, secret)
@@ -35,9 +37,11 @@ class ShrimpyApi(BaseExchangeApi):
     def make_symbol(self, symbol):
         return symbol
 
-    def get_trade_history(self):
-        """Normalized view of trade history excluding deposits/withdrawals"""
-        raise NotImplementedError
+    def unmake_symbols(self, symbols):
+        return list(symbols)
+
+    def make_symbols(self, symbols):
+        return list(symbols)
 
     def brequest(
         self,
@@ -47,20 +51,42 @@ class ShrimpyApi(BaseExchangeApi):
         method="GET",
         params=None,
         data=None,
+        raw=None,
+    ):
+        # Concurrent calls (ie. fan_out) share the instance, so the auth provider is passed along instead of stored
+        return self.request(
+            **self.prepare_brequest(api_version, endpoint, authenticate, method, params, data),
+            auth=self.get_auth_provider(authenticate),
+            raw=raw,
+        )
+
+    async def abrequest(
+        self,
+        api_version,
+        endpoint=None,
+        authenticate=False,
+        method="GET",
+        params=None,
+        data=None,
+        raw=None,
     ):
+        return await self.arequest(
+            **self.prepare_brequest(api_version, endpoint, authenticate, method, params, data),
+            auth=self.get_auth_provider(authenticate),
+            raw=raw,
+        )
 
-        base_url = "https://api.shrimpy.io"
+    def prepare_brequest(self, api_version, endpoint, authenticate, method, params, data):
         api_path = f"/v{api_version}/{endpoint}"
-        url = base_url + api_path
+        url = self.BASE_URL + api_path
 
         headers = self.DEFAULT_HEADERS.copy()
+        return dict(url=url, method=method, params=params, data=data, headers=headers)
 
+    def get_auth_provider(self, authenticate):
         if authenticate:
-            self.auth_provider = ShrimpyAuthProvider(self.key, self.secret)
-        else:
-            self.auth_provider = None
-
-        return self.request(url, method, params, data, headers)
+            return ShrimpyAuthProvider(self.key, self.secret)
+        return None
 
 
 class ShrimpyException(ExchangeApiException):
@@ -0,0 +1,311 @@
+import asyncio
+import inspect
+import json
+
+from loguru import logger
+
+from .base import ExchangeApiException
+
+try:
+    import websockets
+except ImportError:  # pragma: no cover
+    websockets = None
+
+# Ends the async iteration once the stream is closed
+CLOSED = object()
+
+
+class ReconnectException(Exception):
+    """Raised by a stream to drop the connection and reconnect with back-off, ie. when a listen key can't be had"""
+
+
+class WebsocketStream:
+    """Websocket subscriptions that survive disconnects: the connection is reopened (with exponential back-off) and
+    every subscription sent again, until close().
+
+    Messages are delivered as (channel, data), where channel describes the subscription, either to
+    `callback(channel, data)` (a function or coroutine function), or by iterating the stream:
+
+        async with BitfinexStream() as stream:
+            await stream.subscribe(channel="ticker", symbol="tBTCUSD")
+            async for channel, data in stream:
+                ...
+
+    Exchanges implement on_connect() (authenticate and resubscribe), send_subscribe() and handle().
+    """
+
+    URL = None
+    RECONNECT_DELAY = 1
+    MAX_RECONNECT_DELAY = 60
+
+    def __init__(self, client=None, url=None, callback=None):
+        if websockets is None:  # pragma: no cover
+            raise ImportError("websockets is required for streams: pip install exchanges[stream]")
+        self.client = client  # REST client, for keys and signing
+        self.url = url or self.URL
+        self.callback = callback
+        self.subscriptions = []
+        self.ws = None
+        self.task = None
+        self.queue = None
+        self.closed = False
+        self.error = None
+        self.connections = 0
+
+    async def subscribe(self, **subscription):
+        self.subscriptions.append(subscription)
+        if self.ws is not None:
+            await self.send_subscribe(subscription)
+
+    async def send(self, message):
+        await self.ws.send(json.dumps(message))
+
+    async def on_connect(self):
+        for subscription in self.subscriptions:
+            await self.send_subscribe(subscription)
+
+    async def send_subscribe(self, subscription):  # pragma: no cover
+        raise NotImplementedError
+
+    async def handle(self, message):  # pragma: no cover
+        raise NotImplementedError
+
+    async def deliver(self, channel, data):
+        if self.callback is None:
+            await self.queue.put((channel, data))
+            return
+        result = self.callback(channel, data)
+        if inspect.isawaitable(result):
+            await result
+
+    async def run(self):
+        """Connect and deliver messages until close(), reconnecting whenever the connection drops"""
+        try:
+            await self.connect_forever()
+        except Exception as exc:
+            # A bug rather than a disconnect, the stream ends with it instead of hanging its consumers
+            logger.exception(f"Websocket {self.url} stopped: {exc!r}")
+            self.error = exc
+            self.closed = True
+        finally:
+            if self.queue is not None:
+                await self.queue.put(CLOSED)
+
+    async def connect_forever(self):
+        delay = self.RECONNECT_DELAY
+        while not self.closed:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self.ws = ws
+                    self.connections += 1
+                    await self.on_connect()
+                    delay = self.RECONNECT_DELAY
+                    async for raw in ws:
+                        await self.receive(raw)
+            except (websockets.ConnectionClosed, OSError, asyncio.TimeoutError, ReconnectException) as exc:
+                if not self.closed:
+                    logger.warning(f"Websocket {self.url} disconnected: {exc!r}")
+            except ExchangeApiException as exc:
+                # ie. authentication failed, reconnecting won't help
+                logger.error(f"Websocket {self.url} failed: {exc}")
+                self.error = exc
+                self.closed = True
+            finally:
+                self.ws = None
+                await self.on_disconnect()
+
+            if not self.closed:
+                logger.info(f"Reconnecting to {self.url} in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+    async def receive(self, raw):
+        """Parse and handle one message. One that can't be parsed or handled, or whose callback fails, is logged and
+        skipped rather than ending the stream"""
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.warning(f"Websocket {self.url} sent invalid JSON: {raw[:200]!r}")
+            return
+        try:
+            await self.handle(message)
+        except (websockets.ConnectionClosed, OSError, ReconnectException, ExchangeApiException):
+            raise
+        except Exception as exc:
+            logger.exception(f"Websocket {self.url} could not handle {str(message)[:200]}: {exc!r}")
+
+    async def on_disconnect(self):
+        pass
+
+    def start(self):
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.ensure_future(self.run())
+        return self
+
+    async def close(self):
+        self.closed = True
+        if self.ws is not None:
+            await self.ws.close()
+        # close() can be called from a callback, which runs in the task
+        if self.task is not None and self.task is not asyncio.current_task():
+            await self.task
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __aiter__(self):
+        return self.start()
+
+    async def __anext__(self):
+        message = await self.queue.get()
+        if message is CLOSED:
+            await self.queue.put(CLOSED)
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+        return message
+
+
+class BitfinexStream(WebsocketStream):
+    """Bitfinex v2 websocket. Public channels by default, authenticated with authenticate=True (and a client with
+    keys), which also receives the account channel as {"channel": "auth"}. Subscribe with the documented fields,
+    ie. subscribe(channel="book", symbol="tBTCUSD", prec="P0"). https://docs.bitfinex.com/docs/ws-general"""
+
+    URL = "wss://api-pub.bitfinex.com/ws/2"
+    AUTH_URL = "wss://api.bitfinex.com/ws/2"
+    # Info code asking clients to reconnect, ie. before maintenance
+    RECONNECT_CODE = 20051
+
+    def __init__(self, client=None, url=None, callback=None, authenticate=False):
+        self.authenticate = authenticate
+        self.channels = {}  # chanId -> channel
+        super().__init__(client, url or (self.AUTH_URL if authenticate else self.URL), callback)
+
+    async def on_connect(self):
+        # Channel ids are per connection
+        self.channels = {}
+        if self.authenticate:
+            await self.send(self.auth_message())
+        await super().on_connect()
+
+    def auth_message(self):
+        nonce = self.client.nonce()
+        payload = "AUTH" + nonce
+        headers = self.client.auth_headers(self.client.key, self.client.secret, 2, nonce, payload)
+        return {
+            "event": "auth",
+            "apiKey": headers["bfx-apikey"],
+            "authSig": headers["bfx-signature"],
+            "authPayload": payload,
+            "authNonce": nonce,
+        }
+
+    async def send_subscribe(self, subscription):
+        await self.send({"event": "subscribe", **subscription})
+
+    async def handle(self, message):
+        if isinstance(message, dict):
+            await self.handle_event(message)
+            return
+
+        # [CHANNEL_ID, DATA] or [CHANNEL_ID, TYPE, DATA]
+        chan_id, data = message[0], message[1:]
+        if data[0] == "hb":
+            return
+        if chan_id == 0:
+            await self.deliver({"channel": "auth"}, data)
+        else:
+            await self.deliver(self.channels.get(chan_id), data[0] if len(data) == 1 else data)
+
+    async def handle_event(self, message):
+        event = message.get("event")
+        if event == "subscribed":
+            self.channels[message["chanId"]] = {
+                name: value for name, value in message.items() if name not in ["event", "chanId"]
+            }
+        elif event == "auth" and message.get("status") != "OK":
+            raise ExchangeApiException("AUTH", self.url, None, message.get("msg", "Authentication failed"))
+        elif event == "info" and message.get("code") == self.RECONNECT_CODE:
+            logger.info(f"Bitfinex asked to reconnect: {message.get('msg')}")
+            await self.ws.close()
+        elif event == "error":
+            logger.warning(f"Bitfinex websocket error: {message}")
+
+
+class BinanceStream(WebsocketStream):
+    """Binance combined streams, ie. subscribe(stream="btcusdt@trade"), delivered as {"stream": name}. With
+    user_data=True (and a client with keys) a listen key is created on each connection and kept alive, and the
+    account's events are delivered as {"stream": "user"}.
+    https://binance-docs.github.io/apidocs/spot/en/#websocket-market-streams
+    """
+
+    URL = "wss://stream.binance.com:9443/stream"
+    # Listen keys expire after 60 minutes without a keep alive
+    KEEPALIVE_INTERVAL = 30 * 60
+
+    def __init__(self, client=None, url=None, callback=None, user_data=False):
+        self.user_data = user_data
+        self.listen_key = None
+        self.keepalive_task = None
+        self.request_id = 0
+        super().__init__(client, url, callback)
+
+    async def on_connect(self):
+        streams = [subscription["stream"] for subscription in self.subscriptions]
+        if self.user_data:
+            try:
+                self.listen_key = (await self.user_data_stream("POST"))["listenKey"]
+            except ExchangeApiException as exc:
+                # ie. a connection error or maintenance, try again on the next connection
+                raise ReconnectException(f"Could not create a Binance listen key: {exc}") from exc
+            self.keepalive_task = asyncio.ensure_future(self.keepalive())
+            streams.append(self.listen_key)
+        if streams:
+            await self.send_streams(streams)
+
+    async def on_disconnect(self):
+        if self.keepalive_task is not None:
+            self.keepalive_task.cancel()
+            self.keepalive_task = None
+
+    async def user_data_stream(self, method, listen_key=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.client.user_data_stream, method, listen_key)
+
+    async def keepalive(self):
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_INTERVAL)
+            try:
+                await self.user_data_stream("PUT", self.listen_key)
+            except ExchangeApiException as exc:
+                # The key may expire before the next keep alive, reconnecting creates a new one
+                logger.warning(f"Could not keep the Binance listen key alive, reconnecting: {exc}")
+                if self.ws is not None:
+                    await self.ws.close()
+                return
+
+    async def send_subscribe(self, subscription):
+        await self.send_streams([subscription["stream"]])
+
+    async def send_streams(self, streams):
+        self.request_id += 1
+        await self.send({"method": "SUBSCRIBE", "params": streams, "id": self.request_id})
+
+    async def handle(self, message):
+        if "stream" not in message:
+            # {"result": null, "id": 1} acknowledging a subscription
+            if message.get("error"):
+                logger.warning(f"Binance websocket error: {message}")
+            return
+        if message["stream"] != self.listen_key:
+            await self.deliver({"stream": message["stream"]}, message["data"])
+            return
+
+        await self.deliver({"stream": "user"}, message["data"])
+        if message["data"].get("e") == "listenKeyExpired":
+            # Reconnecting creates a new one
+            await self.ws.close()
@@ -1,27 +1,143 @@
+from datetime import date, timedelta
+from operator import itemgetter
+import gzip
+import heapq
 import json
+import os
+import threading
 
-from .base import BaseExchangeApi, ExchangeApiException
+from loguru import logger
 
+from .aio import AsyncBaseExchangeApi
+from .base import ExchangeApiException
+from .metadata import snapshot_dir
 
-class TardisApi(BaseExchangeApi):
+
+class TardisApi(AsyncBaseExchangeApi):
+    BASE_URL = "https://api.tardis.dev"
 
     RESULT_KEY = "result"  # corresponds to market_data sync result_key
 
-    def parse_response(self, response):
-        # Newline-delimited records where the first element of each record
-        # is the tardis write timestamp (which is "%Y-%m-%dT%H:%M:%S.%f" and
-        # always 28 characters) and the second one is the JSON payload.
-        records = response.content.decode("utf-8").split("\n")
+    # Records are newline-delimited, the first element of each record is the tardis write timestamp (which is
+    # "%Y-%m-%dT%H:%M:%S.%f" and always 28 characters) and the second one is the JSON payload.
+    TIMESTAMP_LENGTH = 28
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # data-feeds returns one minute per request, from `from` plus `offset` minutes, so a day is this many requests
+    SLICE_MINUTES = 24 * 60
 
-        # Take the first record, strip off the timestamp, then parse
-        take_first_record = 0
-        timestamp_length = 28
-        out = json.loads(records[take_first_record][timestamp_length:])
+    def parse_record(self, line):
+        """(timestamp, payload) of one record line"""
+        length = self.TIMESTAMP_LENGTH
+        return line[:length].strip().decode("utf-8"), self.loads(line[length:])
+
+    def iter_records(self, response):
+        """Lazily yield (timestamp, payload) for each record of a response, reading it a chunk at a time.
+        Memory use doesn't depend on the size of the response if it was requested with stream=True. The response is
+        closed once exhausted, or when the generator is closed early"""
+        try:
+            for line in response.iter_lines(chunk_size=self.STREAM_CHUNK_SIZE):
+                if line:
+                    yield self.parse_record(line)
+        finally:
+            response.close()
+
+    def parse_response(self, response):
+        """The first record's payload, with RESULT_KEY set to the union of its stats and info. Stops reading after
+        the first newline, the rest of a streamed response is never downloaded"""
+        records = self.iter_records(response)
+        try:
+            _, out = next(records)
+        except StopIteration:
+            raise ExchangeApiException(response.request.method, response.url, response.status_code, "No records")
+        finally:
+            records.close()
 
         # Union of stats and info
         out[self.RESULT_KEY] = out["data"]["stats"] | out["data"]["info"]
         return out
 
+    def stream_brequest(self, api_version, endpoint=None, params=None):
+        """Generator of (timestamp, payload) records for a GET on an endpoint returning newline-delimited records
+        (ie. data-feeds), parsed as they are downloaded"""
+        request = self.prepare_brequest(api_version, endpoint, False, "GET", params, {})
+        return self.iter_records(self.request(**request, stream=True))
+
+    def first_record(self, api_version, endpoint=None, params=None):
+        """Same as parse_response(), only downloading the beginning of the response"""
+        request = self.prepare_brequest(api_version, endpoint, False, "GET", params, {})
+        return self.parse_response(self.request(**request, stream=True))
+
+    def replay(self, exchange, channel, symbols, start, end):
+        """Historical records of one channel for several symbols, from the start date up to (excluding) the end date,
+        as (timestamp, symbol, payload) in timestamp order.
+
+        Data is downloaded one day per symbol at a time, as the replay reaches it, and kept gzipped in the replay
+        cache (see replay_slice_path), so a day is only ever downloaded once. Each day is read lazily, and symbols
+        are merged with a heap, so memory use doesn't depend on the length of the replay.
+        """
+        days = list(self.replay_days(start, end))
+        streams = [self.replay_symbol(exchange, channel, symbol, days) for symbol in symbols]
+        return heapq.merge(*streams, key=itemgetter(0))
+
+    @staticmethod
+    def replay_days(start, end):
+        start, end = (day if isinstance(day, date) else date.fromisoformat(day) for day in (start, end))
+        for offset in range((end - start).days):
+            yield start + timedelta(days=offset)
+
+    def replay_symbol(self, exchange, channel, symbol, days):
+        for day in days:
+            for timestamp, payload in self.read_slice(self.fetch_slice(exchange, channel, symbol, day)):
+                yield timestamp, symbol, payload
+
+    @property
+    def replay_cache_dir(self):
+        return os.path.join(snapshot_dir(), "tardis")
+
+    def replay_slice_path(self, exchange, channel, symbol, day):
+        symbol = symbol.replace("/", "_").replace(":", "_")
+        return os.path.join(self.replay_cache_dir, exchange, channel, symbol, f"{day.isoformat()}.ndjson.gz")
+
+    def fetch_slice(self, exchange, channel, symbol, day):
+        """Path of the cached records for one day of a symbol, downloaded first if they're not cached yet"""
+        path = self.replay_slice_path(exchange, channel, symbol, day)
+        if os.path.exists(path):
+            return path
+
+        logger.debug(f"Downloading tardis {exchange} {channel} {symbol} {day}")
+        params = {"from": day.isoformat(), "filters": json.dumps([{"channel": channel, "symbols": [symbol]}])}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        f = None
+        try:
+            for offset in range(self.SLICE_MINUTES):
+                request = self.prepare_brequest(
+                    1, f"data-feeds/{exchange}", False, "GET", {**params, "offset": offset}, {}
+                )
+                with self.request(**request, stream=True) as response:
+                    if f is None:
+                        # Once there's a response, so a failed download leaves nothing behind
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        f = gzip.open(tmp_path, "wb")
+                    for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                        f.write(chunk)
+            f.close()
+            # Atomic, an interrupted download is never mistaken for a cached one
+            os.replace(tmp_path, path)
+        finally:
+            if f is not None:
+                f.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def read_slice(self, path):
+        """Lazily yield (timestamp, payload) for each record of a cached slice"""
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                line = line.rstrip(b"\r\n")
+                if line:
+                    yield self.parse_record(line)
+
     def brequest(
         self,
         api_version,
@@ -30,17 +146,33 @@ class TardisApi(BaseExchangeApi):
         method="GET",
         params=None,
         data={},
+        raw=None,
     ):
+        return self.request(**self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw)
+
+    async def abrequest(
+        self,
+        api_version,
+        endpoint=None,
+        authenticate=False,  # ignored, we always supply the API key
+        method="GET",
+        params=None,
+        data={},
+        raw=None,
+    ):
+        return await self.arequest(
+            **self.prepare_brequest(api_version, endpoint, authenticate, method, params, data), raw=raw
+        )
+
+    def prepare_brequest(self, api_version, endpoint, authenticate, method, params, data):
         assert not endpoint.startswith(("/v1", "v1")), "endpoint should not be a full path, but the url after v1/"
 
-        base_url = "https://api.tardis.dev"
         api_path = f"/v{api_version}/{endpoint}"
         headers = self.DEFAULT_HEADERS.copy()
         headers.update({"Authorization": f"Bearer {self.key}"})
 
-        url = base_url + api_path
-
-        return self.request(url, method, params, data, headers)
+        url = self.BASE_URL + api_path
+        return dict(url=url, method=method, params=params, data=data, headers=headers)
 
 
 class FTXException(ExchangeApiException):
@@ -0,0 +1,70 @@
+"""Minimal local HTTP server for tests and benchmarks. Answers every request with a fixed JSON body, unless a
+route is configured for the path"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so connections are kept alive between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid delayed ACK stalls on kept-alive connections
+    disable_nagle_algorithm = True
+    body = b"[1]"
+    # Seconds to wait before answering, to simulate a slow exchange
+    delay = 0
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.server.requests.append((self.command, self.path, dict(self.headers), body))
+
+        status, response_body, headers = self.server.response_for(self.path.split("?")[0])
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, routes=None):
+        # routes: {path: response or [responses]}, where a response is (status, body[, headers]).
+        # A list is played back in order, repeating the last response once exhausted
+        self.routes = {path: list(r) if isinstance(r, list) else [r] for path, r in (routes or {}).items()}
+        self.requests = []
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), handler)
+
+    def response_for(self, path):
+        with self.lock:
+            responses = self.routes.get(path)
+            if not responses:
+                return 200, self.RequestHandlerClass.body, {}
+            response = responses.pop(0) if len(responses) > 1 else responses[0]
+        status, body = response[:2]
+        headers = response[2] if len(response) > 2 else {}
+        return status, body.encode() if isinstance(body, str) else body, headers
+
+
+def start_stub_server(body=None, routes=None, delay=0):
+    """Start the stub server on a free port in a daemon thread. Returns (server, base_url)"""
+    handler = StubHandler
+    if body is not None or delay:
+        handler = type(
+            "StubHandler", (StubHandler,), {"body": StubHandler.body if body is None else body, "delay": delay}
+        )
+    server = StubServer(handler, routes)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%s" % server.server_address[1]
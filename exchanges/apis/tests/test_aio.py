@@ -0,0 +1,145 @@
+from unittest import mock
+import asyncio
+import unittest
+
+from exchanges import exchange_factory
+
+from ..base import ExchangeApiException
+from ..bitfinex import BitfinexNonceException
+from .stub_server import start_stub_server
+
+
+def stub_client(exchange, base_url, *args):
+    """Client of the given exchange pointed at the stub server, without retry back-off"""
+    api_class = exchange_factory(exchange)
+    attrs = {name: base_url for name in ["BASE_URL", "PUBLIC_BASE_URL", "CHARTDATA_URL"] if hasattr(api_class, name)}
+    attrs["RETRY_BACKOFF_FACTOR"] = 0
+    return type(api_class.__name__, (api_class,), attrs)(*args)
+
+
+class AsyncApiTest(unittest.TestCase):
+    def setUp(self):
+        self.server, self.base_url = start_stub_server(
+            routes={
+                "/v1/nonce": (400, '{"message":"Nonce is too small."}'),
+                "/v2/error": (400, '["error", 10020, "symbol: invalid"]'),
+                "/api/v3/flaky": [(503, "down"), (502, "down"), (200, '{"ok": true}')],
+                "/api/v3/down": (503, "down"),
+                "/api/v3/badjson": (200, "{badjson"),
+            }
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_async(self, client, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await client.aclose()
+
+        return asyncio.run(run())
+
+    def test_binance(self):
+        client = stub_client("binance", self.base_url, "key", "secret")
+        result = self.run_async(client, client.abrequest(3, "account", authenticate=True, params={"recvWindow": 5000}))
+        self.assertEqual(result, [1])
+
+        method, path, headers, body = self.server.requests[-1]
+        self.assertEqual(method, "GET")
+        self.assertTrue(path.startswith("/api/v3/account?recvWindow=5000&timestamp="))
+        self.assertIn("&signature=", path)
+        self.assertEqual(headers["X-MBX-APIKEY"], "key")
+
+    def test_raw(self):
+        client = stub_client("binance", self.base_url)
+        self.assertEqual(self.run_async(client, client.abrequest(3, "badjson", raw="bytes")), b"{badjson")
+        self.assertEqual(client.brequest(3, "badjson", raw="bytes"), b"{badjson")
+        with client.brequest(3, "badjson", raw="stream") as f:
+            self.assertEqual(f.read(), b"{badjson")
+
+    def test_same_request_as_sync(self):
+        client = stub_client("bitfinex", self.base_url, "key", "secret")
+        client.nonce = lambda: "1"
+        data = {"offer_id": 124124}
+
+        self.assertEqual(client.brequest(1, "offer/cancel", authenticate=True, method="POST", data=data), [1])
+        self.assertEqual(
+            self.run_async(client, client.abrequest(1, "offer/cancel", authenticate=True, method="POST", data=data)),
+            [1],
+        )
+
+        (_, sync_path, sync_headers, sync_body), (_, async_path, async_headers, async_body) = self.server.requests
+        self.assertEqual(sync_path, async_path)
+        self.assertEqual(sync_body, async_body)
+        for header in ["X-BFX-APIKEY", "X-BFX-PAYLOAD", "X-BFX-SIGNATURE"]:
+            self.assertEqual(sync_headers[header], async_headers[header])
+
+    def test_all_exchanges(self):
+        for exchange, args, call in [
+            ("kucoin", ("passphrase", "key", "secret"), lambda c: c.abrequest(1, "orders", True, "DELETE")),
+            ("sfox", ("key", "secret"), lambda c: c.abrequest(endpoint="candlesticks")),
+            ("tardis", ("key", "secret"), lambda c: c.abrequest(1, "data-feeds/ftx")),
+            ("shrimpy", ("key", "c2VjcmV0"), lambda c: c.abrequest(1, "users", authenticate=True)),
+        ]:
+            client = stub_client(exchange, self.base_url, *args)
+            self.assertEqual(self.run_async(client, call(client)), [1])
+
+        headers = [request[2] for request in self.server.requests]
+        self.assertIn("KC-API-SIGN", headers[0])
+        self.assertEqual(headers[2]["Authorization"], "Bearer key")
+        self.assertIn("SHRIMPY-API-SIGNATURE", headers[3])
+
+    def test_errors(self):
+        client = stub_client("bitfinex", self.base_url, "key", "secret")
+        with self.assertRaises(BitfinexNonceException):
+            self.run_async(client, client.abrequest(1, "nonce", authenticate=True, method="POST"))
+        # Retried once, signed with a fresh nonce
+        self.assertEqual(len(self.server.requests), 2)
+        nonces = [request[2]["X-BFX-PAYLOAD"] for request in self.server.requests]
+        self.assertNotEqual(nonces[0], nonces[1])
+
+        with self.assertRaises(ExchangeApiException) as ctx:
+            self.run_async(client, client.abrequest(2, "error"))
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(ctx.exception.message, "symbol: invalid")
+
+        client = stub_client("binance", self.base_url)
+        with self.assertRaises(ExchangeApiException) as ctx:
+            self.run_async(client, client.abrequest(3, "badjson"))
+        self.assertIn("Could not decode JSON response", ctx.exception.message)
+
+        client.BASE_URL = "http://127.0.0.1:1"
+        with self.assertRaises(ExchangeApiException) as ctx:
+            self.run_async(client, client.abrequest(3, "ping"))
+        self.assertEqual(ctx.exception.message, "Connection Error")
+
+    def test_without_aiohttp(self):
+        client = stub_client("binance", self.base_url)
+        with mock.patch("exchanges.apis.aio.aiohttp", None):
+            with self.assertRaisesRegex(ImportError, "aiohttp is required"):
+                self.run_async(client, client.abrequest(3, "ping"))
+
+    def test_retries(self):
+        client = stub_client("binance", self.base_url)
+        self.assertEqual(self.run_async(client, client.abrequest(3, "flaky")), {"ok": True})
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.server.requests.clear()
+        with self.assertRaises(ExchangeApiException) as ctx:
+            self.run_async(client, client.abrequest(3, "down"))
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(len(self.server.requests), client.RETRIES + 1)
+
+        # POST is not idempotent, so not retried
+        self.server.requests.clear()
+        with self.assertRaises(ExchangeApiException):
+            self.run_async(client, client.abrequest(3, "down", method="POST"))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_sync_against_stub(self):
+        client = stub_client("binance", self.base_url)
+        self.assertEqual(client.brequest(3, "flaky"), {"ok": True})
+        self.assertEqual(len(self.server.requests), 3)
@@ -0,0 +1,132 @@
+import asyncio
+import time
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..backoff import AdaptiveBackoff
+from ..base import BaseExchangeApi, ExchangeApiException, RateLimitException
+from .stub_server import start_stub_server
+
+
+class BackoffTest(unittest.TestCase):
+    def test_no_backoff(self):
+        client = BaseExchangeApi()
+        with requests_mock.mock() as m:
+            m.get("https://example.com/limited", text="slow down", status_code=429, headers={"Retry-After": "7"})
+            with self.assertRaises(RateLimitException) as ctx:
+                client.request("https://example.com/limited")
+        self.assertIsInstance(ctx.exception, ExchangeApiException)
+        self.assertEqual(ctx.exception.retry_after, 7)
+        self.assertEqual(m.call_count, 1)
+
+    def test_retry_after(self):
+        client = BaseExchangeApi()
+        client.backoff = AdaptiveBackoff(base_delay=0)
+        with requests_mock.mock() as m:
+            m.get(
+                "https://example.com/limited",
+                [
+                    {"text": "slow down", "status_code": 429, "headers": {"Retry-After": "0.05"}},
+                    {"text": "[]", "status_code": 200},
+                ],
+            )
+            start = time.monotonic()
+            self.assertEqual(client.request("https://example.com/limited"), [])
+        self.assertEqual(m.call_count, 2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(client.backoff.cooldowns(), {})
+
+    def test_adaptive(self):
+        backoff = AdaptiveBackoff(max_retries=1, base_delay=0.01, multiplier=3)
+        client = BaseExchangeApi()
+        client.backoff = backoff
+        with requests_mock.mock() as m:
+            m.get("https://example.com/limited", text="slow down", status_code=429)
+            with self.assertRaises(RateLimitException):
+                client.request("https://example.com/limited")
+            self.assertEqual(m.call_count, 2)
+            self.assertEqual(backoff.strikes["example.com"], 2)
+            # 0.01 * 3 ** 1 after the second strike
+            self.assertAlmostEqual(backoff.cooldowns()["example.com"], 0.03, places=2)
+
+            # Successes cool the host back down
+            m.get("https://example.com/ok", text="[]")
+            client.request("https://example.com/ok")
+            client.request("https://example.com/ok")
+            self.assertNotIn("example.com", backoff.strikes)
+
+    def test_ban_is_shared(self):
+        backoff = AdaptiveBackoff(max_wait=10)
+        one, two = exchange_factory("binance")(), exchange_factory("binance")()
+        one.backoff = two.backoff = backoff
+        banned_until = int(time.time() * 1000) + 3600 * 1000
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.binance.com/api/v3/ping",
+                text='{"code":-1003,"msg":"Way too much request weight used; IP banned until %s."}' % banned_until,
+                status_code=418,
+            )
+            with self.assertRaises(RateLimitException) as ctx:
+                one.brequest(3, "ping")
+            self.assertAlmostEqual(ctx.exception.retry_after, 3600, delta=5)
+
+            # The other client doesn't even try while the host is banned
+            with self.assertRaises(RateLimitException) as ctx:
+                two.brequest(3, "ping")
+            self.assertIsNone(ctx.exception.status_code)
+            self.assertEqual(m.call_count, 1)
+        self.assertAlmostEqual(backoff.cooldowns()["api.binance.com"], 3600, delta=5)
+
+    def test_exchange_retry_after(self):
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api-pub.bitfinex.com/v2/tickers", text='["error", 11010, "ratelimit: error"]', status_code=429
+            )
+            with self.assertRaises(RateLimitException) as ctx:
+                exchange_factory("bitfinex")().brequest(2, "tickers")
+            self.assertEqual(ctx.exception.retry_after, 60)
+            self.assertEqual(ctx.exception.message, "ratelimit: error")
+
+            m.get(
+                "https://api.kucoin.com/api/v1/symbols",
+                text="{}",
+                status_code=429,
+                headers={"gw-ratelimit-reset": "1500"},
+            )
+            with self.assertRaises(RateLimitException) as ctx:
+                exchange_factory("kucoin")().brequest(1, "symbols")
+            self.assertEqual(ctx.exception.retry_after, 1.5)
+
+            m.get(
+                "https://example.com/date",
+                text="",
+                status_code=429,
+                headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"},
+            )
+            with self.assertRaises(RateLimitException) as ctx:
+                BaseExchangeApi().request("https://example.com/date")
+            self.assertEqual(ctx.exception.retry_after, 0)
+
+    def test_async(self):
+        server, base_url = start_stub_server(
+            routes={"/api/v3/limited": [(429, "slow down", {"Retry-After": "0"}), (200, "[]")]}
+        )
+        client = type("StubBinanceApi", (exchange_factory("binance"),), {"BASE_URL": base_url})("key", "secret")
+        client.backoff = AdaptiveBackoff(base_delay=0)
+
+        async def run():
+            async with client:
+                return await client.abrequest(3, "limited", authenticate=True)
+
+        try:
+            self.assertEqual(asyncio.run(run()), [])
+        finally:
+            server.shutdown()
+            server.server_close()
+        # Signed again for the retry, with a fresh timestamp
+        (_, first, _, _), (_, second, _, _) = server.requests
+        self.assertEqual(first.count("signature="), 1)
+        self.assertEqual(second.count("signature="), 1)
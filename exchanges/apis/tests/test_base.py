@@ -1,3 +1,4 @@
+import gzip
 import unittest
 
 import requests_mock
@@ -58,3 +59,55 @@ class BaseTest(unittest.TestCase):
             with self.assertRaises(ExchangeApiException):
                 m.get("http://example.com/badjson", text="[']")
                 response = c.request("http://example.com/badjson")
+
+    def test_raw(self):
+        c = BaseExchangeApi()
+        body = b'{"symbols": [' + b",".join(b'{"symbol": "S%d"}' % i for i in range(1000)) + b"]}"
+
+        with requests_mock.mock() as m:
+            m.get("https://example.com/info", content=body)
+            self.assertEqual(c.request("https://example.com/info", raw="bytes"), body)
+            # Not even valid JSON is checked
+            m.get("https://example.com/text", content=b"not json")
+            self.assertEqual(c.request("https://example.com/text", raw="bytes"), b"not json")
+
+            m.get("https://example.com/gzip", content=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+            with c.request("https://example.com/gzip", raw="stream") as f:
+                chunks = iter(lambda: f.read(1024), b"")
+                self.assertEqual(b"".join(chunks), body)
+
+            m.get("https://example.com/error", text='{"msg": "Invalid symbol"}', status_code=400)
+            for raw in ["bytes", "stream"]:
+                with self.assertRaises(ExchangeApiException) as ctx:
+                    c.request("https://example.com/error", raw=raw)
+                self.assertEqual(ctx.exception.status_code, 400)
+                self.assertEqual(ctx.exception.message, '{"msg": "Invalid symbol"}')
+
+    def test_session_reused(self):
+        c = BaseExchangeApi()
+        session = c.session
+        adapter = session.get_adapter("https://example.com")
+
+        with requests_mock.mock() as m:
+            m.get("https://example.com/empty", text="[]")
+            c.request("https://example.com/empty")
+            c.request("https://example.com/empty")
+
+        self.assertIs(c.session, session)
+        self.assertIs(c.session.get_adapter("https://example.com"), adapter)
+        self.assertEqual(len(session.hooks["response"]), 1)
+
+        c.close()
+        self.assertIsNot(c.session, session)
+
+    def test_pool_settings(self):
+        class PooledApi(BaseExchangeApi):
+            POOL_CONNECTIONS = 2
+            POOL_MAXSIZE = 25
+            POOL_BLOCK = True
+
+        adapter = PooledApi().session.get_adapter("https://example.com")
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 25)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(adapter.max_retries.status, BaseExchangeApi.RETRIES)
@@ -1,10 +1,22 @@
+from decimal import Decimal as D
 import unittest
 
+import arrow
 import requests_mock
 
 from exchanges import exchange_factory
 
 from ..base import ExchangeApiException
+from ..marketdata import Candle, OrderBookSnapshot, Ticker
+from .test_metadata import isolated_metadata
+
+EXCHANGE_INFO = """{"symbols": [
+    {"symbol": "ETHUSDT", "baseAsset": "ETH", "quoteAsset": "USDT", "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.01", "maxPrice": "1000000.00", "tickSize": "0.01"},
+        {"filterType": "LOT_SIZE", "minQty": "0.0001", "maxQty": "9000.00", "stepSize": "0.0001"}]},
+    {"symbol": "BTCUSDT", "baseAsset": "BTC", "quoteAsset": "USDT", "filters": []}
+]}"""
+FUTURES_EXCHANGE_INFO = '{"symbols": [{"symbol": "ETHUSDT_230331", "baseAsset": "ETH", "quoteAsset": "USDT"}]}'
 
 
 class BinanceTest(unittest.TestCase):
@@ -22,6 +34,38 @@ class BinanceTest(unittest.TestCase):
         self.assertEqual("ETH/USDT", self.client.unmake_symbol("ETHUSDT"))
         self.assertEqual("ETHUSDT", self.client.make_symbol("ETH/USDT"))
 
+    @isolated_metadata
+    def test_symbol_index(self):
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/exchangeInfo", text=EXCHANGE_INFO)
+            m.get("https://fapi.binance.com/fapi/v1/exchangeInfo", text=FUTURES_EXCHANGE_INFO)
+
+            self.assertEqual("ETH/USDT", self.client.get_pair("ETHUSDT"))
+            self.assertEqual("BTC/USDT", self.client.unmake_symbol("BTCUSDT"))
+            # Shared with margin, and other instances
+            self.assertEqual("ETH/USDT", self.margin_client.unmake_symbol("ETHUSDT"))
+            self.assertEqual("ETH/USDT", exchange_factory("binance")().unmake_symbol("ETHUSDT"))
+            self.assertEqual(m.call_count, 1)
+
+            # Futures have their own symbols
+            self.assertEqual("ETH/USDT", self.futures_client.unmake_symbol("ETHUSDT_230331"))
+            with self.assertRaises(AssertionError):
+                self.futures_client.unmake_symbol("BTCUSDT")
+            self.assertEqual(m.call_count, 2)
+
+            self.assertEqual(self.client.unmake_symbols(["ETHUSDT", "BTCUSDT"]), ["ETH/USDT", "BTC/USDT"])
+            self.assertEqual(self.client.make_symbols(["ETH/USDT", "BTC/USDT"]), ["ETHUSDT", "BTCUSDT"])
+            with self.assertRaises(AssertionError):
+                self.client.unmake_symbols(["ETHUSDT", "NOPE"])
+            self.assertEqual(m.call_count, 2)
+
+        index = self.client.symbol_index
+        self.assertEqual(index.symbol("ETH", "USDT"), "ETHUSDT")
+        self.assertIsNone(index.symbol("ETH", "BTC"))
+        self.assertEqual(str(index.tick_size("ETHUSDT")), "0.01")
+        self.assertEqual(str(index.lot_size("ETHUSDT")), "0.0001")
+        self.assertIsNone(index.tick_size("BTCUSDT"))
+
     def test_public_candles_v3(self):
         with requests_mock.mock() as m:
             m.get("https://api.binance.com/api/v3/klines?symbol=ETHUSDT", text='{"open":"543.0"}')
@@ -58,5 +102,169 @@ class BinanceTest(unittest.TestCase):
             m.get("https://api.binance.com/sapi/v1/noop", text='{"noop": true}')
             self.margin_client.brequest(1, endpoint="noop", method="GET")
         with requests_mock.mock() as m:
-            m.get("https://api.binance.com/fapi/v1/noop", text='{"noop": true}')
+            m.get("https://fapi.binance.com/fapi/v1/noop", text='{"noop": true}')
             self.futures_client.brequest(1, endpoint="noop", method="GET")
+            # Signed futures requests go to the futures host too
+            m.get("https://fapi.binance.com/fapi/v2/balance", text="[]")
+            self.assertEqual(self.futures_client.get_balances(), {})
+            self.assertEqual(m.last_request.hostname, "fapi.binance.com")
+            self.assertIn("signature=", m.last_request.url)
+
+    def test_iter_trade_history(self):
+        # ETHUSDT trades one day apart, starting 2021-01-01
+        day = 24 * 60 * 60 * 1000
+        trades = [
+            {
+                "symbol": "ETHUSDT",
+                "id": 100 + i,
+                "orderId": 1,
+                "price": "700.00",
+                "qty": "0.5",
+                "commission": "0.001" if i % 2 else "0.10",
+                "commissionAsset": "ETH" if i % 2 else "BNB",
+                "time": 1609459200000 + i * day,
+                "isBuyer": i % 2 == 0,
+            }
+            for i in range(5)
+        ]
+
+        def my_trades(request, context):
+            params = {
+                name: int(values[0]) for name, values in request.qs.items() if name not in ["symbol", "signature"]
+            }
+            return [t for t in trades if t["id"] >= params["fromid"]][: params["limit"]]
+
+        self.client.TRADES_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/myTrades", json=my_trades)
+            history = list(self.client.iter_trade_history(symbols=["ETH/USDT"]))
+            self.assertEqual([t["exchange_txn_id"] for t in history], ["100", "101", "102", "103", "104"])
+            self.assertEqual(m.call_count, 3)
+            self.assertTrue(all("signature=" in r.url for r in m.request_history))
+
+            self.assertEqual(history[0]["action"], "buy")
+            self.assertEqual(history[0]["trade_curr"], "ETH")
+            self.assertEqual(history[0]["stake_curr"], "USDT")
+            self.assertEqual(history[0]["amount"], D("0.5"))
+            self.assertEqual(history[0]["fee_curr"], "BNB")
+            # Fees paid in the traded currency are converted
+            self.assertEqual(history[1]["action"], "sell")
+            self.assertEqual(history[1]["fees"], D("0.7"))
+            self.assertNotIn("fee_curr", history[1])
+
+            # since / until: the first id is found with a time window, then paged by id
+            m.reset_mock()
+            history = list(
+                self.client.iter_trade_history(since="2021-01-02T12:00", until="2021-01-04T12:00", symbols=["ETH/USDT"])
+            )
+            self.assertEqual([t["exchange_txn_id"] for t in history], ["102", "103"])
+            self.assertEqual(history[0]["time"], arrow.get("2021-01-03"))
+            # Paged from the first trade rather than searched one day at a time
+            self.assertEqual([r.qs["fromid"] for r in m.request_history], [["0"], ["102"], ["104"]])
+
+    @isolated_metadata
+    def test_futures_trade_history_symbols(self):
+        """Without symbols, futures trades are only listed for the symbols of the commission income history"""
+        exchange_info = '{"symbols": [%s]}' % ", ".join(
+            '{"symbol": "%s", "baseAsset": "%s", "quoteAsset": "USDT"}' % (base + "USDT", base)
+            for base in ["BTC", "ETH", "XRP", "LTC"]
+        )
+        since = arrow.utcnow().shift(days=-1)
+        start = int(since.float_timestamp * 1000)
+        income = [
+            {"symbol": symbol, "incomeType": "COMMISSION", "income": "-0.01", "asset": "USDT", "time": start + i}
+            for i, symbol in enumerate(["ETHUSDT", "BTCUSDT", "ETHUSDT"])
+        ]
+        trade = {"id": 1, "price": "700", "qty": "1", "commission": "0.01", "commissionAsset": "USDT"}
+        self.futures_client.INCOME_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.get("https://fapi.binance.com/fapi/v1/exchangeInfo", text=exchange_info)
+            m.get(
+                "https://fapi.binance.com/fapi/v1/income",
+                json=lambda request, context: [i for i in income if i["time"] >= int(request.qs["starttime"][0])][:2],
+            )
+            m.get(
+                "https://fapi.binance.com/fapi/v1/userTrades",
+                json=lambda request, context: [
+                    {**trade, "symbol": request.qs["symbol"][0].upper(), "time": start + 100, "buyer": True}
+                ],
+            )
+            history = list(self.futures_client.iter_trade_history(since=since))
+
+            self.assertEqual([(t["trade_curr"], t["stake_curr"]) for t in history], [("BTC", "USDT"), ("ETH", "USDT")])
+            income_requests = [r for r in m.request_history if r.path.endswith("/income")]
+            self.assertEqual([r.qs["starttime"] for r in income_requests], [[str(start)], [str(start + 2)]])
+            self.assertEqual(income_requests[0].qs["incometype"], ["commission"])
+            trade_requests = [r for r in m.request_history if r.path.endswith("/usertrades")]
+            self.assertEqual({r.qs["symbol"][0] for r in trade_requests}, {"btcusdt", "ethusdt"})
+
+            # Older than the income history Binance keeps, the symbols have to be given
+            for since in [None, "2021-01-01"]:
+                with self.assertRaises(ValueError):
+                    list(self.futures_client.iter_trade_history(since=since))
+
+    @isolated_metadata
+    def test_market_data(self):
+        ticker = {
+            "symbol": "ETHUSDT",
+            "bidPrice": "1500.10",
+            "askPrice": "1500.20",
+            "lastPrice": "1500.15",
+            "volume": "1000.5",
+            "closeTime": 1609459200000,
+        }
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/exchangeInfo", text=EXCHANGE_INFO)
+            m.get("https://api.binance.com/api/v3/ticker/24hr", json=[ticker, {**ticker, "symbol": "DELISTED"}])
+            tickers = self.client.get_tickers()
+            self.assertEqual(
+                tickers,
+                {"ETH/USDT": Ticker("ETH/USDT", D("1500.10"), D("1500.20"), D("1500.15"), D("1000.5"), 1609459200000)},
+            )
+            # Margin clients read the spot market data
+            m.get("https://api.binance.com/api/v3/ticker/24hr", json=[ticker])
+            self.assertEqual(self.margin_client.get_ticker("ETH/USDT"), tickers["ETH/USDT"])
+            self.assertEqual(m.last_request.qs["symbols"], ['["ethusdt"]'])
+
+            m.get(
+                "https://api.binance.com/api/v3/depth",
+                json={"lastUpdateId": 7, "bids": [["1500.1", "2"], ["1500", "1"]], "asks": [["1500.2", "3"]]},
+            )
+            book = self.client.get_order_book("ETH/USDT", depth=1)
+            self.assertEqual(
+                book, OrderBookSnapshot("ETH/USDT", [(D("1500.1"), D("2"))], [(D("1500.2"), D("3"))], 7, None)
+            )
+            self.assertEqual(m.last_request.qs["limit"], ["5"])
+
+    def test_futures_tickers(self):
+        with requests_mock.mock() as m:
+            m.get(
+                "https://fapi.binance.com/fapi/v1/ticker/24hr",
+                json={"symbol": "BTCUSDT", "lastPrice": "30000", "volume": "10", "closeTime": 1},
+            )
+            m.get(
+                "https://fapi.binance.com/fapi/v1/ticker/bookTicker",
+                json={"symbol": "BTCUSDT", "bidPrice": "29999", "askPrice": "30001"},
+            )
+            ticker = self.futures_client.get_ticker("BTC/USDT")
+            self.assertEqual(ticker, Ticker("BTC/USDT", D("29999"), D("30001"), D("30000"), D("10"), 1))
+            self.assertEqual(m.last_request.qs["symbol"], ["btcusdt"])
+
+    def test_candles(self):
+        minute = 60 * 1000
+        start = 1609459200000
+        klines = [[start + i * minute, "1", "3", "0.5", "2", "100", start + (i + 1) * minute - 1] for i in range(5)]
+
+        def get_klines(request, context):
+            since, until = int(request.qs["starttime"][0]), int(request.qs["endtime"][0])
+            return [k for k in klines if since <= k[0] <= until][: int(request.qs["limit"][0])]
+
+        self.client.CANDLES_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/klines", json=get_klines)
+            candles = self.client.get_candles("ETH/USDT", "1m", start=arrow.get(start / 1000), end=start + 4 * minute)
+            # Two full pages, then an empty one
+            self.assertEqual(m.call_count, 3)
+        self.assertEqual([candle.time for candle in candles], [start + i * minute for i in range(4)])
+        self.assertEqual(candles[0], Candle(start, D("1"), D("3"), D("0.5"), D("2"), D("100")))
+        self.assertRaises(AssertionError, self.client.get_candles, "ETH/USDT", "2m")
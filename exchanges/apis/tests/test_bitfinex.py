@@ -1,11 +1,15 @@
+from decimal import Decimal as D
 import unittest
 
+import arrow
 import requests_mock
 
 from exchanges import exchange_factory
 
 from ..base import ExchangeApiException
 from ..bitfinex import BitfinexNonceException
+from ..marketdata import Candle, Ticker
+from .test_metadata import isolated_metadata
 
 
 class BitfinexTest(unittest.TestCase):
@@ -35,6 +39,20 @@ class BitfinexTest(unittest.TestCase):
         self.assertEqual("ETH/USD", self.client.unmake_symbol("tETHUSD"))
         self.assertEqual("TESTBTC/TESTUSDT", self.client.unmake_symbol("tTESTBTC:TESTUSDT"))
 
+    def test_batch_symbols(self):
+        self.assertEqual(
+            self.client.make_symbols(["ETH/USD", "XAUT/USD", "ETH/USD"]), ["tETHUSD", "tXAUT:USD", "tETHUSD"]
+        )
+        self.assertEqual(self.client.unmake_symbols(["tETHUSD", "tTESTBTC:TESTUSDT"]), ["ETH/USD", "TESTBTC/TESTUSDT"])
+        with self.assertRaises(AssertionError):
+            self.client.make_symbols(["ETH/USD", "ethusd"])
+
+    @isolated_metadata
+    def test_exchange_symbols(self):
+        with requests_mock.mock() as m:
+            m.get("https://api-pub.bitfinex.com/v2/conf/pub:list:pair:exchange", text='[["BTCUSD", "XAUT:USD"]]')
+            self.assertEqual(self.client.exchange_symbols, {"tBTCUSD", "tXAUT:USD"})
+
     def test_public_v1(self):
         with requests_mock.mock() as m:
             m.get("https://api.bitfinex.com/v1/pubticker/btcusd", text='{"mid":"244.755"}')
@@ -49,6 +67,29 @@ class BitfinexTest(unittest.TestCase):
             result = self.client.brequest(2, endpoint="auth/r/wallets", authenticate=True, method="POST")
             self.assertEqual(result, [["funding", "USD", 24570.03334688, 0, 500.143]])
 
+    def test_json_decoder(self):
+        client = exchange_factory("bitfinex")("key", "secret")
+        client.JSON_DECODER = "orjson"
+        data = {"symbol": "tBTCUSD", "amount": "0.5", "flags": [1, 2]}
+        with requests_mock.mock() as m:
+            m.post("https://api.bitfinex.com/v2/auth/w/order/submit", text='[[1, "tBTCUSD", 0.5]]')
+            m.get(
+                "https://api-pub.bitfinex.com/v2/maintenance", text='["error", 20060, "maintenance"]', status_code=500
+            )
+            self.assertEqual(
+                client.brequest(2, "auth/w/order/submit", authenticate=True, method="POST", data=data),
+                [[1, "tBTCUSD", 0.5]],
+            )
+            # The body is what was signed, byte for byte
+            request = m.request_history[0]
+            nonce = request.headers["bfx-nonce"]
+            payload = ("/api/v2/auth/w/order/submit" + nonce).encode() + request.body.encode()
+            self.assertEqual(request.headers["bfx-signature"], client.sign("secret", payload))
+
+            with self.assertRaises(ExchangeApiException) as ctx:
+                client.brequest(2, "maintenance")
+            self.assertEqual(ctx.exception.message, "maintenance")
+
     def test_errors(self):
         # Error conditions
         with requests_mock.mock() as m:
@@ -93,6 +134,9 @@ class BitfinexTest(unittest.TestCase):
                 )
                 self.client.brequest(1, "nonce")
 
+            # Retried once before giving up
+            self.assertEqual(len([r for r in m.request_history if r.path == "/v1/nonce"]), 2)
+
             with self.assertRaises(BitfinexNonceException):
                 m.get(
                     "https://api-pub.bitfinex.com/v2/nonce",
@@ -109,9 +153,95 @@ class BitfinexTest(unittest.TestCase):
                 )
                 self.client.brequest(2, "newformat")
 
+    def test_nonce_retry(self):
+        """A nonce found too small is retried once, signed again with a larger nonce"""
+        with requests_mock.mock() as m:
+            m.post(
+                "https://api.bitfinex.com/v2/auth/r/wallets",
+                [{"text": '["error",10114,"nonce: small"]', "status_code": 500}, {"text": "[]"}],
+            )
+            self.assertEqual(self.client.brequest(2, "auth/r/wallets", authenticate=True, method="POST"), [])
+            nonces = [int(r.headers["bfx-nonce"]) for r in m.request_history]
+            self.assertEqual(len(nonces), 2)
+            self.assertGreater(nonces[1], nonces[0])
+
     def test_public_v2(self):
         # One real call without a mock
         try:
             self.assertEqual(self.client.brequest(2, "platform/status"), [1])
         except ExchangeApiException:  # pragma: no cover
             print("Error fetching bitfinex platform status. Network down?")
+
+    def test_iter_trade_history(self):
+        # [ID, SYMBOL, MTS, ORDER_ID, EXEC_AMOUNT, EXEC_PRICE, ORDER_TYPE, ORDER_PRICE, MAKER, FEE, FEE_CURRENCY, CID]
+        trades = [
+            [1, "tBTCUSD", 1000, 11, 0.5, 30000, "EXCHANGE LIMIT", 30000, 1, -0.001, "BTC", 77],
+            [2, "tETHUSD", 2000, 12, -2, 2000, "EXCHANGE LIMIT", 2000, 1, -2.5, "USD", None],
+            # Same millisecond as the end of the previous page
+            [3, "tETHUSD", 2000, 12, -1, 2000, "EXCHANGE LIMIT", 2000, 1, -1.25, "USD", None],
+            [4, "tTESTBTC:TESTUSD", 3000, 13, 1, 10, "EXCHANGE LIMIT", 10, 1, -0.1, "LEO", None],
+        ]
+
+        def trades_hist(request, context):
+            body = request.json()
+            self.assertEqual(body["sort"], 1)
+            found = [t for t in trades if t[2] >= body["start"] and t[2] <= body.get("end", 10**13)]
+            return found[: body["limit"]]
+
+        self.client.TRADES_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.post("https://api.bitfinex.com/v2/auth/r/trades/hist", json=trades_hist)
+            history = list(self.client.iter_trade_history())
+            self.assertEqual([t["exchange_txn_id"] for t in history], ["1", "2", "3", "4"])
+            self.assertEqual([r.json()["start"] for r in m.request_history], [0, 2000, 2001])
+            self.assertTrue(all("bfx-signature" in r.headers for r in m.request_history))
+
+            self.assertEqual(history[0]["action"], "buy")
+            self.assertEqual(history[0]["client_order_id"], "77")
+            self.assertEqual(history[0]["fees"], D("30.000"))
+            self.assertEqual(history[1]["action"], "sell")
+            self.assertEqual(history[1]["amount"], D("2"))
+            self.assertEqual(history[1]["fees"], D("2.5"))
+            self.assertEqual(history[1]["stake_curr"], "USD")
+            self.assertEqual(history[3]["trade_curr"], "TESTBTC")
+            self.assertEqual(history[3]["fee_curr"], "LEO")
+
+            m.reset_mock()
+            history = list(self.client.iter_trade_history(since=arrow.get(1.5), until=arrow.get(2.5)))
+            self.assertEqual([t["exchange_txn_id"] for t in history], ["2", "3"])
+            self.assertEqual(m.request_history[0].json()["end"], 2499)
+
+    def test_market_data(self):
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api-pub.bitfinex.com/v2/tickers",
+                json=[
+                    ["tBTCUSD", 30000.5, 2, 30001, 3, 10, 0.01, 30000.7, 1500.25, 31000, 29000],
+                    ["fUSD", 0.0001, 0.0002, 30, 1, 0.0001, 2, 100, 0, 0, 0, 0, 0, None, None, 0],
+                ],
+            )
+            tickers = self.client.get_tickers()
+            self.assertEqual(m.last_request.qs["symbols"], ["all"])
+            self.assertEqual(
+                tickers, {"BTC/USD": Ticker("BTC/USD", D("30000.5"), D("30001"), D("30000.7"), D("1500.25"), None)}
+            )
+            self.client.get_tickers(["BTC/USD", "TESTBTC/TESTUSD"])
+            self.assertEqual(m.last_request.qs["symbols"], ["tbtcusd,ttestbtc:testusd"])
+
+            m.get(
+                "https://api-pub.bitfinex.com/v2/book/tBTCUSD/P0",
+                json=[[30000, 1, 0.5], [29999, 2, 1.5], [30001, 1, -0.25], [30002, 3, -2]],
+            )
+            book = self.client.get_order_book("BTC/USD", depth=1)
+            self.assertEqual(m.last_request.qs["len"], ["1"])
+            self.assertEqual(book.bids, [(D("30000"), D("0.5"))])
+            self.assertEqual(book.asks, [(D("30001"), D("0.25"))])
+
+            # [MTS, OPEN, CLOSE, HIGH, LOW, VOLUME], newest first without a start
+            m.get(
+                "https://api-pub.bitfinex.com/v2/candles/trade:1D:tBTCUSD/hist",
+                json=[[1609545600000, 2, 3, 4, 1, 10.5], [1609459200000, 1, 2, 3, 0.5, 20]],
+            )
+            candles = self.client.get_candles("BTC/USD", "1d")
+            self.assertEqual([candle.time for candle in candles], [1609459200000, 1609545600000])
+            self.assertEqual(candles[1], Candle(1609545600000, D("2"), D("4"), D("1"), D("3"), D("10.5")))
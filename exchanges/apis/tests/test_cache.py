@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from ..base import ExchangeApiException
+from ..cache import ResponseCache, SqliteCacheBackend
+from .stub_server import start_stub_server
+from .test_aio import stub_client
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server, self.base_url = start_stub_server(
+            routes={
+                "/api/v3/ticker/price": (200, '{"price": "1.5"}'),
+                "/api/v3/invalid": (400, '{"code": -1121, "msg": "Invalid symbol."}'),
+            },
+            delay=0.1,
+        )
+        self.client = stub_client("binance", self.base_url, "key", "secret")
+        self.client.response_cache = ResponseCache({"ticker/price": 60, "invalid": 60})
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def paths(self):
+        return [path for _, path, _, _ in self.server.requests]
+
+    def test_cached(self):
+        result = self.client.brequest(3, "ticker/price", params={"symbol": "BTCUSDT"})
+        self.assertEqual(result, {"price": "1.5"})
+        # Each caller gets its own copy
+        result["price"] = "2"
+        self.assertEqual(self.client.brequest(3, "ticker/price", params={"symbol": "BTCUSDT"}), {"price": "1.5"})
+        self.assertEqual(
+            self.client.brequest(3, "ticker/price", params={"symbol": "BTCUSDT"}, raw="bytes"), b'{"price": "1.5"}'
+        )
+        self.client.brequest(3, "ticker/price", params={"symbol": "ETHUSDT"})
+        self.assertEqual(self.paths(), ["/api/v3/ticker/price?symbol=BTCUSDT", "/api/v3/ticker/price?symbol=ETHUSDT"])
+        self.assertEqual(self.client.response_cache.stats(), {"hits": 2, "misses": 2, "coalesced": 0, "size": 2})
+
+    def test_not_cached(self):
+        # Endpoints without a ttl, and authenticated requests
+        self.client.brequest(3, "exchangeInfo")
+        self.client.brequest(3, "exchangeInfo")
+        self.client.brequest(3, "ticker/price", authenticate=True)
+        self.client.brequest(3, "ticker/price", authenticate=True)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_ttl(self):
+        cache = ResponseCache({"ticker/price": 60, "v3/ticker/price": 5, "price": 1}, default_ttl=2)
+        self.assertEqual(cache.ttl("https://api.binance.com/api/v3/ticker/price"), 5)
+        self.assertEqual(cache.ttl("https://api.binance.com/api/v3/avgPrice"), 2)
+
+        calls = []
+        with mock.patch("time.monotonic", return_value=100):
+            cache.get("https://api.binance.com/api/v3/avgPrice", None, lambda: calls.append(1) or b"1")
+        with mock.patch("time.monotonic", return_value=101.9):
+            cache.get("https://api.binance.com/api/v3/avgPrice", None, lambda: calls.append(2) or b"2")
+        with mock.patch("time.monotonic", return_value=102):
+            cache.get("https://api.binance.com/api/v3/avgPrice", None, lambda: calls.append(3) or b"3")
+        self.assertEqual(calls, [1, 3])
+
+    def test_lru(self):
+        cache = ResponseCache(default_ttl=60, maxsize=2)
+        for url in ["http://a/1", "http://a/2", "http://a/1", "http://a/3"]:
+            cache.get(url, None, lambda: b"1")
+        self.assertEqual(set(cache.entries), {"http://a/1", "http://a/3"})
+
+    def test_coalescing(self):
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: self.client.brequest(3, "ticker/price"), range(8)))
+        self.assertEqual(results, [{"price": "1.5"}] * 8)
+        self.assertEqual(len(self.server.requests), 1)
+        stats = self.client.response_cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"] + stats["coalesced"], 7)
+
+    def test_errors_not_cached(self):
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(self.client.brequest, 3, "invalid") for _ in range(4)]
+        for future in futures:
+            self.assertIsInstance(future.exception(), ExchangeApiException)
+        # Shared by the waiters, then sent again
+        first = len(self.server.requests)
+        self.assertLess(first, 4)
+        self.assertRaises(ExchangeApiException, self.client.brequest, 3, "invalid")
+        self.assertGreater(len(self.server.requests), first)
+
+    def test_async(self):
+        async def run():
+            try:
+                return await asyncio.gather(*[self.client.abrequest(3, "ticker/price") for _ in range(5)])
+            finally:
+                await self.client.aclose()
+
+        self.assertEqual(asyncio.run(run()), [{"price": "1.5"}] * 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.client.response_cache.stats()["coalesced"], 4)
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            # Two processes, each with its own cache in memory
+            first, second = SqliteCacheBackend(path), SqliteCacheBackend(path)
+            self.client.response_cache = ResponseCache({"ticker/price": 60}, backend=first)
+            other = stub_client("binance", self.base_url)
+            other.response_cache = ResponseCache({"ticker/price": 60}, backend=second)
+
+            self.assertEqual(self.client.brequest(3, "ticker/price"), {"price": "1.5"})
+            self.assertEqual(other.brequest(3, "ticker/price"), {"price": "1.5"})
+            self.assertEqual(len(self.server.requests), 1)
+
+            self.assertIsNone(first.get("expired"))
+            first.set("expired", b"1", -1)
+            self.assertIsNone(second.get("expired"))
+
+            # A response from the backend is only kept in memory for the time it has left there
+            url = "https://api.binance.com/api/v3/ticker/price"
+            first.set(url, b"2", 0.2)
+            cache = other.response_cache
+            self.assertEqual(cache.get(url, None, lambda: b"fetched"), b"2")
+            self.assertLessEqual(cache.entries[url][0] - time.monotonic(), 0.2)
+            time.sleep(0.25)
+            self.assertEqual(cache.get(url, None, lambda: b"fetched"), b"fetched")
+            other.close()
+            first.close()
+            second.close()
@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..coordinator import (
+    CoordinatedNonceGenerator,
+    CoordinatedRateLimiter,
+    CoordinatorError,
+    CoordinatorServer,
+)
+from ..ratelimit import BinanceRateLimiter, RateLimiter
+
+
+def generate(path, count, queue):
+    generator = CoordinatedNonceGenerator(path, "bitfinex-main")
+    queue.put([generator.next() for _ in range(count)])
+
+
+class CoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "coordinator.sock")
+        self.start({"binance-main": BinanceRateLimiter(), "slow": RateLimiter(limit=2, period=10)})
+
+    def start(self, rate_limiters):
+        self.server = CoordinatorServer(self.path, rate_limiters)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def test_shared_rate_limit(self):
+        # As if in two processes
+        first, second = CoordinatedRateLimiter(self.path, "slow"), CoordinatedRateLimiter(self.path, "slow")
+        self.assertEqual(first.reserve("GET", "https://example.com/a"), 0)
+        self.assertEqual(second.reserve("GET", "https://example.com/a"), 0)
+        self.assertAlmostEqual(first.reserve("GET", "https://example.com/a"), 5, delta=0.1)
+        self.assertEqual(first.stats()["throttled_requests"], 1)
+        self.assertEqual(second.shared_stats()["requests"], 3)
+
+    def test_client(self):
+        client = exchange_factory("binance")("key", "secret")
+        client.rate_limiter = CoordinatedRateLimiter(self.path, "binance-main")
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/exchangeInfo", text="{}", headers={"X-MBX-USED-WEIGHT-1M": "5990"})
+            client.brequest(3, "exchangeInfo")
+
+        # The weights and headers of every process count against the key
+        self.assertEqual(client.rate_limiter.shared_stats()["requests"], 1)
+        bucket = self.server.rate_limiters["binance-main"].bucket("weight", 6000, 60)
+        self.assertLessEqual(bucket.tokens, 10)
+        self.assertGreater(client.rate_limiter.reserve("GET", "https://api.binance.com/api/v3/exchangeInfo"), 0)
+
+    def test_nonces_across_processes(self):
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=generate, args=(self.path, 500, queue)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        results = [queue.get(timeout=30) for _ in processes]
+        for process in processes:
+            process.join()
+
+        for nonces in results:
+            self.assertEqual(nonces, sorted(nonces))
+        self.assertEqual(len({nonce for nonces in results for nonce in nonces}), 2000)
+
+    def test_errors(self):
+        self.assertRaises(CoordinatorError, CoordinatedRateLimiter(self.path, "unknown").reserve, "GET", "/")
+
+        generator = CoordinatedNonceGenerator(self.path, "bitfinex-main")
+        last = generator.next()
+        # Reconnects to a restarted coordinator
+        self.stop()
+        self.assertRaises(CoordinatorError, generator.next)
+        self.start({})
+        self.assertGreater(generator.next(), last)
+        generator.close()
+
+    def test_malformed_requests(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self.addCleanup(sock.close)
+        file = sock.makefile("rb")
+        for line in [b"not json", b"[1]", b'{"key": "slow"}', b'{"op": "nonce", "key": "slow"}']:
+            sock.sendall(line + b"\n")
+            reply = json.loads(file.readline())
+            # Answered with an error, the connection stays up
+            if line.startswith(b'{"op"'):
+                self.assertIn("nonce", reply)
+            else:
+                self.assertIn("error", reply)
+
+    def test_resent_reservation(self):
+        client = CoordinatedRateLimiter(self.path, "slow").client
+        message = {"op": "reserve", "key": "slow", "method": "GET", "url": "/", "params": None, "id": "1"}
+        self.assertEqual(client.send(message), {"wait": 0})
+        # As if the reply was lost: the second try is answered without reserving again
+        self.assertEqual(client.send(message), {"wait": 0})
+        self.assertEqual(client.send({**message, "id": "2"}), {"wait": 0})
+        self.assertEqual(self.server.rate_limiters["slow"].stats()["requests"], 2)
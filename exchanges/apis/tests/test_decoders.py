@@ -0,0 +1,55 @@
+from decimal import Decimal as D
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..base import ExchangeApiException
+from ..decoders import DECODERS, json_decoder
+
+PAYLOAD = b'{"symbol": "BTCUSDT", "price": 30000.12345678, "qty": "0.5", "ids": [1, 2], "ok": true, "none": null}'
+
+
+class JsonDecoderTest(unittest.TestCase):
+    def test_decoders(self):
+        expected = {"symbol": "BTCUSDT", "price": 30000.12345678, "qty": "0.5", "ids": [1, 2], "ok": True, "none": None}
+        for name in DECODERS:
+            self.assertEqual(json_decoder(name)(PAYLOAD), expected)
+            self.assertEqual(json_decoder(name)(PAYLOAD.decode()), expected)
+            with self.assertRaises(ValueError):
+                json_decoder(name)(b"{badjson")
+
+    def test_decimals(self):
+        result = json_decoder("json", decimals=True)(b'{"price": 0.1, "exp": 1e-8, "id": 12, "qty": "0.5"}')
+        self.assertEqual(result, {"price": D("0.1"), "exp": D("1e-8"), "id": 12, "qty": "0.5"})
+        self.assertIsInstance(result["id"], int)
+        with self.assertRaises(ValueError):
+            json_decoder("orjson", decimals=True)
+
+    def test_client(self):
+        client = exchange_factory("binance")()
+        client.JSON_DECODER, client.JSON_DECIMALS = "json", True
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/ticker/price", text='{"price": 30000.1}')
+            self.assertEqual(client.brequest(3, "ticker/price"), {"price": D("30000.1")})
+
+            client.JSON_DECODER, client.JSON_DECIMALS = "orjson", False
+            m.get("https://api.binance.com/api/v3/badjson", text="{badjson")
+            with self.assertRaisesRegex(ExchangeApiException, "Could not decode JSON response"):
+                client.brequest(3, "badjson")
+        # Other clients keep the default
+        self.assertEqual(exchange_factory("binance")().JSON_DECODER, "json")
+
+    def test_string_prices(self):
+        # Binance sends prices as strings, JSON_DECIMALS leaves them alone
+        client = exchange_factory("binance")()
+        client.JSON_DECIMALS = True
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.binance.com/api/v3/ticker/price",
+                text='{"symbol": "BTCUSDT", "price": "30000.10000000", "time": 1499827319559}',
+            )
+            result = client.brequest(3, "ticker/price")
+        self.assertEqual(result, {"symbol": "BTCUSDT", "price": "30000.10000000", "time": 1499827319559})
+        self.assertIsInstance(result["price"], str)
@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from ..base import ExchangeApiException
+from ..ratelimit import RateLimiter
+from .stub_server import start_stub_server
+from .test_aio import stub_client
+
+
+class FanOutTest(unittest.TestCase):
+    DELAY = 0.05
+
+    def setUp(self):
+        self.server, self.base_url = start_stub_server(
+            delay=self.DELAY, routes={"/api/v3/myTrades": (200, "[]"), "/api/v3/bad": (400, '{"msg": "bad symbol"}')}
+        )
+        self.client = stub_client("binance", self.base_url, "key", "secret")
+        self.addCleanup(self.client.close)
+        self.calls = {
+            symbol: dict(api_version=3, endpoint="myTrades", authenticate=True, params={"symbol": symbol})
+            for symbol in ["BTCUSDT", "ETHUSDT", "SOLUSDT", "ADAUSDT", "DOTUSDT", "XRPUSDT"]
+        }
+        self.calls["BADUSDT"] = dict(api_version=3, endpoint="bad", params={"symbol": "BADUSDT"})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def check(self, result):
+        self.assertEqual(sorted(result.results), sorted(symbol for symbol in self.calls if symbol != "BADUSDT"))
+        self.assertEqual(result.results["BTCUSDT"], [])
+        self.assertEqual(list(result.errors), ["BADUSDT"])
+        self.assertIsInstance(result.errors["BADUSDT"], ExchangeApiException)
+        # Calls overlapped: much faster than one after the other
+        self.assertGreaterEqual(result.serial_time, len(self.calls) * self.DELAY)
+        self.assertLess(result.wall_time, result.serial_time / 2)
+        self.assertGreater(result.speedup, 2)
+
+    def test_fan_out(self):
+        self.client.rate_limiter = RateLimiter(limit=100)
+        result = self.client.fan_out(self.calls)
+        self.check(result)
+        self.assertEqual(self.client.rate_limiter.stats()["requests"], len(self.calls))
+        signed = [path for _, path, headers, _ in self.server.requests if "signature=" in path]
+        self.assertEqual(len(signed), len(self.calls) - 1)
+
+    def test_fan_out_limits_concurrency(self):
+        result = self.client.fan_out(self.calls, max_workers=1)
+        self.assertGreaterEqual(result.wall_time, len(self.calls) * self.DELAY)
+
+    def test_afan_out(self):
+        async def run():
+            try:
+                return await self.client.afan_out(self.calls)
+            finally:
+                await self.client.aclose()
+
+        self.check(asyncio.run(run()))
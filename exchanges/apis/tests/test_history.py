@@ -0,0 +1,103 @@
+from decimal import Decimal as D
+import os
+import tempfile
+import unittest
+
+import arrow
+
+from ..base import BaseExchangeApi, milliseconds
+from ..history import TradeHistorySync
+
+START = arrow.get("2021-01-01")
+
+
+def trade(i):
+    return {
+        "exchange_txn_id": str(i),
+        "time": START.shift(hours=i),
+        "action": "buy",
+        "stake_curr": "USD",
+        "trade_curr": "BTC",
+        "amount": D("0.5"),
+        "price": D("30000.1"),
+        "fees": D("1.5"),
+    }
+
+
+class FakeHistoryApi(BaseExchangeApi):
+    TRADE_HISTORY_ORDERED = True
+
+    def __init__(self, trades):
+        super().__init__()
+        self.trades = trades
+        self.calls = []
+        self.fail_after = None
+
+    def iter_trade_history(self, since=None, until=None):
+        self.calls.append((since and milliseconds(since), milliseconds(until)))
+        for count, record in enumerate(self.trades):
+            if self.fail_after is not None and count >= self.fail_after:
+                raise ConnectionError("network down")
+            if (since is None or record["time"] >= since) and record["time"] < until:
+                yield record
+
+
+class TradeHistorySyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "trades.db")
+        self.client = FakeHistoryApi([trade(i) for i in range(10)])
+
+    def syncer(self, **kwargs):
+        syncer = TradeHistorySync(self.client, "fake", "main", self.path, batch_size=3, overlap=3600, **kwargs)
+        self.addCleanup(syncer.close)
+        return syncer
+
+    def test_incremental_sync(self):
+        syncer = self.syncer()
+        self.assertEqual(syncer.sync(until=START.shift(hours=5)), 5)
+        self.assertEqual(self.client.calls[-1], (None, milliseconds(START.shift(hours=5))))
+
+        # Only asks for trades since the last sync (less the overlap), and skips the ones it has
+        self.assertEqual(syncer.sync(until=START.shift(hours=20)), 5)
+        self.assertEqual(self.client.calls[-1][0], milliseconds(START.shift(hours=4)))
+        self.assertEqual(syncer.sync(until=START.shift(hours=20)), 0)
+
+        stored = list(syncer.trades())
+        self.assertEqual(stored, [trade(i) for i in range(10)])
+        self.assertEqual([t["exchange_txn_id"] for t in syncer.trades(since=START.shift(hours=8))], ["8", "9"])
+
+        # Cursors survive a restart
+        self.assertEqual(self.syncer().cursor()["synced_until"], milliseconds(START.shift(hours=20)))
+
+    def test_resume_after_crash(self):
+        syncer = self.syncer()
+        self.client.fail_after = 7
+        with self.assertRaises(ConnectionError):
+            syncer.sync(until=START.shift(hours=20))
+        # Two batches of 3 were committed
+        self.assertEqual(len(list(syncer.trades())), 6)
+        self.assertEqual(syncer.cursor()["checkpoint"], milliseconds(START.shift(hours=5)))
+
+        # A new process picks up the interrupted window after the last stored trade
+        self.client.fail_after = None
+        syncer = self.syncer()
+        self.assertEqual(syncer.sync(), 4)
+        self.assertEqual(
+            self.client.calls[-1], (milliseconds(START.shift(hours=5)), milliseconds(START.shift(hours=20)))
+        )
+        self.assertEqual(len(list(syncer.trades())), 10)
+        self.assertEqual(syncer.cursor()["run_until"], None)
+
+    def test_resume_unordered_history(self):
+        self.client.TRADE_HISTORY_ORDERED = False
+        syncer = self.syncer()
+        self.client.fail_after = 4
+        with self.assertRaises(ConnectionError):
+            syncer.sync(until=START.shift(hours=20))
+
+        # Restarts the whole interrupted window, as earlier trades may still be missing
+        self.client.fail_after = None
+        self.assertEqual(syncer.sync(), 7)
+        self.assertEqual(self.client.calls[-1][0], None)
@@ -1,10 +1,18 @@
+from decimal import Decimal as D
+from urllib.parse import urlsplit
+import base64
+import hashlib
+import hmac
 import unittest
 
+import arrow
 import requests_mock
 
 from exchanges import exchange_factory
 
 from ..base import ExchangeApiException
+from ..marketdata import Candle, OrderBookSnapshot, Ticker
+from .test_metadata import isolated_metadata
 
 
 class KuCoinTest(unittest.TestCase):
@@ -30,9 +38,131 @@ class KuCoinTest(unittest.TestCase):
             result = self.client.brequest(1, "margin/trade/last", params={"currency": "USDT"})
             self.assertEqual(result, {"code": "200000", "data": [{"tradeId": "123", "currency": "USDT", "size": 100}]})
 
+    def test_symbols(self):
+        self.assertEqual("ETH-USDT", self.client.get_symbol("USDT", "ETH"))
+        self.assertEqual("ETH/USDT", self.client.get_pair("ETH-USDT"))
+        self.assertEqual(["ETH-USDT", "BTC-USDT"], self.client.make_symbols(["ETH/USDT", "BTC/USDT"]))
+        self.assertEqual(["ETH/USDT", "BTC/USDT"], self.client.unmake_symbols(["ETH-USDT", "BTC-USDT"]))
+
+    @isolated_metadata
+    def test_symbol_index(self):
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.kucoin.com/api/v2/symbols",
+                json={
+                    "code": "200000",
+                    "data": [{"symbol": "BTC-USDT", "baseCurrency": "BTC", "quoteCurrency": "USDT"}],
+                },
+            )
+            self.assertEqual(self.client.symbol_index["BTC-USDT"]["baseCurrency"], "BTC")
+
     def test_auth(self):
         with requests_mock.mock() as m:
             m.delete("https://api.kucoin.com/api/v1/orders", json={"code": "200000", "data": {"cancelledOrderIds": []}})
             result = self.client.brequest(1, "orders", True, "DELETE")
             self.assertEqual(result, {"code": "200000", "data": {"cancelledOrderIds": []}})
             self.assertEqual(self.client.passphrase, "passphrase")
+
+    def test_iter_trade_history(self):
+        day = 24 * 60 * 60 * 1000
+        start = 1609459200000  # 2021-01-01
+        fills = [
+            {
+                "symbol": "ETH-USDT" if i % 2 else "BTC-USDT",
+                "tradeId": f"t{i}",
+                "orderId": "o1",
+                "side": "buy" if i % 2 else "sell",
+                "price": "100",
+                "size": "2",
+                "fee": "0.01",
+                "feeCurrency": "ETH" if i % 2 else "USDT",
+                "createdAt": start + i * 2 * day,
+            }
+            for i in range(5)
+        ]
+
+        def list_fills(request, context):
+            qs = {name: values[0] for name, values in request.qs.items()}
+            self.assertEqual(qs["tradetype"], "trade")  # requests_mock lowercases the query
+            # Newest first
+            found = [f for f in reversed(fills) if int(qs["startat"]) <= f["createdAt"] <= int(qs["endat"])]
+            page, size = int(qs["currentpage"]), int(qs["pagesize"])
+            first = (page - 1) * size
+            return {
+                "code": "200000",
+                "data": {
+                    "currentPage": page,
+                    "pageSize": size,
+                    "totalNum": len(found),
+                    "totalPage": (len(found) + size - 1) // size,
+                    "items": found[first:][:size],
+                },
+            }
+
+        self.client.TRADES_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.get("https://api.kucoin.com/api/v1/fills", json=list_fills)
+            history = list(self.client.iter_trade_history(since=arrow.get(start / 1000), until="2021-01-11"))
+            self.assertEqual([t["exchange_txn_id"] for t in history], ["t0", "t1", "t2", "t3", "t4"])
+            # Week 1: t0-t3 (2 pages, page 1 first), week 2: t4
+            self.assertEqual([r.qs["currentpage"] for r in m.request_history], [["1"], ["2"], ["1"]])
+
+            self.assertEqual(history[0]["action"], "sell")
+            self.assertEqual(history[0]["trade_curr"], "BTC")
+            self.assertEqual(history[0]["fees"], D("0.01"))
+            self.assertEqual(history[1]["fees"], D("1.00"))
+            self.assertEqual(history[1]["time"], arrow.get("2021-01-03"))
+
+            # The query string is signed, with no body for GET
+            request = m.request_history[0]
+            url = urlsplit(request.url)
+            signed = request.headers["KC-API-TIMESTAMP"] + "GET" + url.path + "?" + url.query
+            signature = base64.b64encode(hmac.new(b"secret", signed.encode(), hashlib.sha256).digest())
+            self.assertEqual(request.headers["KC-API-SIGN"], signature)
+
+    def test_market_data(self):
+        ticker = {"symbol": "BTC-USDT", "buy": "30000.1", "sell": "30000.2", "last": "30000.15", "vol": "12.5"}
+        with requests_mock.mock() as m:
+            m.get("https://api.kucoin.com/api/v1/market/stats", json={"code": "200000", "data": {**ticker, "time": 5}})
+            self.assertEqual(
+                self.client.get_ticker("BTC/USDT"),
+                Ticker("BTC/USDT", D("30000.1"), D("30000.2"), D("30000.15"), D("12.5"), 5),
+            )
+            inactive = {"symbol": "NEW-USDT", "buy": None, "sell": None, "last": None, "vol": "0"}
+            m.get(
+                "https://api.kucoin.com/api/v1/market/allTickers",
+                json={"code": "200000", "data": {"time": 6, "ticker": [ticker, inactive]}},
+            )
+            tickers = self.client.get_tickers()
+            self.assertEqual(list(tickers), ["BTC/USDT", "NEW/USDT"])
+            self.assertIsNone(tickers["NEW/USDT"].bid)
+            self.assertEqual(list(self.client.get_tickers(["NEW/USDT"])), ["NEW/USDT"])
+
+            m.get(
+                "https://api.kucoin.com/api/v1/market/orderbook/level2_20",
+                json={
+                    "code": "200000",
+                    "data": {"sequence": "42", "time": 7, "bids": [["1", "2"]], "asks": [["3", "4"]]},
+                },
+            )
+            self.assertEqual(
+                self.client.get_order_book("BTC/USDT", depth=20),
+                OrderBookSnapshot("BTC/USDT", [(D("1"), D("2"))], [(D("3"), D("4"))], 42, 7),
+            )
+
+    def test_candles(self):
+        # [start (seconds), open, close, high, low, volume, turnover], newest first
+        rows = [[str(1609459200 + i * 60), "1", "2", "3", "0.5", "10", "15"] for i in range(4)]
+
+        def candles(request, context):
+            start, end = int(request.qs["startat"][0]), int(request.qs["endat"][0])
+            return {"code": "200000", "data": [row for row in reversed(rows) if start <= int(row[0]) <= end]}
+
+        self.client.CANDLES_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.get("https://api.kucoin.com/api/v1/market/candles", json=candles)
+            result = self.client.get_candles("BTC/USDT", "1m", start="2021-01-01T00:00", end="2021-01-01T00:04")
+            self.assertEqual(m.call_count, 2)
+            self.assertEqual(m.last_request.qs["type"], ["1min"])
+        self.assertEqual([candle.time for candle in result], [(1609459200 + i * 60) * 1000 for i in range(4)])
+        self.assertEqual(result[0], Candle(1609459200000, D("1"), D("3"), D("0.5"), D("2"), D("10")))
@@ -0,0 +1,75 @@
+import sys
+import unittest
+
+from loguru import logger
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..base import ExchangeApiException
+from ..logs import REDACTED, RequestLog
+
+
+class Value:
+    """Counts how often it's formatted"""
+
+    formatted = 0
+
+    def __repr__(self):
+        Value.formatted += 1
+        return "value"
+
+
+class RequestLogTest(unittest.TestCase):
+    def capture(self, level):
+        messages = []
+        handler = logger.add(lambda message: messages.append(message.record["message"]), level=level)
+        self.addCleanup(logger.remove, handler)
+        return messages
+
+    def test_redacted(self):
+        messages = self.capture("DEBUG")
+        client = exchange_factory("binance")("my key", "my secret")
+        client.request_log = RequestLog(max_length=60)
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/account", text="{}")
+            client.brequest(3, "account", authenticate=True, params={"recvWindow": 5000, "symbols": "X" * 100})
+            m.get("https://api.binance.com/api/v3/order", text='{"msg": "Unknown order"}', status_code=400)
+            with self.assertRaises(ExchangeApiException):
+                client.brequest(3, "order", authenticate=True, params={"orderId": 1})
+        request, response, _, _, error = [message for message in messages if "Request" in message]
+        self.assertIn("... (135 characters)", request)
+        self.assertIn(f"signature={REDACTED}", response)
+        self.assertIn("recvWindow=5000", response)
+        self.assertNotIn("my key", error)
+        self.assertIn(f"'X-MBX-APIKEY': '{REDACTED}'", error)
+
+    def test_lazy_and_sampled(self):
+        # Only handlers above DEBUG, like an application logging at INFO
+        logger.remove()
+        self.addCleanup(logger.add, sys.stderr)
+        log = RequestLog(sample_every=3)
+        messages = self.capture("INFO")
+        Value.formatted = 0
+        for _ in range(10):
+            log.request("GET", "https://example.com", {"a": Value()}, None, None)
+        self.assertEqual(Value.formatted, 0)
+        self.assertEqual(messages, [])
+
+        messages = self.capture("DEBUG")
+        log = RequestLog(sample_every=3)
+        for _ in range(10):
+            log.request("GET", "https://example.com", {"a": Value()}, None, None)
+        self.assertEqual(Value.formatted, 4)
+        self.assertEqual(messages, ["Requesting GET https://example.com with {'a': value}"] * 4)
+
+    def test_disabled(self):
+        messages = self.capture("DEBUG")
+        client = exchange_factory("binance")()
+        client.request_log = RequestLog(enabled=False)
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/time", text="{}")
+            client.brequest(3, "time")
+        client.request_log.error({}, {})
+        self.assertEqual([message for message in messages if "Request" in message], [])
+        self.assertEqual(next(client.request_log.request_count), 0)
@@ -0,0 +1,85 @@
+from unittest import mock
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from ..metadata import METADATA_CACHES, MetadataCache
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(os.environ, {"EXCHANGES_CACHE_DIR": self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.calls = 0
+
+    def loader(self):
+        self.calls += 1
+        return [self.calls]
+
+    def test_stale_while_revalidate(self):
+        cache = MetadataCache("test", ttl=60)
+        self.assertEqual(cache.get(self.loader), [1])
+        self.assertEqual(cache.get(self.loader), [1])
+        self.assertEqual(self.calls, 1)
+
+        # Expired: the stale copy is served while the refresh runs in the background
+        cache.fetched_at -= 120
+        refreshed = threading.Event()
+
+        def slow_loader():
+            time.sleep(0.05)
+            refreshed.set()
+            return ["new"]
+
+        self.assertEqual(cache.get(slow_loader), [1])
+        self.assertEqual(cache.get(slow_loader), [1])
+        self.assertTrue(refreshed.wait(1))
+        time.sleep(0.01)
+        self.assertEqual(cache.get(slow_loader), ["new"])
+
+    def test_failed_refresh(self):
+        cache = MetadataCache("test", ttl=60)
+        cache.get(self.loader)
+        cache.fetched_at -= 120
+
+        def failing_loader():
+            raise ValueError("down")
+
+        self.assertEqual(cache.get(failing_loader), [1])
+        time.sleep(0.05)
+        self.assertEqual(cache.get(self.loader), [1])
+        # Not retried straight away
+        self.assertGreater(cache.next_refresh, time.time())
+        self.assertEqual(self.calls, 1)
+
+    def test_snapshot(self):
+        MetadataCache("test", transform=set).get(self.loader)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "test.json")))
+
+        # A new process starts from the snapshot without calling the loader
+        cold = MetadataCache("test", transform=set)
+        self.assertEqual(cold.get(self.loader), {1})
+        self.assertEqual(self.calls, 1)
+
+        with open(os.path.join(self.tmp.name, "broken.json"), "w") as f:
+            f.write("{not json")
+        self.assertEqual(MetadataCache("broken").get(self.loader), [2])
+
+
+def isolated_metadata(test):
+    """Decorator running a test with empty metadata caches and snapshots in a temporary directory"""
+
+    def wrapper(*args, **kwargs):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {"EXCHANGES_CACHE_DIR": tmp}):
+            METADATA_CACHES.clear()
+            try:
+                return test(*args, **kwargs)
+            finally:
+                METADATA_CACHES.clear()
+
+    return wrapper
@@ -0,0 +1,131 @@
+import asyncio
+import socket
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..backoff import AdaptiveBackoff
+from ..base import ExchangeApiException
+from ..metrics import InMemoryMetrics, PrometheusMetrics, StatsdMetrics
+from ..middleware import ProfilerMiddleware
+from ..ratelimit import RateLimiter
+from .stub_server import start_stub_server
+from .test_aio import stub_client
+
+
+class MetricsTest(unittest.TestCase):
+    def test_request_metrics(self):
+        client = exchange_factory("binance")()
+        client.metrics = metrics = InMemoryMetrics()
+        client.rate_limiter = RateLimiter(limit=1, period=0.05)
+        client.backoff = AdaptiveBackoff(base_delay=0.01)
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/exchangeInfo", text='{"symbols": []}')
+            m.get(
+                "https://api.binance.com/api/v3/ticker/price",
+                [{"status_code": 429, "text": "{}"}, {"text": '{"price": "1"}'}],
+            )
+            m.get("https://api.binance.com/api/v3/order", status_code=400, text='{"msg": "Unknown order"}')
+
+            client.brequest(3, "exchangeInfo")
+            client.brequest(3, "ticker/price")
+            with self.assertRaises(ExchangeApiException):
+                client.brequest(3, "order")
+
+        self.assertEqual(metrics.histogram("request_seconds", exchange="binance")[0], 4)
+        self.assertEqual(metrics.histogram("request_seconds", status="2xx")[0], 2)
+        self.assertEqual(metrics.histogram("request_seconds", status="4xx", endpoint="/api/v3/ticker/price")[0], 1)
+        self.assertEqual(metrics.histogram("request_seconds", status="4xx", endpoint="/api/v3/order")[0], 1)
+        self.assertEqual(metrics.histogram("decode_seconds")[0], 2)
+        self.assertEqual(metrics.counter("received_bytes_total", endpoint="/api/v3/exchangeInfo"), 15)
+        self.assertEqual(metrics.counter("retries_total", reason="rate_limit"), 1)
+        # One token per 50ms, then the 429 cool down
+        count, seconds = metrics.histogram("rate_limit_wait_seconds")
+        self.assertEqual(count, 3)
+        self.assertGreater(seconds, 0.05)
+
+    def test_endpoint_routes(self):
+        """Symbols and ids in url paths don't make a series each"""
+        client = exchange_factory("bitfinex")()
+        client.metrics = metrics = InMemoryMetrics()
+        client.middlewares = [profiler := ProfilerMiddleware()]
+        with requests_mock.mock() as m:
+            m.get(requests_mock.ANY, text="[]")
+            client.get_order_book("BTC/USD")
+            client.get_order_book("ETH/USD")
+            client.get_candles("BTC/USD", "1h")
+
+        endpoints = {dict(tags)["endpoint"] for name, tags in metrics.histograms if name == "request_seconds"}
+        self.assertEqual(endpoints, {"/v2/book/{symbol}/{precision}", "/v2/candles/trade:{interval}:{symbol}/hist"})
+        self.assertEqual(metrics.histogram("request_seconds", endpoint="/v2/book/{symbol}/{precision}")[0], 2)
+        self.assertEqual(profiler.stats()[("bitfinex", "/v2/book/{symbol}/{precision}")]["calls"], 2)
+
+        kucoin, sfox = exchange_factory("kucoin")(), exchange_factory("sfox")()
+        self.assertEqual(
+            kucoin.metric_endpoint("https://api.kucoin.com/api/v1/orders/5c35c02703aa673ceec2a168"),
+            "/api/v1/orders/{id}",
+        )
+        self.assertEqual(
+            sfox.metric_endpoint("https://api.sfox.com/v1/markets/orderbook/ethbtc"), "/v1/markets/orderbook/{symbol}"
+        )
+        self.assertEqual(
+            client.metric_endpoint("https://api.bitfinex.com/v1/pubticker/btcusd"), "/v1/pubticker/{symbol}"
+        )
+
+    def test_status_retries(self):
+        server, base_url = start_stub_server(
+            routes={"/api/v3/flaky": [(503, "down"), (200, '{"ok": true}'), (503, "down"), (200, '{"ok": true}')]}
+        )
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = stub_client("binance", base_url)
+        client.metrics = metrics = InMemoryMetrics()
+
+        self.assertEqual(client.brequest(3, "flaky", params={"a": 1}), {"ok": True})
+
+        async def run():
+            try:
+                return await client.abrequest(3, "flaky", params={"a": 1})
+            finally:
+                await client.aclose()
+
+        self.assertEqual(asyncio.run(run()), {"ok": True})
+        self.assertEqual(metrics.counter("retries_total", reason="status"), 2)
+        self.assertEqual(metrics.histogram("request_seconds", status="2xx", endpoint="/api/v3/flaky")[0], 2)
+
+    def test_prometheus(self):
+        metrics = PrometheusMetrics(buckets=[0.1, 1])
+        tags = {"exchange": "binance", "endpoint": "/api/v3/depth", "method": "GET"}
+        metrics.observe("request_seconds", 0.05, {**tags, "status": "2xx"})
+        metrics.observe("request_seconds", 0.5, {**tags, "status": "2xx"})
+        metrics.increment("retries_total", 2, {**tags, "reason": 'say "hi"'})
+        labels = 'endpoint="/api/v3/depth",exchange="binance",method="GET",status="2xx"'
+        self.assertEqual(
+            metrics.render().splitlines(),
+            [
+                "# TYPE exchanges_retries_total counter",
+                'exchanges_retries_total{endpoint="/api/v3/depth",exchange="binance",method="GET",'
+                'reason="say \\"hi\\""} 2',
+                "# TYPE exchanges_request_seconds histogram",
+                f'exchanges_request_seconds_bucket{{{labels},le="0.1"}} 1',
+                f'exchanges_request_seconds_bucket{{{labels},le="1"}} 2',
+                f'exchanges_request_seconds_bucket{{{labels},le="+Inf"}} 2',
+                f"exchanges_request_seconds_sum{{{labels}}} 0.55",
+                f"exchanges_request_seconds_count{{{labels}}} 2",
+            ],
+        )
+
+    def test_statsd(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(5)
+        self.addCleanup(receiver.close)
+        metrics = StatsdMetrics(port=receiver.getsockname()[1])
+        self.addCleanup(metrics.close)
+
+        metrics.observe("request_seconds", 0.25, {"exchange": "binance", "status": "2xx"})
+        metrics.increment("received_bytes_total", 100, {"exchange": "binance"})
+        self.assertEqual(receiver.recv(1024), b"exchanges.request:250.000|ms|#exchange:binance,status:2xx")
+        self.assertEqual(receiver.recv(1024), b"exchanges.received_bytes_total:100|c|#exchange:binance")
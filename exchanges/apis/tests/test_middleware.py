@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import hmac
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..backoff import AdaptiveBackoff
+from ..base import ExchangeApiException
+from ..middleware import Middleware, ProfilerMiddleware
+from .stub_server import start_stub_server
+from .test_aio import stub_client
+
+
+class MaintenanceException(ExchangeApiException):
+    pass
+
+
+class Recorder(Middleware):
+    def __init__(self, name, events):
+        self.name = name
+        self.events = events
+
+    def before_sign(self, call):
+        self.events.append((self.name, "before_sign", call.attempt))
+        call.headers["X-Request-Id"] = "abc"
+        call.params["recvWindow"] = 5000
+
+    def after_send(self, call, response):
+        self.events.append((self.name, "after_send", response.status_code))
+
+    def after_parse(self, call, result):
+        self.events.append((self.name, "after_parse", None))
+        return {**result, self.name: True} if isinstance(result, dict) else result
+
+    def on_error(self, call, exc):
+        self.events.append((self.name, "on_error", exc.status_code))
+        if exc.status_code == 503:
+            return MaintenanceException(exc.method, exc.url, exc.status_code, exc.message)
+        return exc
+
+
+class MiddlewareTest(unittest.TestCase):
+    def test_hooks(self):
+        events = []
+        client = exchange_factory("binance")("key", "secret")
+        client.middlewares = [Recorder("first", events), Recorder("second", events)]
+        client.backoff = AdaptiveBackoff(base_delay=0.01)
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.binance.com/api/v3/account",
+                [{"status_code": 429, "text": "{}"}, {"text": '{"balances": []}'}],
+            )
+            result = client.brequest(3, "account", authenticate=True, params={"symbol": "BTCUSDT"})
+            request = m.request_history[-1]
+
+        self.assertEqual(result, {"balances": [], "first": True, "second": True})
+        self.assertEqual(
+            events,
+            [
+                ("first", "before_sign", 0),
+                ("second", "before_sign", 0),
+                ("second", "after_send", 429),
+                ("first", "after_send", 429),
+                ("first", "before_sign", 1),
+                ("second", "before_sign", 1),
+                ("second", "after_send", 200),
+                ("first", "after_send", 200),
+                ("second", "after_parse", None),
+                ("first", "after_parse", None),
+            ],
+        )
+        # Headers and params added before signing are sent, and signed
+        self.assertEqual(request.headers["X-Request-Id"], "abc")
+        query, signature = request.url.split("?")[1].split("&signature=")
+        self.assertIn("recvWindow=5000", query)
+        expected = hmac.new(b"secret", query.encode(), hashlib.sha256).hexdigest().upper()
+        self.assertEqual(signature, expected)
+
+    def test_error_mapping(self):
+        events = []
+        client = exchange_factory("binance")()
+        client.middlewares = [Recorder("first", events)]
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/ping", status_code=503, text="maintenance")
+            with self.assertRaises(MaintenanceException):
+                client.brequest(3, "ping", params={})
+        self.assertEqual(events[-1], ("first", "on_error", 503))
+
+    def test_profiler(self):
+        profiles = []
+        profiler = ProfilerMiddleware(callback=lambda call, profile: profiles.append(profile))
+        client = exchange_factory("binance")()
+        client.middlewares = [profiler]
+        with requests_mock.mock() as m:
+            m.get("https://api.binance.com/api/v3/depth", text='{"bids": [], "asks": []}')
+            m.get("https://api.binance.com/api/v3/bad", text="{bad")
+            client.brequest(3, "depth", params={"symbol": "BTCUSDT"})
+            client.brequest(3, "depth", params={"symbol": "ETHUSDT"})
+            with self.assertRaises(ExchangeApiException):
+                client.brequest(3, "bad", params={})
+
+        self.assertEqual(len(profiles), 3)
+        for profile in profiles:
+            self.assertEqual(profile["attempts"], 1)
+            self.assertAlmostEqual(profile["wait"] + profile["send"] + profile["parse"], profile["total"], places=3)
+        stats = profiler.stats()
+        self.assertEqual(stats[("binance", "/api/v3/depth")]["calls"], 2)
+        self.assertEqual(stats[("binance", "/api/v3/bad")]["errors"], 1)
+        report = profiler.report().splitlines()
+        self.assertEqual(len(report), 3)
+        self.assertIn("binance /api/v3/depth", profiler.report())
+
+    def test_async(self):
+        server, base_url = start_stub_server(routes={"/api/v3/down": (503, "down")})
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        events = []
+        client = stub_client("binance", base_url, "key", "secret")
+        client.RETRIES = 0
+        client.middlewares = [Recorder("first", events)]
+
+        async def run():
+            try:
+                result = await client.abrequest(3, "account", authenticate=True)
+                with self.assertRaises(MaintenanceException):
+                    await client.abrequest(3, "down", params={})
+                return result
+            finally:
+                await client.aclose()
+
+        self.assertEqual(asyncio.run(run()), [1])
+        method, path, headers, body = server.requests[0]
+        self.assertEqual(headers["X-Request-Id"], "abc")
+        self.assertIn("recvWindow=5000", path)
+        self.assertEqual(
+            [event[1] for event in events],
+            ["before_sign", "after_send", "after_parse", "before_sign", "after_send", "on_error"],
+        )
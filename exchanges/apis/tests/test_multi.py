@@ -0,0 +1,153 @@
+from decimal import Decimal as D
+import json
+import time
+import unittest
+
+import arrow
+
+from exchanges import MultiExchangeClient
+
+from .stub_server import start_stub_server
+from .test_aio import stub_client
+
+ROUTES = {
+    "/api/v3/account": (
+        200,
+        json.dumps(
+            {
+                "balances": [
+                    {"asset": "BTC", "free": "1.5", "locked": "0.5"},
+                    {"asset": "USDT", "free": "100", "locked": "0"},
+                    {"asset": "ETH", "free": "0", "locked": "0"},
+                ]
+            }
+        ),
+    ),
+    "/api/v1/accounts": (
+        200,
+        json.dumps(
+            {
+                "code": "200000",
+                "data": [
+                    {"currency": "BTC", "type": "main", "balance": "1", "available": "1", "holds": "0"},
+                    {"currency": "BTC", "type": "trade", "balance": "2", "available": "1.5", "holds": "0.5"},
+                ],
+            }
+        ),
+    ),
+    "/v1/user/balance": (200, json.dumps([{"currency": "usd", "balance": 50.25, "available": 50.25, "held": 0}])),
+    "/v1/account/transactions": (
+        200,
+        json.dumps(
+            [
+                {
+                    "id": 1,
+                    "day": "2021-01-02T00:00:00.000Z",
+                    "action": "Buy",
+                    "currency": "btc",
+                    "amount": 1,
+                    "price": 30000,
+                    "fees": 5,
+                }
+            ]
+        ),
+    ),
+}
+TICKER = {"symbol": "BTCUSDT", "bidPrice": "1", "askPrice": "2", "lastPrice": "1.5", "volume": "10", "closeTime": 3}
+ROUTES["/api/v3/ticker/24hr"] = (200, json.dumps([TICKER]))
+ROUTES["/api/v1/market/allTickers"] = (
+    200,
+    json.dumps(
+        {
+            "code": "200000",
+            "data": {
+                "time": 4,
+                "ticker": [{"symbol": "BTC-USDT", "buy": "1", "sell": "2", "last": "1.5", "vol": "20"}],
+            },
+        }
+    ),
+)
+ROUTES["/v1/markets/orderbook/btcusdt"] = (200, json.dumps({"bids": [[1, 3, "m"]], "asks": [[2, 1, "m"]]}))
+ROUTES["/candlesticks"] = (200, "[]")
+SLOW_ROUTES = {
+    "/v2/auth/r/wallets": (200, json.dumps([["exchange", "BTC", 3, 0, None], ["margin", "USD", 0, 0, 0]])),
+}
+
+
+class MultiExchangeClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server, base_url = start_stub_server(routes=ROUTES)
+        self.slow_server, slow_url = start_stub_server(routes=SLOW_ROUTES, delay=0.5)
+        self.clients = {
+            "binance:main": stub_client("binance", base_url, "key", "secret"),
+            "kucoin:main": stub_client("kucoin", base_url, "passphrase", "key", "secret"),
+            "sfox:main": stub_client("sfox", base_url, "key", "secret"),
+            "bitfinex:main": stub_client("bitfinex", slow_url, "key", "secret"),
+        }
+        self.client = MultiExchangeClient(self.clients, timeout=5)
+        self.addCleanup(self.client.close)
+
+    def tearDown(self):
+        for server in [self.server, self.slow_server]:
+            server.shutdown()
+            server.server_close()
+
+    def test_get_balances(self):
+        result = self.client.get_balances()
+        self.assertEqual(result.errors, {})
+        self.assertEqual(result.results["binance:main"]["BTC"], {"total": D("2.0"), "available": D("1.5")})
+        self.assertNotIn("ETH", result.results["binance:main"])
+        self.assertEqual(result.results["kucoin:main"]["BTC"], {"total": D("3"), "available": D("2.5")})
+        self.assertEqual(result.results["sfox:main"], {"USD": {"total": D("50.25"), "available": D("50.25")}})
+        self.assertEqual(result.results["bitfinex:main"], {"BTC": {"total": D("3"), "available": D("3")}})
+        self.assertEqual(
+            result.merged,
+            {
+                "BTC": {"total": D("8.0"), "available": D("7.0")},
+                "USDT": {"total": D("100"), "available": D("100")},
+                "USD": {"total": D("50.25"), "available": D("50.25")},
+            },
+        )
+
+    def test_deadline(self):
+        # Bitfinex is slow to answer, the others are merged without it
+        result = self.client.get_balances(timeout=0.2)
+        self.assertLess(result.wall_time, 0.45)
+        self.assertEqual(result.timed_out, ["bitfinex:main"])
+        self.assertIsInstance(result.errors["bitfinex:main"], TimeoutError)
+        self.assertEqual(result.merged["BTC"], {"total": D("5.0"), "available": D("4.0")})
+
+    def test_hanging_venue(self):
+        # Bitfinex hangs across several queries: it's called once, and the others keep answering
+        for _ in range(3):
+            result = self.client.get_balances(timeout=0.1)
+            self.assertEqual(set(result.results), {"binance:main", "kucoin:main", "sfox:main"})
+            self.assertEqual(result.timed_out, ["bitfinex:main"])
+        self.assertIn("still busy with get_balances", str(result.errors["bitfinex:main"]))
+        self.assertEqual(len(self.slow_server.requests), 1)
+
+        # Called again once it answered
+        time.sleep(0.5)
+        self.assertEqual(self.client.get_balances().timed_out, [])
+        self.assertEqual(len(self.slow_server.requests), 2)
+
+    def test_get_trade_history(self):
+        self.client = MultiExchangeClient({"sfox:main": self.clients["sfox:main"]})
+        result = self.client.get_trade_history(since="2021-01-01")
+        self.assertEqual(len(result.merged), 1)
+        self.assertEqual(result.merged[0]["venue"], "sfox:main")
+        self.assertEqual(result.merged[0]["time"], arrow.get("2021-01-02"))
+
+    def test_get_tickers(self):
+        result = self.client.get_tickers(["BTC/USDT"])
+        self.assertEqual(set(result.merged["BTC/USDT"]), {"binance:main", "kucoin:main", "sfox:main"})
+        self.assertEqual(result.merged["BTC/USDT"]["kucoin:main"].volume, D("20"))
+        # From SFOX's order book
+        self.assertEqual(result.merged["BTC/USDT"]["sfox:main"].ask, D("2"))
+
+    def test_errors_are_per_venue(self):
+        # Tardis has no balances
+        self.client.clients["tardis"] = stub_client("tardis", "http://127.0.0.1:1", "key")
+        result = self.client.get_balances()
+        self.assertIsInstance(result.errors["tardis"], NotImplementedError)
+        self.assertEqual(len(result.results), 4)
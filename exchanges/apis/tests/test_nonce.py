@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from ..base import BaseExchangeApi
+from ..nonce import FileNonceGenerator, NonceGenerator
+
+
+def generate(path, count, queue):
+    generator = FileNonceGenerator(path)
+    queue.put([generator.next() for _ in range(count)])
+
+
+class NonceGeneratorTest(unittest.TestCase):
+    def test_monotonic_across_threads(self):
+        generator = NonceGenerator()
+        start = time.time_ns() // 100
+        with ThreadPoolExecutor(8) as executor:
+            nonces = list(executor.map(lambda _: generator.next(), range(10000)))
+        self.assertEqual(len(set(nonces)), 10000)
+        self.assertGreaterEqual(min(nonces), start)
+
+        # The clock going back doesn't make nonces go back
+        generator.last += 10**9
+        self.assertEqual(generator.next(), max(nonces) + 10**9 + 1)
+
+    def test_clients_share_the_generator(self):
+        first, second = BaseExchangeApi("key", "secret"), BaseExchangeApi("key", "secret")
+        nonces = [int(client.nonce()) for _ in range(100) for client in (first, second)]
+        self.assertEqual(nonces, sorted(set(nonces)))
+
+    def test_file_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "key.nonce")
+            queue = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=generate, args=(path, 2000, queue)) for _ in range(4)]
+            for process in processes:
+                process.start()
+            results = [queue.get(timeout=30) for _ in processes]
+            for process in processes:
+                process.join()
+
+            nonces = [nonce for result in results for nonce in result]
+            self.assertEqual(len(set(nonces)), 8000)
+            for result in results:
+                self.assertEqual(result, sorted(result))
+
+            generator = FileNonceGenerator(path)
+            self.addCleanup(generator.close)
+            self.assertGreater(generator.next(), max(nonces))
@@ -0,0 +1,105 @@
+from decimal import Decimal as D
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..orderbook import BinanceOrderBook, BitfinexOrderBook, KuCoinOrderBook, OrderBook, OrderBookGap
+
+
+class OrderBookTest(unittest.TestCase):
+    def setUp(self):
+        self.book = OrderBook("BTC/USD").load_snapshot(
+            bids=[("99", "1"), ("100", "2"), ("98", "5")], asks=[("102", "3"), ("101", "1"), ("105", "10")], sequence=10
+        )
+
+    def test_queries(self):
+        self.assertEqual(self.book.best_bid(), (D("100"), D("2")))
+        self.assertEqual(self.book.best_ask(), (D("101"), D("1")))
+        self.assertEqual(self.book.spread(), D("1"))
+        self.assertEqual(self.book.mid(), D("100.5"))
+        self.assertEqual(self.book.depth_at("102"), D("3"))
+        self.assertEqual(self.book.depth_at("99"), D("1"))
+        self.assertEqual(self.book.depth_at("103"), D("0"))
+        self.assertEqual(self.book.depth(2), ([(D(100), D(2)), (D(99), D(1))], [(D(101), D(1)), (D(102), D(3))]))
+        # 1 @ 101 + 3 @ 102
+        self.assertEqual(self.book.vwap("buy", 4), D("407") / 4)
+        self.assertEqual(self.book.vwap("sell", "2.5"), D("249.5") / D("2.5"))
+        self.assertIsNone(self.book.vwap("buy", 100))
+
+    def test_apply_diff(self):
+        self.assertTrue(self.book.apply_diff([("100", "0"), ("99.5", "4")], [("101", "0"), ("101.5", "2")], 11, 12))
+        self.assertEqual(self.book.best_bid(), (D("99.5"), D("4")))
+        self.assertEqual(self.book.best_ask(), (D("101.5"), D("2")))
+        self.assertEqual(len(self.book.bids), 3)
+        self.assertEqual(self.book.sequence, 12)
+
+        # Already applied
+        self.assertFalse(self.book.apply_diff([("1", "1")], [], 5, 12))
+        self.assertEqual(self.book.depth_at("1"), D("0"))
+        # Missed update 13
+        with self.assertRaises(OrderBookGap):
+            self.book.apply_diff([("1", "1")], [], 14, 15)
+
+    def test_binance(self):
+        client = exchange_factory("binance")()
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.binance.com/api/v3/depth?symbol=BTCUSDT&limit=1000",
+                json={"lastUpdateId": 100, "bids": [["30000.00", "1.5"]], "asks": [["30001.00", "2.0"]]},
+            )
+            book = BinanceOrderBook.fetch(client, "BTCUSDT")
+        self.assertEqual(book.best_bid(), (D("30000"), D("1.5")))
+
+        # Older than the snapshot, then the first one overlapping it
+        self.assertFalse(book.apply_update({"U": 90, "u": 100, "b": [["1", "1"]], "a": []}))
+        self.assertTrue(book.apply_update({"U": 95, "u": 105, "b": [["30000.00", "0"]], "a": [["29999.5", "1"]]}))
+        self.assertEqual(book.best_ask(), (D("29999.5"), D("1")))
+        self.assertIsNone(book.best_bid())
+        with self.assertRaises(OrderBookGap):
+            book.apply_update({"U": 107, "u": 110, "b": [], "a": []})
+
+    def test_bitfinex(self):
+        client = exchange_factory("bitfinex")()
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api-pub.bitfinex.com/v2/book/tBTCUSD/P0?len=100",
+                json=[[30000, 2, 1.5], [29990, 1, 0.5], [30010, 1, -2], [30020, 3, -1]],
+            )
+            book = BitfinexOrderBook.fetch(client, "tBTCUSD")
+        self.assertEqual(book.best_bid(), (D("30000"), D("1.5")))
+        self.assertEqual(book.best_ask(), (D("30010"), D("2")))
+
+        book.apply_update([30010, 0, -1])
+        book.apply_update([30005, 1, 0.25])
+        self.assertEqual(book.best_ask(), (D("30020"), D("1")))
+        self.assertEqual(book.best_bid(), (D("30005"), D("0.25")))
+
+        # With SEQ_ALL sequence numbers
+        book.apply_update([30005, 0, 1], sequence=7)
+        with self.assertRaises(OrderBookGap):
+            book.apply_update([30006, 1, 1], sequence=9)
+
+    def test_kucoin(self):
+        client = exchange_factory("kucoin")()
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.kucoin.com/api/v1/market/orderbook/level2_100?symbol=BTC-USDT",
+                json={"code": "200000", "data": {"sequence": "100", "bids": [["99", "1"]], "asks": [["101", "2"]]}},
+            )
+            book = KuCoinOrderBook.fetch(client, "BTC-USDT")
+        self.assertEqual(book.sequence, 100)
+
+        # Changes up to the snapshot's sequence are skipped, price 0 only moves the sequence
+        update = {
+            "sequenceStart": 99,
+            "sequenceEnd": 102,
+            "changes": {"bids": [["98", "3", "99"], ["100", "1", "101"]], "asks": [["0", "0", "102"]]},
+        }
+        self.assertTrue(book.apply_update(update))
+        self.assertEqual(book.depth_at("98"), D("0"))
+        self.assertEqual(book.best_bid(), (D("100"), D("1")))
+        self.assertEqual(book.sequence, 102)
+        with self.assertRaises(OrderBookGap):
+            book.apply_update({"sequenceStart": 104, "sequenceEnd": 104, "changes": {"bids": [], "asks": []}})
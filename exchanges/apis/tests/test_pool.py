@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from ..base import BaseExchangeApi
+from ..pool import ConnectionPoolRegistry
+from .stub_server import start_stub_server
+
+
+class PoolRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.server, self.base_url = start_stub_server()
+        self.registry = ConnectionPoolRegistry(max_hosts=2, maxsize=4)
+
+        class SharedApi(BaseExchangeApi):
+            POOL_REGISTRY = self.registry
+
+        self.api_class = SharedApi
+
+    def tearDown(self):
+        self.registry.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shared_between_clients(self):
+        one, two = self.api_class("key1", "secret1"), self.api_class("key2", "secret2")
+        self.assertEqual(one.request(self.base_url + "/ping"), [1])
+        self.assertEqual(two.request(self.base_url + "/ping"), [1])
+
+        # Different sessions, same pool
+        self.assertIsNot(one.session, two.session)
+        stats = self.registry.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["pools"], 1)
+
+        # Closing a client leaves the shared pool alone
+        one.close()
+        self.assertEqual(self.registry.stats()["pools"], 1)
+
+    def test_threads(self):
+        clients = [self.api_class(str(i), "secret") for i in range(4)]
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda i: clients[i % 4].request(self.base_url + "/ping"), range(40)))
+
+        self.assertEqual(results, [[1]] * 40)
+        stats = self.registry.stats()
+        self.assertEqual(stats["hits"] + stats["misses"], 40)
+        self.assertEqual(stats["pools"], 1)
+
+    def test_evict_idle(self):
+        self.api_class().request(self.base_url + "/ping")
+        self.assertEqual(self.registry.evict_idle(idle_timeout=3600), 0)
+        self.assertEqual(self.registry.evict_idle(idle_timeout=0), 1)
+        self.assertEqual(self.registry.stats()["pools"], 0)
+        self.assertEqual(self.registry.stats()["evictions"], 1)
+
+        # Evicted pools are rebuilt on demand
+        self.api_class().request(self.base_url + "/ping")
+        self.assertEqual(self.registry.stats()["misses"], 2)
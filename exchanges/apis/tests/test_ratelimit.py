@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import time
+import unittest
+
+import requests_mock
+
+from exchanges import exchange_factory
+
+from ..ratelimit import (
+    BinanceFuturesRateLimiter,
+    BinanceRateLimiter,
+    BitfinexRateLimiter,
+    KuCoinRateLimiter,
+    RateLimiter,
+    TokenBucket,
+)
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(10, 1)
+        self.assertEqual(bucket.reserve(10), 0)
+        # Empty, the next token comes in 1/10th of a second
+        self.assertAlmostEqual(bucket.reserve(1), 0.1, places=2)
+        # Reservations queue up behind each other
+        self.assertAlmostEqual(bucket.reserve(5), 0.6, places=2)
+
+        bucket = TokenBucket(100, 60)
+        bucket.sync(99)
+        self.assertEqual(bucket.reserve(1), 0)
+        self.assertGreater(bucket.reserve(1), 0)
+
+    def test_threads(self):
+        limiter = RateLimiter(limit=20, period=1)
+        with ThreadPoolExecutor(10) as pool:
+            waits = list(pool.map(lambda _: limiter.reserve("GET", "https://example.com"), range(40)))
+
+        # The first 20 go through, the other 20 each wait for their own slot
+        self.assertEqual(sum(1 for wait in waits if wait == 0), 20)
+        self.assertAlmostEqual(max(waits), 1.0, places=1)
+        stats = limiter.stats()
+        self.assertEqual(stats["requests"], 40)
+        self.assertEqual(stats["throttled_requests"], 20)
+        self.assertAlmostEqual(stats["throttled_seconds"], sum(waits))
+
+    def test_binance_weights(self):
+        limiter = BinanceRateLimiter()
+        url = "https://api.binance.com/api/v3/"
+        self.assertEqual(limiter.weight("GET", url + "depth", {"symbol": "ETHUSDT", "limit": 1000}), 50)
+        self.assertEqual(limiter.weight("GET", url + "ticker/price", {"symbol": "ETHUSDT"}), 2)
+        self.assertEqual(limiter.weight("GET", url + "ticker/price", None), 4)
+        self.assertEqual(limiter.weight("GET", url + "openOrders", "timestamp=1&signature=abc"), 80)
+        self.assertEqual(limiter.weight("GET", url + "order", {"symbol": "ETHUSDT"}), 4)
+        self.assertEqual(limiter.weight("POST", url + "order", {"symbol": "ETHUSDT"}), 1)
+        self.assertEqual(limiter.weight("GET", url + "ping", None), 1)
+        futures = BinanceFuturesRateLimiter()
+        self.assertEqual(futures.limit, 2400)
+        self.assertEqual(futures.weight("GET", "https://api.binance.com/fapi/v1/depth", {"limit": 1000}), 20)
+
+    def test_binance_used_weight(self):
+        client = exchange_factory("binance")("key", "secret")
+        client.rate_limiter = BinanceRateLimiter()
+        with requests_mock.mock() as m:
+            m.get(requests_mock.ANY, text="{}", headers={"X-MBX-USED-WEIGHT-1M": "5990"})
+            client.brequest(3, "ping")
+            # Another process used up most of our weight, so a weight 20 call has to wait
+            self.assertGreater(client.rate_limiter.reserve("GET", client.BASE_URL + "/api/v3/exchangeInfo"), 0)
+
+    def test_sign_after_wait(self):
+        client = exchange_factory("binance")("key", "secret")
+        client.rate_limiter = mock.Mock()
+        client.rate_limiter.acquire.side_effect = lambda *args: time.sleep(0.05)
+        with requests_mock.mock() as m:
+            m.get(requests_mock.ANY, text="{}")
+            before = time.time() * 1000
+            client.brequest(3, "account", authenticate=True)
+            timestamp = int(m.last_request.qs["timestamp"][0])
+        self.assertGreaterEqual(timestamp, before + 50)
+        client.rate_limiter.acquire.assert_called_once_with("GET", "https://api.binance.com/api/v3/account", None)
+
+    def test_bitfinex(self):
+        limiter = BitfinexRateLimiter()
+        limiter.reserve("GET", "https://api-pub.bitfinex.com/v2/tickers")
+        limiter.reserve("GET", "https://api-pub.bitfinex.com/v2/book/tBTCUSD/P0")
+        limiter.reserve("POST", "https://api.bitfinex.com/v2/auth/r/wallets")
+        buckets = limiter._buckets
+        self.assertEqual(buckets["^tickers?"].capacity, 30)
+        self.assertEqual(buckets["^book/"].capacity, 90)
+        self.assertEqual(buckets["auth/r/wallets"].capacity, 90)
+
+    def test_kucoin(self):
+        limiter = KuCoinRateLimiter()
+        url = "https://api.kucoin.com/api/v1/"
+        self.assertEqual(limiter.pool("GET", url + "market/allTickers"), ("public", 15))
+        self.assertEqual(limiter.pool("GET", url + "accounts"), ("management", 5))
+        self.assertEqual(limiter.pool("DELETE", url + "orders"), ("spot", 3))
+
+        client = exchange_factory("kucoin")("passphrase", "key", "secret")
+        client.rate_limiter = limiter
+        with requests_mock.mock() as m:
+            headers = {"gw-ratelimit-limit": "2000", "gw-ratelimit-remaining": "0", "gw-ratelimit-reset": "1000"}
+            m.get(requests_mock.ANY, text="{}", headers=headers)
+            client.brequest(1, "market/allTickers")
+        self.assertGreater(limiter.reserve("GET", url + "symbols"), 0)
+        self.assertEqual(limiter.reserve("GET", url + "fills"), 0)
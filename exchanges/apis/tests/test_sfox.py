@@ -1,9 +1,13 @@
+from decimal import Decimal as D
 import unittest
 
+import arrow
 import requests_mock
 
 from exchanges import exchange_factory
 
+from ..marketdata import Candle, OrderBookSnapshot, Ticker
+
 
 class SFOXTest(unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -16,6 +20,10 @@ class SFOXTest(unittest.TestCase):
         self.assertEqual("ETH/USD", self.client.unmake_symbol("ethusd"))
         self.assertEqual("ethusd", self.client.make_symbol("ETH/USD"))
 
+    def test_batch_symbols(self):
+        self.assertEqual(self.client.make_symbols(["ETH/USD", "BTC/USD"]), ["ethusd", "btcusd"])
+        self.assertEqual(self.client.unmake_symbols(["ethusd", "btcusd"]), ["ETH/USD", "BTC/USD"])
+
     def test_auth_v3(self):
         with requests_mock.mock() as m:
             m.post(
@@ -33,3 +41,106 @@ class SFOXTest(unittest.TestCase):
         with requests_mock.mock() as m:
             m.get("https://api.sfox.com/v1/everything_else", text='{"noop": true}')
             self.client.brequest(1, endpoint="everything_else", method="GET")
+
+    def test_iter_trade_history(self):
+        txns = [
+            {"id": 3, "day": "2021-01-03T00:00:00.000Z", "action": "Deposit", "currency": "usd", "amount": 1000},
+            {"id": 2, "day": "2021-01-02T00:00:00.000Z", "action": "Sell", "currency": "btc", "amount": -0.5},
+            {"id": 1, "day": "2021-01-01T00:00:00.000Z", "action": "Buy", "currency": "btc", "amount": 1},
+        ]
+        for txn in txns[1:]:
+            txn.update({"client_order_id": "c%s" % txn["id"], "price": 30000, "fees": 7.5})
+
+        def transactions(request, context):
+            offset, limit = int(request.qs["offset"][0]), int(request.qs["limit"][0])
+            return txns[offset:][:limit]
+
+        self.client.TRADES_PAGE_SIZE = 2
+        with requests_mock.mock() as m:
+            m.get("https://api.sfox.com/v1/account/transactions", json=transactions)
+            history = list(self.client.iter_trade_history(since="2021-01-01", until="2021-02-01"))
+            self.assertEqual([t["exchange_txn_id"] for t in history], ["2", "1"])
+            self.assertEqual([r.qs["offset"] for r in m.request_history], [["0"], ["2"]])
+            self.assertEqual(m.request_history[0].qs["from"], ["1609459200000"])
+            self.assertEqual(m.request_history[0].headers["Authorization"], "Bearer key")
+
+            self.assertEqual(history[0]["action"], "sell")
+            self.assertEqual(history[1]["client_order_id"], "c1")
+            self.assertEqual(history[1]["trade_curr"], "BTC")
+            self.assertEqual(history[1]["price"], D("30000"))
+
+            self.assertEqual(self.client.get_trade_history(), history)
+
+    def test_market_data(self):
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.sfox.com/v1/markets/orderbook/btcusd",
+                json={
+                    "pair": "btcusd",
+                    "bids": [[30000.5, 1.5, "market1"], [30000, 2, "market2"]],
+                    "asks": [[30001, 0.5, "market1"]],
+                    "lastupdated": 1609459200000,
+                },
+            )
+            book = self.client.get_order_book("BTC/USD", depth=1)
+            self.assertEqual(
+                book,
+                OrderBookSnapshot("BTC/USD", [(D("30000.5"), D("1.5"))], [(D("30001"), D("0.5"))], None, 1609459200000),
+            )
+            self.assertEqual(m.last_request.headers["Authorization"], "Bearer key")
+
+            m.get(
+                "https://chartdata.sfox.com/candlesticks",
+                json=[
+                    {
+                        "start_time": 1609459200 + i * 60,
+                        "open_price": "1",
+                        "high_price": "3",
+                        "low_price": "0.5",
+                        "close_price": "2",
+                        "volume": "10",
+                    }
+                    for i in range(3)
+                ],
+            )
+            candles = self.client.get_candles("BTC/USD", "1m", start="2021-01-01T00:00", end="2021-01-01T00:02")
+            self.assertEqual(
+                m.last_request.qs,
+                {"pair": ["btcusd"], "period": ["60"], "starttime": ["1609459200"], "endtime": ["1609459319"]},
+            )
+            self.assertEqual([candle.time for candle in candles], [1609459200000, 1609459260000])
+            self.assertEqual(candles[0], Candle(1609459200000, D("1"), D("3"), D("0.5"), D("2"), D("10")))
+
+    def test_tickers(self):
+        now = arrow.utcnow().int_timestamp
+        with requests_mock.mock() as m:
+            m.get(
+                "https://api.sfox.com/v1/markets/currency-pairs",
+                json={"btcusd": {"formatted_symbol": "BTC/USD", "symbol": "btcusd", "base": "btc", "quote": "usd"}},
+            )
+            m.get(
+                "https://api.sfox.com/v1/markets/orderbook/btcusd",
+                json={"bids": [[30000.5, 1.5, "market1"]], "asks": [[30001, 0.5, "market1"]], "lastupdated": 5},
+            )
+            m.get(
+                "https://chartdata.sfox.com/candlesticks",
+                json=[
+                    {
+                        "start_time": now - 3600 * (2 - i),
+                        "open_price": "1",
+                        "high_price": "3",
+                        "low_price": "0.5",
+                        "close_price": str(29990 + i),
+                        "volume": "10",
+                    }
+                    for i in range(2)
+                ],
+            )
+            ticker = Ticker("BTC/USD", D("30000.5"), D("30001"), D("29991"), D("20"), 5)
+            self.assertEqual(self.client.get_tickers(), {"BTC/USD": ticker})
+            self.assertEqual(m.last_request.qs["period"], ["3600"])
+            self.assertEqual(self.client.get_ticker("BTC/USD"), ticker)
+
+            # No trades in the last day
+            m.get("https://chartdata.sfox.com/candlesticks", json=[])
+            self.assertEqual(self.client.get_ticker("BTC/USD"), ticker._replace(last=None, volume=None))
@@ -21,3 +21,17 @@ class ShrimpyTest(unittest.TestCase):
                 1, endpoint="users/555/accounts/666/balance", authenticate=True, method="POST"
             )
             self.assertEqual(result, {"balances": [{"asset": "BTC", "free": "0.10730199", "locked": "0.00000000"}]})
+
+    def test_auth_not_shared(self):
+        with requests_mock.mock() as m:
+            m.get(requests_mock.ANY, text="{}")
+            calls = {
+                "public": dict(api_version=1, endpoint="list_exchanges"),
+                "private": dict(api_version=1, endpoint="users", authenticate=True),
+            }
+            self.client.fan_out(calls)
+            headers = {request.path: request.headers for request in m.request_history}
+        # fan_out threads share the client, so each call signs with its own provider
+        self.assertIsNone(self.client.auth_provider)
+        self.assertNotIn("SHRIMPY-API-KEY", headers["/v1/list_exchanges"])
+        self.assertEqual(headers["/v1/users"]["SHRIMPY-API-KEY"], "key")
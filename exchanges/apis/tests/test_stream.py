@@ -0,0 +1,233 @@
+import asyncio
+import json
+import unittest
+
+import websockets
+
+from ..base import ExchangeApiException
+from ..stream import BinanceStream, BitfinexStream
+from .stub_server import start_stub_server
+from .test_aio import stub_client
+
+
+class WebsocketStub:
+    """Local websocket server running `session(stub, ws, connection number)` for each connection"""
+
+    def __init__(self, session):
+        self.session = session
+        self.received = []
+        self.connections = 0
+
+    async def handler(self, ws):
+        self.connections += 1
+        await self.session(self, ws, self.connections)
+
+    async def recv(self, ws):
+        message = json.loads(await ws.recv())
+        self.received.append(message)
+        return message
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handler, "127.0.0.1", 0)
+        self.url = "ws://127.0.0.1:%s" % self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class BitfinexStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.client = stub_client("bitfinex", "http://127.0.0.1:1", "key", "secret")
+
+    def test_authenticated_stream_resubscribes(self):
+        async def session(stub, ws, number):
+            auth = await stub.recv(ws)
+            await ws.send(json.dumps({"event": "auth", "status": "OK", "chanId": 0}))
+            subscribe = await stub.recv(ws)
+            chan_id = 10 + number
+            await ws.send(json.dumps({**subscribe, "event": "subscribed", "chanId": chan_id}))
+            await ws.send(json.dumps([chan_id, "hb"]))
+            await ws.send(json.dumps([chan_id, [number, 2, 3]]))
+            if number == 1:
+                await ws.send(json.dumps([0, "te", [1, "tBTCUSD"]]))
+                # Maintenance: the client has to reconnect
+                await ws.send(json.dumps({"event": "info", "code": 20051}))
+            await ws.wait_closed()
+            self.assertEqual(auth["apiKey"], "key")
+            self.assertEqual(auth["authSig"], self.client.sign("secret", auth["authPayload"]))
+
+        async def run():
+            async with WebsocketStub(session) as stub:
+                stream = BitfinexStream(self.client, url=stub.url, authenticate=True)
+                stream.RECONNECT_DELAY = 0
+                messages = []
+                async with stream:
+                    await stream.subscribe(channel="ticker", symbol="tBTCUSD")
+                    async for message in stream:
+                        messages.append(message)
+                        if len(messages) == 3:
+                            break
+                return stub, stream, messages
+
+        stub, stream, messages = asyncio.run(asyncio.wait_for(run(), 10))
+        ticker = {"channel": "ticker", "symbol": "tBTCUSD"}
+        self.assertEqual(
+            messages, [(ticker, [1, 2, 3]), ({"channel": "auth"}, ["te", [1, "tBTCUSD"]]), (ticker, [2, 2, 3])]
+        )
+        self.assertEqual(stream.connections, 2)
+        self.assertEqual([m["event"] for m in stub.received], ["auth", "subscribe", "auth", "subscribe"])
+
+    def test_failed_authentication(self):
+        async def session(stub, ws, number):
+            await ws.recv()
+            await ws.send(json.dumps({"event": "auth", "status": "FAILED", "msg": "apikey: invalid"}))
+            await ws.wait_closed()
+
+        async def run():
+            async with WebsocketStub(session) as stub:
+                async with BitfinexStream(self.client, url=stub.url, authenticate=True) as stream:
+                    async for _ in stream:
+                        pass
+
+        with self.assertRaises(ExchangeApiException) as context:
+            asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(context.exception.message, "apikey: invalid")
+
+    def test_bad_messages_are_skipped(self):
+        async def session(stub, ws, number):
+            subscribe = await stub.recv(ws)
+            await ws.send(json.dumps({**subscribe, "event": "subscribed", "chanId": 5}))
+            await ws.send("{not json")
+            # Empty payload, handle() can't index it
+            await ws.send(json.dumps([5]))
+            await ws.send(json.dumps([5, [1]]))
+            await ws.send(json.dumps([5, [2]]))
+            await ws.wait_closed()
+
+        delivered = []
+
+        def callback(channel, data):
+            delivered.append(data)
+            if data == [1]:
+                raise ValueError("callback bug")
+            asyncio.ensure_future(stream.close())
+
+        async def run():
+            nonlocal stream
+            async with WebsocketStub(session) as stub:
+                stream = BitfinexStream(url=stub.url, callback=callback)
+                await stream.subscribe(channel="ticker", symbol="tBTCUSD")
+                await stream.run()
+
+        stream = None
+        asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(delivered, [[1], [2]])
+        self.assertEqual(stream.connections, 1)
+        self.assertIsNone(stream.error)
+
+    def test_unexpected_error_ends_iteration(self):
+        class BrokenStream(BitfinexStream):
+            async def on_connect(self):
+                raise KeyError("chanId")
+
+        async def session(stub, ws, number):
+            await ws.wait_closed()
+
+        async def run():
+            async with WebsocketStub(session) as stub:
+                async with BrokenStream(url=stub.url) as stream:
+                    async for _ in stream:
+                        pass
+
+        # Raised to the consumer instead of leaving it waiting forever
+        with self.assertRaises(KeyError):
+            asyncio.run(asyncio.wait_for(run(), 10))
+
+
+class BinanceStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.server, base_url = start_stub_server(routes={"/api/v3/userDataStream": (200, '{"listenKey": "abc"}')})
+        self.client = stub_client("binance", base_url, "key", "secret")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_user_data_and_callback(self):
+        async def session(stub, ws, number):
+            await stub.recv(ws)
+            await ws.send(json.dumps({"result": None, "id": 1}))
+            await ws.send(json.dumps({"stream": "btcusdt@trade", "data": {"e": "trade", "p": "30000"}}))
+            await ws.send(json.dumps({"stream": "abc", "data": {"e": "executionReport"}}))
+            await ws.wait_closed()
+
+        messages = []
+
+        async def callback(channel, data):
+            messages.append((channel, data))
+            if len(messages) == 2:
+                await stream.close()
+
+        async def run():
+            nonlocal stream
+            async with WebsocketStub(session) as stub:
+                stream = BinanceStream(self.client, url=stub.url, callback=callback, user_data=True)
+                await stream.subscribe(stream="btcusdt@trade")
+                await stream.run()
+                return stub
+
+        stream = None
+        stub = asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(stub.received, [{"method": "SUBSCRIBE", "params": ["btcusdt@trade", "abc"], "id": 1}])
+        self.assertEqual(
+            messages,
+            [
+                ({"stream": "btcusdt@trade"}, {"e": "trade", "p": "30000"}),
+                ({"stream": "user"}, {"e": "executionReport"}),
+            ],
+        )
+        method, path, headers, _ = self.server.requests[0]
+        self.assertEqual((method, path), ("POST", "/api/v3/userDataStream"))
+        self.assertEqual(headers["X-MBX-APIKEY"], "key")
+
+    def test_listen_key_errors_reconnect(self):
+        listen_key = (200, '{"listenKey": "abc"}')
+        # Creation fails on the first connection, the keep alive on the second
+        self.server.routes["/api/v3/userDataStream"] = [
+            (500, '{"code": -1001, "msg": "Internal error"}'),
+            listen_key,
+            (400, '{"code": -1125, "msg": "This listenKey does not exist."}'),
+            listen_key,
+        ]
+
+        async def session(stub, ws, number):
+            try:
+                await stub.recv(ws)
+                await ws.send(json.dumps({"stream": "abc", "data": {"e": "event", "n": number}}))
+                await ws.wait_closed()
+            except websockets.ConnectionClosed:
+                pass
+
+        messages = []
+
+        async def callback(channel, data):
+            messages.append(data["n"])
+            if data["n"] == 3:
+                await stream.close()
+
+        async def run():
+            nonlocal stream
+            async with WebsocketStub(session) as stub:
+                stream = BinanceStream(self.client, url=stub.url, callback=callback, user_data=True)
+                stream.RECONNECT_DELAY = 0
+                stream.KEEPALIVE_INTERVAL = 0.2
+                await stream.run()
+
+        stream = None
+        asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(messages, [2, 3])
+        self.assertEqual(stream.connections, 3)
+        self.assertIsNone(stream.error)
+        self.assertEqual([r[0] for r in self.server.requests[:4]], ["POST", "POST", "PUT", "POST"])
@@ -1,8 +1,15 @@
+from datetime import date
+from unittest import mock
+import io
+import json
+import os
+import tempfile
 import unittest
 
 import requests_mock
 
 from exchanges import exchange_factory
+from exchanges.apis.base import ExchangeApiException
 
 
 class TardisTest(unittest.TestCase):
@@ -21,3 +28,121 @@ class TardisTest(unittest.TestCase):
             )
             self.assertEqual(result["data"]["stats"]["openInterest"], 11206.9761)
             self.assertEqual(result["data"]["info"]["underlying"], "BTC")
+
+
+class CountingBody(io.BytesIO):
+    """Response body that counts how many bytes were read from it"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.bytes_read = 0
+
+    def read(self, *args):
+        chunk = super().read(*args)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class TardisStreamTest(unittest.TestCase):
+    URL = "https://api.tardis.dev/v1/data-feeds/ftx"
+
+    def setUp(self):
+        self.client = exchange_factory("tardis")("key", "secret")
+        self.client.STREAM_CHUNK_SIZE = 1024
+
+    def body(self, count):
+        record = {"data": {"stats": {"openInterest": 1}, "info": {"underlying": "BTC"}}}
+        lines = []
+        for i in range(count):
+            timestamp = "2020-06-01T00:00:%02d.0000000Z" % (i % 60)
+            lines.append("%s %s" % (timestamp, json.dumps({**record, "id": i})))
+        return CountingBody("\n".join(lines).encode() + b"\n")
+
+    def test_parse_response_reads_first_record_only(self):
+        body = self.body(10000)
+        with requests_mock.mock() as m:
+            m.get(self.URL, body=body)
+            result = self.client.first_record(1, "data-feeds/ftx")
+        self.assertEqual(result["id"], 0)
+        self.assertEqual(result["result"], {"openInterest": 1, "underlying": "BTC"})
+        self.assertLessEqual(body.bytes_read, 2 * self.client.STREAM_CHUNK_SIZE)
+
+    def test_stream_brequest_yields_lazily(self):
+        body = self.body(10000)
+        size = len(body.getvalue())
+        with requests_mock.mock() as m:
+            m.get(self.URL, body=body)
+            records = self.client.stream_brequest(1, "data-feeds/ftx")
+            timestamp, payload = next(records)
+            self.assertEqual(timestamp, "2020-06-01T00:00:00.0000000Z")
+            self.assertEqual(payload["id"], 0)
+            self.assertLess(body.bytes_read, size // 10)
+
+            self.assertEqual([payload["id"] for _, payload in records], list(range(1, 10000)))
+            self.assertEqual(body.bytes_read, size)
+
+    def test_parse_response_without_records(self):
+        with requests_mock.mock() as m:
+            m.get(self.URL, body=CountingBody(b""))
+            with self.assertRaises(ExchangeApiException):
+                self.client.first_record(1, "data-feeds/ftx")
+
+
+class TardisReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(os.environ, {"EXCHANGES_CACHE_DIR": self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.client = exchange_factory("tardis")("key", "secret")
+
+    def feed(self, request, context):
+        # Two records per symbol and minute, interleaved in time across symbols
+        symbol = json.loads(request.qs["filters"][0])[0]["symbols"][0].upper()
+        day, minute = request.qs["from"][0], int(request.qs["offset"][0])
+        offset = 0 if symbol == "BTC-PERP" else 1
+        lines = []
+        for second in (offset, offset + 2):
+            record = json.dumps({"market": symbol, "m": minute, "s": second})
+            lines.append("%sT%02d:%02d:%02d.0000000Z %s" % (day, minute // 60, minute % 60, second, record))
+        return "\n".join(lines) + "\n"
+
+    def test_replay_merges_symbols_in_timestamp_order(self):
+        self.client.SLICE_MINUTES = 1
+        with requests_mock.mock() as m:
+            m.get("https://api.tardis.dev/v1/data-feeds/ftx", text=self.feed)
+            records = list(self.client.replay("ftx", "trades", ["BTC-PERP", "ETH-PERP"], "2020-06-01", "2020-06-03"))
+            self.assertEqual(m.call_count, 4)
+
+            timestamps = [timestamp for timestamp, _, _ in records]
+            self.assertEqual(len(records), 8)
+            self.assertEqual(timestamps, sorted(timestamps))
+            self.assertEqual([symbol for _, symbol, _ in records[:4]], ["BTC-PERP", "ETH-PERP", "BTC-PERP", "ETH-PERP"])
+            self.assertEqual(records[0][2], {"market": "BTC-PERP", "m": 0, "s": 0})
+            self.assertEqual(records[-1][0], "2020-06-02T00:00:03.0000000Z")
+
+            # Cached slices are never downloaded again
+            again = list(self.client.replay("ftx", "trades", ["BTC-PERP", "ETH-PERP"], "2020-06-01", "2020-06-03"))
+            self.assertEqual(again, records)
+            self.assertEqual(m.call_count, 4)
+
+    def test_slice_is_a_whole_day(self):
+        with requests_mock.mock() as m:
+            m.get("https://api.tardis.dev/v1/data-feeds/ftx", text=self.feed)
+            records = list(
+                self.client.read_slice(self.client.fetch_slice("ftx", "trades", "BTC-PERP", date(2020, 6, 1)))
+            )
+            self.assertEqual([int(r.qs["offset"][0]) for r in m.request_history], list(range(24 * 60)))
+            self.assertTrue(all(r.qs["from"] == ["2020-06-01"] and "to" not in r.qs for r in m.request_history))
+        self.assertEqual(len(records), 2 * 24 * 60)
+        self.assertEqual(records[-1][1], {"market": "BTC-PERP", "m": 1439, "s": 2})
+
+    def test_failed_download_is_not_cached(self):
+        path = self.client.replay_slice_path("ftx", "trades", "BTC-PERP", date(2020, 6, 1))
+        with requests_mock.mock() as m:
+            m.get("https://api.tardis.dev/v1/data-feeds/ftx", status_code=500, text="error")
+            with self.assertRaises(ExchangeApiException):
+                list(self.client.replay("ftx", "trades", ["BTC-PERP"], "2020-06-01", "2020-06-02"))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(os.listdir(self.tmp.name), [])
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from decimal import Decimal as D
+from functools import partial
+import threading
+import time
+
+from loguru import logger
+
+from .apis.fanout import FanOutResult, timed_call
+
+
+class MultiExchangeResult(FanOutResult):
+    """FanOutResult keyed by venue, with the venues' answers merged into one view (`merged`), and the venues that
+    missed the deadline (`timed_out`, also in `errors`)"""
+
+    def __init__(self):
+        super().__init__()
+        self.merged = None
+        self.timed_out = []
+
+
+class MultiExchangeClient:
+    """Clients for several exchanges and accounts, queried all at once.
+
+    clients: {venue: client}, where venue names the exchange and account, ie. {"binance:main": BinanceApi(...)}
+    timeout: seconds to wait for the venues before returning what's there. A venue that's late (ie. Bitfinex in
+        maintenance) ends up in `timed_out`, and is left to finish in the background
+    """
+
+    def __init__(self, clients, timeout=10):
+        self.clients = dict(clients)
+        self.timeout = timeout
+        # A worker per venue, so a venue that hangs only holds up its own calls
+        self.executors = {}
+        self.running = {}  # venue -> (method, future) of its last call
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_accounts(cls, accounts, **kwargs):
+        """accounts: {venue: (exchange, *client args)}, ie. {"bitfinex:main": ("bitfinex", key, secret)}"""
+        from . import exchange_factory
+
+        clients = {venue: exchange_factory(exchange)(*args) for venue, (exchange, *args) in accounts.items()}
+        return cls(clients, **kwargs)
+
+    def submit(self, venue, method, call, kwargs):
+        """Future of the call on the venue's worker, or None if the venue is still busy with an earlier call. Call
+        with the lock held"""
+        running = self.running.get(venue)
+        if running is not None and not running[1].done():
+            return None
+        executor = self.executors.get(venue)
+        if executor is None:
+            executor = self.executors[venue] = ThreadPoolExecutor(1, thread_name_prefix=f"multi-exchange-{venue}")
+        future = executor.submit(timed_call, call, kwargs)
+        self.running[venue] = (method, future)
+        return future
+
+    def query(self, method, *args, timeout=None, **kwargs):
+        """Call client.method(*args, **kwargs) on every venue at once. Returns a MultiExchangeResult once they all
+        answered, or once `timeout` seconds have passed. A venue still busy with a call that missed an earlier
+        deadline isn't called again, and is reported as timed out"""
+        timeout = self.timeout if timeout is None else timeout
+        result = MultiExchangeResult()
+        start = time.perf_counter()
+        with self.lock:
+            futures = {
+                venue: self.submit(venue, method, partial(getattr(client, method), *args), kwargs)
+                for venue, client in self.clients.items()
+            }
+        wait([future for future in futures.values() if future is not None], timeout=timeout)
+        for venue, future in futures.items():
+            if future is not None and future.done():
+                result.add(venue, *future.result())
+                continue
+            if future is None:
+                message = f"{venue} is still busy with {self.running[venue][0]} since an earlier query"
+            else:
+                message = f"{venue} {method} did not answer within {timeout}s"
+            logger.warning(message)
+            result.timed_out.append(venue)
+            result.errors[venue] = TimeoutError(message)
+        result.wall_time = time.perf_counter() - start
+        return result
+
+    def get_balances(self, timeout=None):
+        """get_balances() of every venue, merged into the totals per currency"""
+        result = self.query("get_balances", timeout=timeout)
+        merged = {}
+        for balances in result.results.values():
+            for currency, balance in balances.items():
+                total = merged.setdefault(currency, {"total": D(0), "available": D(0)})
+                total["total"] += balance["total"]
+                total["available"] += balance["available"]
+        result.merged = merged
+        return result
+
+    def get_trade_history(self, since=None, until=None, timeout=None):
+        """get_trade_history() of every venue, merged into one list by time, with a "venue" key on each record"""
+        result = self.query("get_trade_history", since=since, until=until, timeout=timeout)
+        merged = [{**record, "venue": venue} for venue, records in result.results.items() for record in records]
+        result.merged = sorted(merged, key=lambda record: record["time"])
+        return result
+
+    def get_tickers(self, symbols=None, timeout=None):
+        """get_tickers() of every venue, merged into {pair: {venue: Ticker}}"""
+        result = self.query("get_tickers", symbols, timeout=timeout)
+        merged = {}
+        for venue, tickers in result.results.items():
+            for pair, ticker in tickers.items():
+                merged.setdefault(pair, {})[venue] = ticker
+        result.merged = merged
+        return result
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+        for client in self.clients.values():
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -8,5 +8,6 @@ setup(
     description="Cryptocurrency Exchange APIs",
     python_requires=">=3.7",
     packages=find_packages(),
-    install_requires=["arrow", "cachetools", "loguru", "requests", "ujson"],
+    install_requires=["arrow", "cachetools", "loguru", "requests", "sortedcontainers", "ujson"],
+    extras_require={"async": ["aiohttp"], "stream": ["websockets"], "orjson": ["orjson"]},
 )